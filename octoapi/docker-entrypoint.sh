@@ -22,4 +22,9 @@ poetry run python src/manage.py load_dummy_data
 
 # Start server
 echo "Starting server..."
-poetry run python src/manage.py runserver 0.0.0.0:8000 
\ No newline at end of file
+if [ "$OCTOAPI_ASGI" = "True" ]; then
+    # Serves /search/async/ without a thread per request
+    poetry run uvicorn core.asgi:application --app-dir src --host 0.0.0.0 --port 8000
+else
+    poetry run python src/manage.py runserver 0.0.0.0:8000
+fi 
\ No newline at end of file
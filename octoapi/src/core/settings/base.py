@@ -101,11 +101,20 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "search.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_THROTTLE_CLASSES": [
         "search.throttles.SearchUserRateThrottle",
         "search.throttles.SearchAnonRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"search_user": "1000/day", "search_anon": "100/day"},
+    "DEFAULT_THROTTLE_RATES": {
+        "search_user": os.getenv("SEARCH_USER_THROTTLE_RATE", "1000/day"),
+        "search_anon": os.getenv("SEARCH_ANON_THROTTLE_RATE", "100/day"),
+        # Budget of estimated query cost, a term lookup costs 1
+        "search_cost": os.getenv("SEARCH_COST_THROTTLE_RATE", "2000/hour"),
+    },
     "DEFAULT_PAGINATION_CLASS": "search.pagination.SearchPagination",
     "PAGE_SIZE": 20,
 }
@@ -118,9 +127,55 @@ CACHES = {
     }
 }
 
+# Throttle counters must live in a cache shared by all workers (Redis in
+# production) for rate limits to hold across processes and nodes
+SEARCH_THROTTLE_CACHE_ALIAS = os.getenv("SEARCH_THROTTLE_CACHE_ALIAS", "default")
+
 # Cache time to live is 5 minutes
 CACHE_TTL = 60 * 5
 
+# In-process cache of users resolved from authentication tokens; unknown
+# tokens are remembered for the shorter negative TTL
+AUTH_PRINCIPAL_CACHE_MAX_ENTRIES = int(
+    os.getenv("AUTH_PRINCIPAL_CACHE_MAX_ENTRIES", "10000")
+)
+AUTH_PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))
+AUTH_PRINCIPAL_CACHE_NEGATIVE_TTL = int(
+    os.getenv("AUTH_PRINCIPAL_CACHE_NEGATIVE_TTL", "5")
+)
+
+# Search result cache: in-process LRU (L1) in front of the cache backend (L2)
+SEARCH_RESULT_CACHE_MAX_ENTRIES = int(
+    os.getenv("SEARCH_RESULT_CACHE_MAX_ENTRIES", "1000")
+)
+SEARCH_RESULT_CACHE_L1_TTL = int(os.getenv("SEARCH_RESULT_CACHE_L1_TTL", "30"))
+SEARCH_RESULT_CACHE_TTL = int(os.getenv("SEARCH_RESULT_CACHE_TTL", str(CACHE_TTL)))
+# Rendered /search/ responses, also advertised as Cache-Control max-age
+SEARCH_RESPONSE_CACHE_TTL = int(os.getenv("SEARCH_RESPONSE_CACHE_TTL", str(CACHE_TTL)))
+# Failed conversions are remembered briefly so that the cost throttle and the
+# search it prices do not both ask the converter about the same bad query
+SEARCH_CONVERSION_FAILURE_TTL = int(os.getenv("SEARCH_CONVERSION_FAILURE_TTL", "10"))
+
+# Background fetch of the next page window into the result cache after a
+# /search/ page is served, at most SEARCH_PREFETCH_RATE per second (bursts of
+# SEARCH_PREFETCH_BURST) and never while the in-process result cache is more
+# than SEARCH_PREFETCH_MAX_CACHE_FILL full
+SEARCH_PREFETCH_ENABLED = (
+    os.getenv("SEARCH_PREFETCH_ENABLED", "False").lower() == "true"
+)
+SEARCH_PREFETCH_RATE = float(os.getenv("SEARCH_PREFETCH_RATE", "5"))
+SEARCH_PREFETCH_BURST = int(os.getenv("SEARCH_PREFETCH_BURST", "10"))
+SEARCH_PREFETCH_MAX_WORKERS = int(os.getenv("SEARCH_PREFETCH_MAX_WORKERS", "2"))
+SEARCH_PREFETCH_MAX_CACHE_FILL = float(
+    os.getenv("SEARCH_PREFETCH_MAX_CACHE_FILL", "0.9")
+)
+
+# Coalescing of identical concurrent searches across threads and workers
+SEARCH_SINGLE_FLIGHT_LOCK_TIMEOUT = int(
+    os.getenv("SEARCH_SINGLE_FLIGHT_LOCK_TIMEOUT", "10")
+)
+SEARCH_SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SEARCH_SINGLE_FLIGHT_RESULT_TTL", "5"))
+
 # Logging settings
 LOGGING = {
     "version": 1,
@@ -156,11 +211,60 @@ LOGGING = {
 # Elasticsearch settings
 ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "http://localhost:9200")
 ELASTICSEARCH_INDEX = os.getenv("ELASTICSEARCH_INDEX", "octoxlabsdata")
+# Index mapping of the searchable fields, shared with the query converter; when
+# empty the fields are read from the mapping of ELASTICSEARCH_INDEX at startup
+SEARCH_FIELDS_FILE = os.getenv(
+    "SEARCH_FIELDS_FILE", str(BASE_DIR.parent.parent / "search_fields.json")
+)
+# Connection pool shared by every request in a process
+ELASTICSEARCH_CONNECTIONS_PER_NODE = int(
+    os.getenv("ELASTICSEARCH_CONNECTIONS_PER_NODE", "10")
+)
+ELASTICSEARCH_HTTP_KEEP_ALIVE = (
+    os.getenv("ELASTICSEARCH_HTTP_KEEP_ALIVE", "True").lower() == "true"
+)
+# Per-request timeout in seconds
+ELASTICSEARCH_REQUEST_TIMEOUT = float(os.getenv("ELASTICSEARCH_REQUEST_TIMEOUT", "10"))
+ELASTICSEARCH_MAX_RETRIES = int(os.getenv("ELASTICSEARCH_MAX_RETRIES", "2"))
+# How long a point-in-time used by cursor pagination stays open between pages
+ELASTICSEARCH_PIT_KEEP_ALIVE = os.getenv("ELASTICSEARCH_PIT_KEEP_ALIVE", "2m")
+# Documents fetched per Elasticsearch round trip by /search/export/
+SEARCH_EXPORT_BATCH_SIZE = int(os.getenv("SEARCH_EXPORT_BATCH_SIZE", "1000"))
 
 # Query converter service settings
 QUERY_CONVERTER_SERVICE_URL = os.getenv(
     "QUERY_CONVERTER_SERVICE_URL", "http://localhost:8001/convert"
 )
+# "remote" calls the query converter service over HTTP, "embedded" runs its
+# conversion logic in-process from QUERY_CONVERTER_SOURCE_DIR
+QUERY_CONVERTER_MODE = os.getenv("QUERY_CONVERTER_MODE", "remote")
+QUERY_CONVERTER_SOURCE_DIR = os.getenv(
+    "QUERY_CONVERTER_SOURCE_DIR",
+    str(BASE_DIR.parent.parent / "query_converter" / "src"),
+)
+# Connect and read timeouts of converter calls, in seconds
+QUERY_CONVERTER_CONNECT_TIMEOUT = float(
+    os.getenv("QUERY_CONVERTER_CONNECT_TIMEOUT", "0.5")
+)
+QUERY_CONVERTER_READ_TIMEOUT = float(os.getenv("QUERY_CONVERTER_READ_TIMEOUT", "2"))
+# Keep-alive connections kept open to the converter
+QUERY_CONVERTER_POOL_SIZE = int(os.getenv("QUERY_CONVERTER_POOL_SIZE", "10"))
+# Consecutive failures that open the circuit, and seconds before a trial call
+QUERY_CONVERTER_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv("QUERY_CONVERTER_BREAKER_FAILURE_THRESHOLD", "5")
+)
+QUERY_CONVERTER_BREAKER_RESET_TIMEOUT = float(
+    os.getenv("QUERY_CONVERTER_BREAKER_RESET_TIMEOUT", "30")
+)
+# Optional second converter replica raced against calls slower than
+# QUERY_CONVERTER_HEDGE_AFTER seconds; hedging is off when the URL is empty
+QUERY_CONVERTER_HEDGE_URL = os.getenv("QUERY_CONVERTER_HEDGE_URL", "")
+QUERY_CONVERTER_HEDGE_AFTER = float(os.getenv("QUERY_CONVERTER_HEDGE_AFTER", "0.05"))
+# Concurrent converter calls made for a single /search/batch/ request
+QUERY_CONVERTER_MAX_CONCURRENCY = int(os.getenv("QUERY_CONVERTER_MAX_CONCURRENCY", "8"))
+
+# Maximum number of queries accepted by /search/batch/
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "50"))
 
 # RabbitMQ settings
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
@@ -168,3 +272,24 @@ RABBITMQ_PORT = os.getenv("RABBITMQ_PORT", "5672")
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "guest")
 RABBITMQ_VHOST = os.getenv("RABBITMQ_VHOST", "/")
+RABBITMQ_BLOCKED_CONNECTION_TIMEOUT = int(
+    os.getenv("RABBITMQ_BLOCKED_CONNECTION_TIMEOUT", "30")
+)
+
+# Background audit publisher settings
+AUDIT_PUBLISHER_QUEUE_SIZE = int(os.getenv("AUDIT_PUBLISHER_QUEUE_SIZE", "10000"))
+AUDIT_PUBLISHER_BATCH_SIZE = int(os.getenv("AUDIT_PUBLISHER_BATCH_SIZE", "100"))
+# Seconds the publisher waits for more messages before publishing a batch
+AUDIT_PUBLISHER_FLUSH_INTERVAL = float(
+    os.getenv("AUDIT_PUBLISHER_FLUSH_INTERVAL", "0.5")
+)
+AUDIT_PUBLISHER_MAX_RETRIES = int(os.getenv("AUDIT_PUBLISHER_MAX_RETRIES", "3"))
+
+# Disk spool for audit messages while RabbitMQ is down or slow, empty disables it
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR", str(BASE_DIR / "spool" / "audit"))
+AUDIT_SPOOL_SEGMENT_BYTES = int(os.getenv("AUDIT_SPOOL_SEGMENT_BYTES", str(1024**2)))
+AUDIT_SPOOL_MAX_BYTES = int(os.getenv("AUDIT_SPOOL_MAX_BYTES", str(100 * 1024**2)))
+# One of "always", "segment" (fsync when a segment is sealed) or "never"
+AUDIT_SPOOL_FSYNC = os.getenv("AUDIT_SPOOL_FSYNC", "segment")
+# Messages per second replayed from the spool once the broker is back
+AUDIT_SPOOL_REPLAY_RATE = int(os.getenv("AUDIT_SPOOL_REPLAY_RATE", "500"))
@@ -1,9 +1,125 @@
 import base64
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import authentication
 from rest_framework import exceptions
 
 
+class PrincipalCache:
+    """Bounded in-process TTL cache of the users behind authentication tokens.
+
+    Tokens of unknown users are cached too, for the shorter ``negative_ttl``,
+    so a storm of bad tokens does not reach the database. Saving or deleting a
+    user drops its entries in this process; other workers pick the change up
+    once their entries expire.
+    """
+
+    MISS = object()
+
+    def __init__(self, max_entries=10000, ttl=60, negative_ttl=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, token):
+        """Return the cached user, None for a cached unknown user, or ``MISS``"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(token, None)
+                self._stats["misses"] += 1
+                return self.MISS
+
+            self._entries.move_to_end(token)
+            user = entry[2]
+            self._stats["hits" if user is not None else "negative_hits"] += 1
+
+        # Callers get their own copy, so per-request changes never leak
+        return copy.copy(user) if user is not None else None
+
+    def set(self, token, username, user, generation):
+        """Cache a lookup made when ``generation`` was current
+
+        Lookups that raced with an invalidation are not cached, as they may
+        have read the user before it changed.
+        """
+        ttl = self.ttl if user is not None else self.negative_ttl
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[token] = (time.monotonic() + ttl, username, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, user):
+        """Drop every entry resolving to ``user`` or to its username"""
+        with self._lock:
+            self.generation += 1
+            stale = [
+                token
+                for token, (_, username, cached) in self._entries.items()
+                if username == user.username
+                or (cached is not None and cached.pk == user.pk)
+            ]
+            for token in stale:
+                del self._entries[token]
+            self._stats["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._stats = self._empty_stats()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_principal_cache = None
+_principal_cache_lock = threading.Lock()
+
+
+def get_principal_cache():
+    """Return the process-wide cache of authenticated principals"""
+    global _principal_cache
+    if _principal_cache is None:
+        with _principal_cache_lock:
+            if _principal_cache is None:
+                _principal_cache = PrincipalCache(
+                    max_entries=settings.AUTH_PRINCIPAL_CACHE_MAX_ENTRIES,
+                    ttl=settings.AUTH_PRINCIPAL_CACHE_TTL,
+                    negative_ttl=settings.AUTH_PRINCIPAL_CACHE_NEGATIVE_TTL,
+                )
+    return _principal_cache
+
+
 class OctoxlabsAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.META.get("HTTP_AUTHORIZATION", "")
@@ -13,11 +129,16 @@ class OctoxlabsAuthentication(authentication.BaseAuthentication):
 
         try:
             token = auth_header.split(" ")[1]
-            username = base64.b64decode(token).decode("utf-8")
+            principal_cache = get_principal_cache()
+            user = principal_cache.get(token)
+
+            if user is PrincipalCache.MISS:
+                username = base64.b64decode(token).decode("utf-8")
+                generation = principal_cache.generation
+                user = User.objects.filter(username=username).first()
+                principal_cache.set(token, username, user, generation)
 
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
+            if user is None:
                 raise exceptions.AuthenticationFailed("Invalid authentication token")
 
             return (user, None)
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .query_syntax import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SearchResultCache:
+    """Two-tier cache for Elasticsearch search results.
+
+    L1 is a bounded in-process LRU with a short TTL, so hot queries are served
+    without leaving the worker. L2 is the shared Django cache backend (Redis in
+    production), so workers and nodes reuse each other's results.
+    """
+
+    key_prefix = "search:result"
+
+    def __init__(
+        self,
+        max_entries=1000,
+        l1_ttl=30,
+        l2_ttl=300,
+        cache_alias="default",
+        key_prefix=None,
+    ):
+        if key_prefix is not None:
+            self.key_prefix = key_prefix
+        self.max_entries = max_entries
+        self.l1_ttl = l1_ttl
+        self.l2_ttl = l2_ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def make_key(self, *parts):
+        """Build a cache key, e.g. from the canonical query and the page window"""
+        raw_key = "|".join(str(part) for part in parts).encode("utf-8")
+        return f"{self.key_prefix}:{hashlib.sha256(raw_key).hexdigest()}"
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["l1_hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        value = self._l2_get(key)
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["l2_hits"] += 1
+
+        self._l1_set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Store ``value`` in both cache tiers"""
+        self._l1_set(key, value)
+        self._l2_set(key, value)
+
+    def clear(self):
+        """Drop every L1 entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._stats = self._empty_stats()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def _l1_set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.l1_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _l2_get(self, key):
+        # A broken shared cache must never fail a search
+        try:
+            return caches[self.cache_alias].get(key)
+        except Exception as e:
+            logger.warning(f"Search result cache read failed: {str(e)}")
+            return None
+
+    def _l2_set(self, key, value):
+        try:
+            caches[self.cache_alias].set(key, value, self.l2_ttl)
+        except Exception as e:
+            logger.warning(f"Search result cache write failed: {str(e)}")
+
+
+_search_result_cache = None
+_search_result_cache_lock = threading.Lock()
+
+
+def get_search_result_cache():
+    """Return the process-wide search result cache"""
+    global _search_result_cache
+    if _search_result_cache is None:
+        with _search_result_cache_lock:
+            if _search_result_cache is None:
+                _search_result_cache = SearchResultCache(
+                    max_entries=settings.SEARCH_RESULT_CACHE_MAX_ENTRIES,
+                    l1_ttl=settings.SEARCH_RESULT_CACHE_L1_TTL,
+                    l2_ttl=settings.SEARCH_RESULT_CACHE_TTL,
+                )
+    return _search_result_cache
+
+
+_search_response_cache = None
+
+
+def get_search_response_cache():
+    """Return the process-wide cache of rendered /search/ responses"""
+    global _search_response_cache
+    if _search_response_cache is None:
+        with _search_result_cache_lock:
+            if _search_response_cache is None:
+                _search_response_cache = SearchResultCache(
+                    max_entries=settings.SEARCH_RESULT_CACHE_MAX_ENTRIES,
+                    l1_ttl=settings.SEARCH_RESULT_CACHE_L1_TTL,
+                    l2_ttl=settings.SEARCH_RESPONSE_CACHE_TTL,
+                    key_prefix="search:response",
+                )
+    return _search_response_cache
+
+
+_query_conversion_cache = None
+
+
+def get_query_conversion_cache():
+    """Return the process-wide cache of converted queries and their costs"""
+    global _query_conversion_cache
+    if _query_conversion_cache is None:
+        with _search_result_cache_lock:
+            if _query_conversion_cache is None:
+                _query_conversion_cache = SearchResultCache(
+                    max_entries=settings.SEARCH_RESULT_CACHE_MAX_ENTRIES,
+                    l1_ttl=settings.SEARCH_RESULT_CACHE_L1_TTL,
+                    l2_ttl=settings.SEARCH_RESULT_CACHE_TTL,
+                    key_prefix="search:conversion",
+                )
+    return _query_conversion_cache
+
+
+_query_failure_cache = None
+
+
+def get_query_failure_cache():
+    """Return the process-wide cache of recently failed query conversions"""
+    global _query_failure_cache
+    if _query_failure_cache is None:
+        with _search_result_cache_lock:
+            if _query_failure_cache is None:
+                _query_failure_cache = SearchResultCache(
+                    max_entries=settings.SEARCH_RESULT_CACHE_MAX_ENTRIES,
+                    l1_ttl=settings.SEARCH_CONVERSION_FAILURE_TTL,
+                    l2_ttl=settings.SEARCH_CONVERSION_FAILURE_TTL,
+                    key_prefix="search:conversion-failure",
+                )
+    return _query_failure_cache
+
+
+def get_permission_scope(user):
+    """Coarse permission scope of a user; responses are only shared within one"""
+    if user.is_superuser:
+        return "superuser"
+    if user.is_staff:
+        return "staff"
+    return "user"
+
+
+def cache_search_response(func):
+    """Decorator to cache /search/ responses keyed on the request body.
+
+    Responses are keyed on the normalized query, the page window, the field
+    projection and the caller's permission scope, carry ``ETag`` and
+    ``Cache-Control`` headers, and a matching ``If-None-Match`` is answered
+    with 304 before Elasticsearch or the serializers are touched. Cursor
+    requests are never cached.
+    """
+
+    @wraps(func)
+    def wrapper(view_instance, request, *args, **kwargs):
+        query = request.data.get("query") if hasattr(request.data, "get") else None
+        cursor_request = view_instance.cursor_pagination.is_cursor_request(request)
+        if not isinstance(query, str) or cursor_request:
+            return func(view_instance, request, *args, **kwargs)
+
+        try:
+            page_number, page_size = view_instance.pagination.get_page_window(request)
+        except NotFound:
+            return func(view_instance, request, *args, **kwargs)
+
+        response_cache = get_search_response_cache()
+        key = response_cache.make_key(
+            normalize_query(query),
+            page_number,
+            page_size,
+            request.query_params.get("fields", ""),
+            get_permission_scope(request.user),
+        )
+
+        entry = response_cache.get(key)
+        response = None
+        if entry is None:
+            response = func(view_instance, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {"etag": _compute_etag(response.data), "data": response.data}
+            response_cache.set(key, entry)
+
+        if _etag_matches(request, entry["etag"]):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif response is None:
+            response = Response(entry["data"])
+
+        response["ETag"] = entry["etag"]
+        response["Cache-Control"] = f"private, max-age={response_cache.l2_ttl}"
+        response["Vary"] = "Authorization"
+        return response
+
+    return wrapper
+
+
+def _compute_etag(data):
+    payload = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    return quote_etag(hashlib.sha256(payload).hexdigest()[:32])
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return "*" in etags or etag in etags or f"W/{etag}" in etags
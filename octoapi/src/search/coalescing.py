@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight call that followers in the same process wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls so that only one leader does the work.
+
+    Within a process, followers block on the leader's in-flight call. Across
+    worker processes a short-lived lock in the cache backend elects a single
+    leader, which publishes its result for the followers polling the backend.
+    """
+
+    key_prefix = "search:flight"
+
+    def __init__(
+        self, lock_timeout=10, result_ttl=5, poll_interval=0.05, cache_alias="default"
+    ):
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.cache_alias = cache_alias
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "remote_coalesced": 0}
+
+    def make_key(self, *parts):
+        raw_key = "|".join(str(part) for part in parts).encode("utf-8")
+        return hashlib.sha256(raw_key).hexdigest()
+
+    def do(self, key, func):
+        """Run ``func`` once for all concurrent callers sharing ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_distributed(key, func)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+    def _do_distributed(self, key, func):
+        backend = caches[self.cache_alias]
+        lock_key = f"{self.key_prefix}:lock:{key}"
+        result_key = f"{self.key_prefix}:result:{key}"
+        token = uuid.uuid4().hex
+
+        try:
+            acquired = backend.add(lock_key, token, self.lock_timeout)
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+            return func()
+
+        if acquired:
+            try:
+                result = func()
+                self._backend_set(backend, result_key, result)
+                return result
+            finally:
+                self._release(backend, lock_key, token)
+
+        # Another worker is the leader, wait for the result it publishes
+        deadline = time.monotonic() + self.lock_timeout
+        try:
+            while time.monotonic() < deadline:
+                result = backend.get(result_key)
+                if result is None and backend.get(lock_key) is None:
+                    # The leader finished; it either published just now or failed
+                    result = backend.get(result_key)
+                    if result is None:
+                        break
+                if result is not None:
+                    with self._lock:
+                        self._stats["remote_coalesced"] += 1
+                    return result
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"Single-flight result unavailable: {str(e)}")
+
+        return func()
+
+    def _backend_set(self, backend, result_key, result):
+        # Followers fall back to doing the work themselves if this is lost
+        try:
+            backend.set(result_key, result, self.result_ttl)
+        except Exception as e:
+            logger.warning(f"Single-flight result publish failed: {str(e)}")
+
+    def _release(self, backend, lock_key, token):
+        # Only release the lock if it did not expire and get re-taken
+        try:
+            if backend.get(lock_key) == token:
+                backend.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Single-flight lock release failed: {str(e)}")
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight group for searches"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(
+                    lock_timeout=settings.SEARCH_SINGLE_FLIGHT_LOCK_TIMEOUT,
+                    result_ttl=settings.SEARCH_SINGLE_FLIGHT_RESULT_TTL,
+                )
+    return _single_flight
@@ -0,0 +1,538 @@
+import asyncio
+import atexit
+import importlib
+import logging
+import sys
+import threading
+import time
+import types
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+
+from .fields import get_field_registry
+
+try:
+    import httpx
+except ImportError:  # Only the async search path needs httpx
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+class QueryConverterMode:
+    """Constants for where search queries are converted."""
+
+    REMOTE = "remote"
+    EMBEDDED = "embedded"
+
+
+class QueryConverterUnavailable(Exception):
+    """The query converter failed, timed out or its circuit is open"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fail fast while a dependency keeps failing.
+
+    The circuit opens after ``failure_threshold`` consecutive failures and
+    rejects calls for ``reset_timeout`` seconds. After that a single trial call
+    is let through; its outcome closes the circuit or opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def allow(self):
+        """Return True if a call may go ahead"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._stats["rejected"] += 1
+                    return False
+                self._state = self.HALF_OPEN
+
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self._stats["rejected"] += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+
+    def release_trial(self):
+        """End a trial call that never got an answer, without judging it"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def retry_after(self):
+        """Seconds until the open circuit lets a trial call through"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            elapsed = time.monotonic() - self._opened_at
+            return max(self.reset_timeout - elapsed, 0)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+            }
+
+
+class RemoteQueryConverter:
+    """HTTP client for the query converter service.
+
+    Calls share a keep-alive connection pool and use strict connect and read
+    timeouts. A circuit breaker rejects calls while the converter is unhealthy,
+    and with ``hedge_url`` set a slow call is raced against a second replica
+    once ``hedge_after`` seconds have passed. Batches go to ``batch_url``,
+    by default the ``/batch`` route under ``url``, and are never hedged.
+    """
+
+    def __init__(
+        self,
+        url,
+        batch_url=None,
+        hedge_url=None,
+        hedge_after=0.05,
+        connect_timeout=0.5,
+        read_timeout=2,
+        pool_size=10,
+        breaker=None,
+        latency_window=1000,
+    ):
+        self.url = url
+        self.batch_url = batch_url or f"{url.rstrip('/')}/batch"
+        self.hedge_url = hedge_url
+        self.hedge_after = hedge_after
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = (
+            ThreadPoolExecutor(
+                max_workers=pool_size, thread_name_prefix="query-converter-hedge"
+            )
+            if hedge_url
+            else None
+        )
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "hedged": 0, "hedge_wins": 0}
+
+    def convert(self, query):
+        """Convert a query through the converter service
+
+        Returns the Elasticsearch query under ``query`` and the converter's
+        estimate of its cost under ``cost``. Raises ``requests.HTTPError`` when
+        the converter rejects the query and ``QueryConverterUnavailable`` when
+        it cannot answer at all.
+        """
+        if self._executor is None:
+            return self._call(self._post, self.url, query)
+        return self._call(self._post_hedged, query)
+
+    def convert_batch(self, queries):
+        """Convert several queries with one call to the converter's batch endpoint
+
+        Returns the conversion, like ``convert``, or a ``ValueError`` for a
+        query the converter rejected, for every query in order. Raises like
+        ``convert`` when the converter rejects the whole batch, e.g. because
+        it has no batch endpoint, or cannot answer at all.
+        """
+        items = self._call(self._post_batch, queries)
+        return [
+            _conversion(item) if "query" in item else ValueError(item["error"])
+            for item in items
+        ]
+
+    def _call(self, post, *args):
+        if not self.breaker.allow():
+            raise QueryConverterUnavailable(
+                "Query converter circuit is open",
+                retry_after=self.breaker.retry_after(),
+            )
+
+        started = time.perf_counter()
+        try:
+            result = post(*args)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                # The converter is healthy, the query itself was rejected
+                self.breaker.record_success()
+                self._record(started)
+                raise
+            self._record(started, failed=True)
+            raise QueryConverterUnavailable(f"Query converter failed: {str(e)}") from e
+        except requests.RequestException as e:
+            self._record(started, failed=True)
+            raise QueryConverterUnavailable(f"Query converter failed: {str(e)}") from e
+        except Exception:
+            # A malformed answer is a failure too, and must end a trial call
+            self._record(started, failed=True)
+            raise
+
+        self.breaker.record_success()
+        self._record(started)
+        return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {**self._stats, "breaker": self.breaker.stats()}
+        stats["latency_ms"] = {
+            "samples": len(latencies),
+            "p50": latencies[len(latencies) // 2] if latencies else None,
+            "p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        }
+        return stats
+
+    def _post(self, url, query):
+        response = self.session.post(url, json={"query": query}, timeout=self.timeout)
+        response.raise_for_status()
+        return _conversion(response.json())
+
+    def _post_batch(self, queries):
+        response = self.session.post(
+            self.batch_url, json={"queries": queries}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def _post_hedged(self, query):
+        primary = self._executor.submit(self._post, self.url, query)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self._stats["hedged"] += 1
+        hedge = self._executor.submit(self._post, self.hedge_url, query)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self._stats["hedge_wins"] += 1
+                return future.result()
+        raise error
+
+    def _record(self, started, failed=False):
+        if failed:
+            self.breaker.record_failure()
+        with self._lock:
+            self._stats["calls"] += 1
+            if failed:
+                self._stats["failures"] += 1
+            self._latencies.append(round((time.perf_counter() - started) * 1000, 3))
+
+
+class AsyncRemoteQueryConverter:
+    """asyncio counterpart of ``RemoteQueryConverter`` for the ASGI search path.
+
+    Uses an ``httpx.AsyncClient`` connection pool, which is bound to the event
+    loop it was created on. The circuit breaker is shared with the threaded
+    client so both paths agree on whether the converter is healthy.
+    """
+
+    def __init__(
+        self,
+        url,
+        hedge_url=None,
+        hedge_after=0.05,
+        connect_timeout=0.5,
+        read_timeout=2,
+        pool_size=10,
+        breaker=None,
+    ):
+        self.url = url
+        self.hedge_url = hedge_url
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        if httpx is None:
+            raise ImproperlyConfigured("The async search path needs httpx installed")
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    async def convert(self, query):
+        """Convert a query through the converter service
+
+        Raises ``httpx.HTTPStatusError`` when the converter rejects the query
+        and ``QueryConverterUnavailable`` when it cannot answer at all.
+        """
+        if not self.breaker.allow():
+            raise QueryConverterUnavailable(
+                "Query converter circuit is open",
+                retry_after=self.breaker.retry_after(),
+            )
+
+        try:
+            if self.hedge_url:
+                result = await self._post_hedged(query)
+            else:
+                result = await self._post(self.url, query)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500:
+                # The converter is healthy, the query itself was rejected
+                self.breaker.record_success()
+                raise
+            self.breaker.record_failure()
+            raise QueryConverterUnavailable(f"Query converter failed: {str(e)}") from e
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise QueryConverterUnavailable(f"Query converter failed: {str(e)}") from e
+        except Exception:
+            # A malformed answer is a failure too, and must end a trial call
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled before the converter answered, let another trial through
+            self.breaker.release_trial()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _post(self, url, query):
+        response = await self.client.post(url, json={"query": query})
+        response.raise_for_status()
+        return _conversion(response.json())
+
+    async def _post_hedged(self, query):
+        primary = asyncio.ensure_future(self._post(self.url, query))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._post(self.hedge_url, query))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.exception() is not None:
+                        error = future.exception()
+                        continue
+                    return future.result()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class EmbeddedQueryConverter:
+    """Runs the query_converter service logic in-process.
+
+    Queries are validated with the service's own ``QueryRequest`` schema and
+    converted by its ``ConverterService``, so the result is the same body
+    ``POST /convert`` returns, without the network hop. The service's field
+    registry is built from the index ``mapping`` octoapi validates against.
+    """
+
+    def __init__(self, source_dir=None, mapping=None):
+        try:
+            package = _load_converter_package(source_dir)
+            schemas = importlib.import_module(f"{package}.schemas.query_schema")
+            services = importlib.import_module(f"{package}.services.converter_service")
+            fields = importlib.import_module(f"{package}.services.field_registry")
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "Embedded query conversion needs the query_converter sources "
+                f"and their dependencies (pydantic, loguru): {str(e)}"
+            )
+
+        # The service logs every conversion; through our logging configuration
+        # those records are dropped below the configured level
+        for name, module in list(sys.modules.items()):
+            if name.startswith(f"{package}.") and hasattr(module, "logger"):
+                module.logger = logging.getLogger(name)
+
+        self._request_schema = schemas.QueryRequest
+        registry = fields.FieldRegistry.from_mapping(mapping) if mapping else None
+        self._service = services.ConverterService(registry=registry)
+
+    def convert(self, query):
+        """Validate and convert a query; raises ValueError for invalid queries"""
+        request = self._request_schema(query=query)
+        result = self._service.convert(request.query)
+        return {"query": result.query, "cost": result.cost}
+
+    def stats(self):
+        """Counters of the service's conversion cache"""
+        return {"conversion_cache": self._service.cache.stats()}
+
+
+# query_converter's ``app`` package is imported under this name, so it neither
+# shadows nor is shadowed by another top-level ``app`` package
+EMBEDDED_CONVERTER_PACKAGE = "_query_converter_app"
+
+
+def _load_converter_package(source_dir):
+    """Register the ``app`` package under ``source_dir`` by its private name"""
+    if EMBEDDED_CONVERTER_PACKAGE not in sys.modules:
+        package_dir = Path(source_dir or "") / "app"
+        if not package_dir.is_dir():
+            raise ImportError(f"No query_converter app package in {package_dir}")
+        # A namespace package like app itself, its modules import each other
+        # relatively
+        package = types.ModuleType(EMBEDDED_CONVERTER_PACKAGE)
+        package.__path__ = [str(package_dir)]
+        sys.modules[EMBEDDED_CONVERTER_PACKAGE] = package
+    return EMBEDDED_CONVERTER_PACKAGE
+
+
+def _conversion(answer):
+    """The query and estimated cost out of a converter answer"""
+    # A converter without cost estimates prices every query like a term lookup
+    return {"query": answer["query"], "cost": answer.get("cost", 1)}
+
+
+_remote_query_converter = None
+_remote_query_converter_lock = threading.Lock()
+
+
+def get_remote_query_converter():
+    """Return the process-wide HTTP client for the query converter service"""
+    global _remote_query_converter
+    if _remote_query_converter is None:
+        with _remote_query_converter_lock:
+            if _remote_query_converter is None:
+                _remote_query_converter = RemoteQueryConverter(
+                    url=settings.QUERY_CONVERTER_SERVICE_URL,
+                    hedge_url=settings.QUERY_CONVERTER_HEDGE_URL or None,
+                    hedge_after=settings.QUERY_CONVERTER_HEDGE_AFTER,
+                    connect_timeout=settings.QUERY_CONVERTER_CONNECT_TIMEOUT,
+                    read_timeout=settings.QUERY_CONVERTER_READ_TIMEOUT,
+                    pool_size=settings.QUERY_CONVERTER_POOL_SIZE,
+                    breaker=CircuitBreaker(
+                        failure_threshold=settings.QUERY_CONVERTER_BREAKER_FAILURE_THRESHOLD,
+                        reset_timeout=settings.QUERY_CONVERTER_BREAKER_RESET_TIMEOUT,
+                    ),
+                )
+    return _remote_query_converter
+
+
+def close_remote_query_converter():
+    """Close the query converter client and its connection pool"""
+    global _remote_query_converter
+    with _remote_query_converter_lock:
+        if _remote_query_converter is not None:
+            _remote_query_converter.close()
+            _remote_query_converter = None
+
+
+atexit.register(close_remote_query_converter)
+
+
+_async_query_converter = None
+_async_query_converter_loop = None
+
+
+def get_async_remote_query_converter():
+    """Return the async query converter client of the running event loop"""
+    global _async_query_converter, _async_query_converter_loop
+    loop = asyncio.get_running_loop()
+    if _async_query_converter is None or _async_query_converter_loop is not loop:
+        _async_query_converter = AsyncRemoteQueryConverter(
+            url=settings.QUERY_CONVERTER_SERVICE_URL,
+            hedge_url=settings.QUERY_CONVERTER_HEDGE_URL or None,
+            hedge_after=settings.QUERY_CONVERTER_HEDGE_AFTER,
+            connect_timeout=settings.QUERY_CONVERTER_CONNECT_TIMEOUT,
+            read_timeout=settings.QUERY_CONVERTER_READ_TIMEOUT,
+            pool_size=settings.QUERY_CONVERTER_POOL_SIZE,
+            breaker=get_remote_query_converter().breaker,
+        )
+        _async_query_converter_loop = loop
+    return _async_query_converter
+
+
+async def close_async_remote_query_converter():
+    """Close the async query converter client and its connection pool"""
+    global _async_query_converter, _async_query_converter_loop
+    if _async_query_converter is not None:
+        converter = _async_query_converter
+        _async_query_converter = _async_query_converter_loop = None
+        await converter.close()
+
+
+_embedded_query_converter = None
+_embedded_query_converter_lock = threading.Lock()
+
+
+def get_embedded_query_converter():
+    """Return the process-wide in-process query converter"""
+    global _embedded_query_converter
+    if _embedded_query_converter is None:
+        with _embedded_query_converter_lock:
+            if _embedded_query_converter is None:
+                _embedded_query_converter = EmbeddedQueryConverter(
+                    source_dir=settings.QUERY_CONVERTER_SOURCE_DIR,
+                    mapping=get_field_registry().mapping,
+                )
+    return _embedded_query_converter
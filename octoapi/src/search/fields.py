@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+
+from django.conf import settings
+from elasticsearch import Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+
+class FieldRegistry:
+    """Searchable fields by case-insensitive name, read from an index mapping.
+
+    The query converter builds the same registry from the same mapping, so
+    adding a property to the mapping makes it searchable in both services.
+    Text fields remember their keyword subfield for exact matches, and fields
+    whose mapping ``meta`` has ``"multi_valued": "true"`` hold arrays.
+    """
+
+    def __init__(self, mapping):
+        # Index creation body, or just what is under its "mappings" key
+        self.mapping = mapping.get("mappings", mapping)
+        properties = self.mapping.get("properties")
+        if not properties:
+            raise ValueError("Index mapping has no properties")
+
+        self._fields = {}
+        for name, spec in properties.items():
+            keyword = next(
+                (
+                    f"{name}.{subname}"
+                    for subname, subspec in spec.get("fields", {}).items()
+                    if subspec.get("type") == "keyword"
+                ),
+                None,
+            )
+            self._fields[name.lower()] = {
+                "name": name,
+                "type": spec.get("type", "object"),
+                "keyword": keyword,
+                "multi_valued": spec.get("meta", {}).get("multi_valued") == "true",
+            }
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as mapping_file:
+            return cls(json.load(mapping_file))
+
+    @classmethod
+    def from_elasticsearch(cls, client, index):
+        """Read the live mapping; the properties of every index behind an alias"""
+        response = client.indices.get_mapping(index=index)
+        properties = {}
+        for index_mapping in response.values():
+            properties.update(index_mapping["mappings"].get("properties", {}))
+        return cls({"properties": properties})
+
+    @property
+    def fields(self):
+        """The searchable fields, sorted by name"""
+        return [self._fields[name.lower()] for name in self.names]
+
+    @property
+    def names(self):
+        """Canonical names of the searchable fields, sorted"""
+        return sorted(field["name"] for field in self._fields.values())
+
+    def get(self, name):
+        """The field stored under a name, ignoring case, or None"""
+        return self._fields.get(name.strip().lower())
+
+
+_field_registry = None
+_field_registry_lock = threading.Lock()
+
+
+def get_field_registry():
+    """Return the searchable fields, loaded once per process
+
+    From SEARCH_FIELDS_FILE, or from the mapping of ELASTICSEARCH_INDEX when
+    the setting is empty.
+    """
+    global _field_registry
+    if _field_registry is None:
+        with _field_registry_lock:
+            if _field_registry is None:
+                _field_registry = _load_field_registry()
+                logger.info(f"Searchable fields: {', '.join(_field_registry.names)}")
+    return _field_registry
+
+
+def _load_field_registry():
+    if settings.SEARCH_FIELDS_FILE:
+        return FieldRegistry.from_file(settings.SEARCH_FIELDS_FILE)
+
+    client = Elasticsearch(settings.ELASTICSEARCH_HOST)
+    try:
+        return FieldRegistry.from_elasticsearch(client, settings.ELASTICSEARCH_INDEX)
+    finally:
+        client.close()
+
+
+def reset_field_registry():
+    """Forget the loaded fields, the next lookup reads them again"""
+    global _field_registry
+    with _field_registry_lock:
+        _field_registry = None
@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search.converter import (
+    QueryConverterMode,
+    get_embedded_query_converter,
+    get_remote_query_converter,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark query conversion latency per converter mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--query",
+            type=str,
+            default="Hostname = octoxlabs*",
+            help="Query to convert",
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=1000, help="Conversions per mode"
+        )
+        parser.add_argument(
+            "--modes",
+            nargs="+",
+            default=[QueryConverterMode.EMBEDDED, QueryConverterMode.REMOTE],
+            choices=[QueryConverterMode.EMBEDDED, QueryConverterMode.REMOTE],
+            help="Converter modes to benchmark",
+        )
+
+    def handle(self, *args, **options):
+        query = options["query"]
+        iterations = options["iterations"]
+        # The converters themselves, search's cache of conversions would hide them
+        converters = {
+            QueryConverterMode.EMBEDDED: get_embedded_query_converter,
+            QueryConverterMode.REMOTE: get_remote_query_converter,
+        }
+
+        self.stdout.write(
+            f"Converting {query!r} {iterations} times, "
+            f"converter URL {settings.QUERY_CONVERTER_SERVICE_URL}"
+        )
+        for mode in options["modes"]:
+            try:
+                converter = converters[mode]()
+                # Warm up connections and imports outside the measurement
+                converter.convert(query)
+                timings = self._measure(converter, query, iterations)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{mode}: failed, {str(e)}"))
+                continue
+
+            timings.sort()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{mode}: mean {statistics.mean(timings):.1f}us "
+                    f"p50 {timings[len(timings) // 2]:.1f}us "
+                    f"p99 {timings[int(len(timings) * 0.99) - 1]:.1f}us"
+                )
+            )
+
+    def _measure(self, converter, query, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            converter.convert(query)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        return timings
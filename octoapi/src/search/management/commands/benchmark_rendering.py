@@ -0,0 +1,65 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from search.renderers import ORJSONRenderer
+from search.serializers import SearchResultSerializer
+
+
+class Command(BaseCommand):
+    help = "Benchmark rendering a page of search hits, validated vs shape-checked"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[100, 10000],
+            help="Hits per page",
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=20, help="Renders per page size"
+        )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        for size in options["sizes"]:
+            hits = [
+                {
+                    "Hostname": f"octoxlabs{i:05d}",
+                    "Ip": [f"10.0.{i // 256 % 256}.{i % 256}", "192.168.1.1"],
+                }
+                for i in range(size)
+            ]
+            validated = self._measure(self._render_validated, hits, iterations)
+            fast = self._measure(self._render_fast, hits, iterations)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{size} hits: serializer + JSONRenderer {validated:.2f}ms, "
+                    f"shape check + ORJSONRenderer {fast:.2f}ms "
+                    f"({validated / fast:.1f}x)"
+                )
+            )
+
+    @staticmethod
+    def _render_validated(hits):
+        serializer = SearchResultSerializer(data=hits, many=True)
+        serializer.is_valid(raise_exception=True)
+        return JSONRenderer().render({"total": len(hits), "results": serializer.data})
+
+    @staticmethod
+    def _render_fast(hits):
+        results = SearchResultSerializer.render_hits(hits)
+        return ORJSONRenderer().render({"total": len(hits), "results": results})
+
+    def _measure(self, render, hits, iterations):
+        if render(hits) is None:
+            raise RuntimeError("Rendering failed")
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            render(hits)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -1,8 +1,10 @@
 import json
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from elasticsearch import Elasticsearch
 from django.conf import settings
 
+from search.fields import FieldRegistry
+
 
 class Command(BaseCommand):
     help = "Load dummy data into Elasticsearch"
@@ -11,15 +13,11 @@ class Command(BaseCommand):
         # Connect to Elasticsearch
         es = Elasticsearch(settings.ELASTICSEARCH_HOST)
 
-        # Define the index mapping
-        mapping = {
-            "mappings": {
-                "properties": {
-                    "Hostname": {"type": "keyword"},
-                    "Ip": {"type": "keyword"},
-                }
-            }
-        }
+        # The index mapping is the searchable fields file
+        if not settings.SEARCH_FIELDS_FILE:
+            raise CommandError("SEARCH_FIELDS_FILE must point to the index mapping")
+        registry = FieldRegistry.from_file(settings.SEARCH_FIELDS_FILE)
+        mapping = {"mappings": registry.mapping}
 
         # Sample data
         dummy_data = [
@@ -1,9 +1,33 @@
+import atexit
 import json
+import logging
+import os
+import queue
+import threading
+import time
 import pika
+from pika.exceptions import NackError, UnroutableError
 from django.conf import settings
 from functools import wraps
 from django.utils import timezone
 
+from .spool import AuditSpool
+
+logger = logging.getLogger(__name__)
+
+SEARCH_QUERY_QUEUE = "search_query_queue"
+
+# Wakes the publisher thread up when it is asked to stop
+_STOP = object()
+
+
+class UndeliveredMessages(Exception):
+    """The broker did not confirm some messages of a batch, the rest were taken"""
+
+    def __init__(self, messages):
+        super().__init__(f"{len(messages)} audit messages were not delivered")
+        self.messages = messages
+
 
 class RabbitMQClient:
     def __init__(self):
@@ -15,6 +39,8 @@ class RabbitMQClient:
             port=int(settings.RABBITMQ_PORT),
             virtual_host=settings.RABBITMQ_VHOST,
             credentials=self.credentials,
+            # Give up on a broker that blocks publishers instead of hanging
+            blocked_connection_timeout=settings.RABBITMQ_BLOCKED_CONNECTION_TIMEOUT,
         )
         self.connection = None
         self.channel = None
@@ -25,26 +51,421 @@ class RabbitMQClient:
             self.channel = self.connection.channel()
 
             # Declare queues
-            self.channel.queue_declare(queue="search_query_queue", durable=True)
+            self.channel.queue_declare(queue=SEARCH_QUERY_QUEUE, durable=True)
+
+            # The broker acks every message it has taken responsibility for
+            # and returns the ones it could not route
+            self.channel.confirm_delivery()
 
     def close(self):
+        try:
+            if self.connection and not self.connection.is_closed:
+                self.connection.close()
+        finally:
+            self.connection = None
+            self.channel = None
+
+    def process_data_events(self):
+        """Service heartbeats on an idle connection"""
         if self.connection and not self.connection.is_closed:
-            self.connection.close()
+            self.connection.process_data_events(time_limit=0)
 
     def publish_message(self, routing_key, message):
+        self.publish_messages(routing_key, [message])
+
+    def publish_messages(self, routing_key, messages):
+        """Publish messages over the persistent connection with publisher confirms
+
+        Raises ``UndeliveredMessages`` with the messages the broker returned,
+        nacked or never confirmed; every other message of the batch was
+        delivered.
+        """
+        self.connect()
+        undelivered = []
+        for index, message in enumerate(messages):
+            try:
+                self.channel.basic_publish(
+                    exchange="",
+                    routing_key=routing_key,
+                    body=json.dumps(message),
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        content_type="application/json",
+                    ),
+                    mandatory=True,
+                )
+            except (UnroutableError, NackError) as e:
+                logger.warning(f"Audit message rejected by the broker: {str(e)}")
+                undelivered.append(message)
+            except Exception as e:
+                # The channel is gone, nothing from here on was confirmed
+                if index == 0:
+                    raise
+                logger.warning(f"Audit batch interrupted: {str(e)}")
+                raise UndeliveredMessages(undelivered + messages[index:]) from e
+        if undelivered:
+            raise UndeliveredMessages(undelivered)
+
+
+class AuditPublisher:
+    """Long-lived publisher that ships audit messages from a background thread.
+
+    The request path only puts messages on a bounded in-memory queue. The
+    publisher thread drains it in batches over one persistent, confirmed
+    RabbitMQ connection and reconnects with backoff when the broker goes away.
+    Only the messages of a batch the broker did not take are retried.
+
+    With a ``spool`` configured, batches that cannot be published and messages
+    that overflow the queue go to disk instead of being dropped, and the same
+    thread replays spooled segments at ``replay_rate`` messages per second once
+    the broker is reachable again.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        routing_key=SEARCH_QUERY_QUEUE,
+        max_queue_size=10000,
+        batch_size=100,
+        flush_interval=0.5,
+        max_retries=3,
+        spool=None,
+        replay_rate=500,
+    ):
+        self.client = client or RabbitMQClient()
+        self.routing_key = routing_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+        self._failures = 0
+        self._broker_down_until = 0.0
+        self._next_replay_at = 0.0
+        self._replay_path = None
+        self._replay_pending = []
+        self._replay_started = False
+        self._stats = {
+            "published": 0,
+            "dropped": 0,
+            "failed": 0,
+            "reconnects": 0,
+            "spooled": 0,
+            "replayed": 0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-publisher", daemon=True
+                )
+                self._thread.start()
+
+    def publish(self, message):
+        """Enqueue a message without blocking; returns False if it was dropped"""
+        self.start()
+        with self._lock:
+            try:
+                self._queue.put_nowait(message)
+                self._unfinished += 1
+                return True
+            except queue.Full:
+                pass
+
+        # The broker is not keeping up, keep the record on disk instead
+        return self._spill([message])
+
+    def publish_many(self, messages):
+        """Enqueue several messages at once; returns False if any was dropped"""
+        self.start()
+        overflow = []
+        with self._lock:
+            for message in messages:
+                try:
+                    self._queue.put_nowait(message)
+                    self._unfinished += 1
+                except queue.Full:
+                    overflow.append(message)
+
+        return not overflow or self._spill(overflow)
+
+    def flush(self, timeout=None):
+        """Wait until every enqueued message has been handled"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def stop(self, timeout=5):
+        """Flush pending messages, stop the thread and close the connection"""
+        self.flush(timeout)
+        self._stop_event.set()
         try:
-            self.connect()
-            self.channel.basic_publish(
-                exchange="",
-                routing_key=routing_key,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                    content_type="application/json",
-                ),
-            )
-        finally:
-            self.close()
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        if self.spool is not None:
+            # Whatever is still in memory would be lost on exit
+            self._spill_queued()
+            self._release_replay()
+            self.spool.close()
+
+        try:
+            self.client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close RabbitMQ connection: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            stats = {**self._stats, "queue_depth": self._queue.qsize()}
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+    def _run(self):
+        if self.spool is not None and not self.spool.has_pending():
+            self._next_replay_at = time.monotonic() + self.flush_interval
+
+        while not self._stop_event.is_set():
+            batch = self._next_batch(self._batch_timeout())
+            if batch:
+                self._publish_batch(batch)
+            elif not self._replay_due():
+                self._keep_alive()
+            self._replay_spool()
+
+    def _batch_timeout(self):
+        if self._replay_path is None or not self._broker_up():
+            return self.flush_interval
+        # Wake up in time for the next rate-limited replay chunk
+        return min(max(self._next_replay_at - time.monotonic(), 0), self.flush_interval)
+
+    def _next_batch(self, timeout):
+        try:
+            message = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        if message is _STOP:
+            return []
+
+        batch = [message]
+        while len(batch) < self.batch_size:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is _STOP:
+                break
+            batch.append(message)
+        return batch
+
+    def _publish_batch(self, batch):
+        if self.spool is not None:
+            # Spool straight away while the broker is down so the queue keeps moving
+            remaining = self._try_publish(batch) if self._broker_up() else batch
+            self._finish(len(batch) - len(remaining), "published")
+            if remaining:
+                outcome = "spooled" if self._spill(remaining) else "failed"
+                self._finish(len(remaining), outcome)
+            return
+
+        attempt = 0
+        while True:
+            remaining = self._try_publish(batch)
+            self._finish(len(batch) - len(remaining), "published")
+            if not remaining:
+                return
+            batch = remaining
+            attempt += 1
+            if attempt > self.max_retries or self._stop_event.is_set():
+                logger.error(f"Dropping {len(batch)} audit messages")
+                self._finish(len(batch), "failed")
+                return
+            # Exponential backoff, interrupted when the publisher stops
+            self._stop_event.wait(self._backoff(attempt))
+
+    def _try_publish(self, messages):
+        """Publish messages; returns the ones the broker did not take, in order"""
+        try:
+            self.client.publish_messages(self.routing_key, messages)
+        except Exception as e:
+            logger.warning(f"Failed to publish audit messages: {str(e)}")
+            self._reset_connection()
+            self._failures += 1
+            self._broker_down_until = time.monotonic() + self._backoff(self._failures)
+            if isinstance(e, UndeliveredMessages):
+                return e.messages
+            return messages
+        self._failures = 0
+        self._broker_down_until = 0.0
+        return []
+
+    @staticmethod
+    def _backoff(attempt):
+        return min(0.5 * 2 ** (attempt - 1), 30)
+
+    def _broker_up(self):
+        return time.monotonic() >= self._broker_down_until
+
+    def _replay_due(self):
+        return (
+            self.spool is not None
+            and self._broker_up()
+            and time.monotonic() >= self._next_replay_at
+        )
+
+    def _replay_spool(self):
+        """Replay one rate-limited chunk of spooled messages"""
+        if not self._replay_due():
+            return
+
+        if self._replay_path is None:
+            claimed = self.spool.claim()
+            if claimed is None:
+                self._next_replay_at = time.monotonic() + self.flush_interval
+                return
+            self._replay_path, self._replay_pending = claimed
+            self._replay_started = False
+
+        chunk = self._replay_pending[: self.batch_size]
+        if chunk:
+            remaining = self._try_publish(chunk)
+            replayed = len(chunk) - len(remaining)
+            if replayed:
+                with self._lock:
+                    self._stats["replayed"] += replayed
+                self._replay_started = True
+            self._replay_pending = remaining + self._replay_pending[len(chunk) :]
+            if remaining:
+                # Give the rest of the segment back and retry after the backoff
+                self._release_replay()
+                return
+
+        if not self._replay_pending:
+            self.spool.remove(self._replay_path)
+            self._replay_path = None
+        self._next_replay_at = time.monotonic() + len(chunk) / self.replay_rate
+
+    def _release_replay(self):
+        if self._replay_path is None:
+            return
+        remaining = self._replay_pending if self._replay_started else None
+        self.spool.release(self._replay_path, remaining)
+        self._replay_path, self._replay_pending = None, []
+
+    def _spill(self, messages):
+        """Write messages to the spool; returns False if they had to be dropped"""
+        if self.spool is not None:
+            try:
+                if self.spool.append(messages):
+                    return True
+            except OSError as e:
+                logger.error(f"Failed to spool audit messages: {str(e)}")
+
+        with self._lock:
+            self._stats["dropped"] += len(messages)
+        return False
+
+    def _spill_queued(self):
+        batch = []
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is not _STOP:
+                batch.append(message)
+        if batch:
+            self._finish(len(batch), "spooled" if self._spill(batch) else "failed")
+
+    def _finish(self, count, outcome):
+        with self._idle:
+            self._stats[outcome] += count
+            self._unfinished -= count
+            self._idle.notify_all()
+
+    def _keep_alive(self):
+        try:
+            self.client.process_data_events()
+        except Exception as e:
+            logger.warning(f"RabbitMQ connection lost while idle: {str(e)}")
+            self._reset_connection()
+
+    def _reset_connection(self):
+        with self._lock:
+            self._stats["reconnects"] += 1
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+_audit_publisher = None
+_audit_publisher_pid = None
+_audit_publisher_lock = threading.Lock()
+
+
+def get_audit_publisher():
+    """Return the process-wide audit publisher, recreating it after a fork"""
+    global _audit_publisher, _audit_publisher_pid
+    if _audit_publisher is None or _audit_publisher_pid != os.getpid():
+        with _audit_publisher_lock:
+            if _audit_publisher is None or _audit_publisher_pid != os.getpid():
+                spool = None
+                if settings.AUDIT_SPOOL_DIR:
+                    spool = AuditSpool(
+                        settings.AUDIT_SPOOL_DIR,
+                        segment_bytes=settings.AUDIT_SPOOL_SEGMENT_BYTES,
+                        max_bytes=settings.AUDIT_SPOOL_MAX_BYTES,
+                        fsync=settings.AUDIT_SPOOL_FSYNC,
+                    )
+                _audit_publisher = AuditPublisher(
+                    max_queue_size=settings.AUDIT_PUBLISHER_QUEUE_SIZE,
+                    batch_size=settings.AUDIT_PUBLISHER_BATCH_SIZE,
+                    flush_interval=settings.AUDIT_PUBLISHER_FLUSH_INTERVAL,
+                    max_retries=settings.AUDIT_PUBLISHER_MAX_RETRIES,
+                    spool=spool,
+                    replay_rate=settings.AUDIT_SPOOL_REPLAY_RATE,
+                )
+                _audit_publisher_pid = os.getpid()
+    return _audit_publisher
+
+
+def close_audit_publisher(timeout=5):
+    """Flush and stop the process-wide audit publisher"""
+    global _audit_publisher
+    with _audit_publisher_lock:
+        publisher, _audit_publisher = _audit_publisher, None
+    if publisher is not None and _audit_publisher_pid == os.getpid():
+        publisher.stop(timeout)
+
+
+atexit.register(close_audit_publisher)
+
+
+def _search_log_data(request, query):
+    return {
+        "ip": request.META.get("REMOTE_ADDR"),
+        "username": request.user.username,
+        "query": query,
+        "timestamp": str(timezone.now()),
+    }
+
+
+def publish_search_log(request, query):
+    """Enqueue the audit record of a search; never blocks on the broker"""
+    # Only enqueue here, the publisher thread talks to the broker
+    if not get_audit_publisher().publish(_search_log_data(request, query)):
+        logger.warning("Audit queue and spool are full, search query log dropped")
 
 
 def log_search_query(func):
@@ -52,20 +473,30 @@ def log_search_query(func):
 
     @wraps(func)
     def wrapper(view_instance, request, *args, **kwargs):
-        client = RabbitMQClient()
-
         # Log the incoming request
-        log_data = {
-            "ip": request.META.get("REMOTE_ADDR"),
-            "username": request.user.username,
-            "query": request.data.get("query", ""),
-            "timestamp": str(timezone.now()),
-        }
+        publish_search_log(request, request.data.get("query", ""))
 
-        try:
-            client.publish_message(routing_key="search_query_queue", message=log_data)
-        except Exception as e:
-            print(f"Failed to log search query: {str(e)}")
+        return func(view_instance, request, *args, **kwargs)
+
+    return wrapper
+
+
+def log_search_queries(func):
+    """Decorator to log every query of a batch search to RabbitMQ in one publish"""
+
+    @wraps(func)
+    def wrapper(view_instance, request, *args, **kwargs):
+        queries = request.data.get("queries")
+        if isinstance(queries, list):
+            messages = [
+                _search_log_data(request, query)
+                for query in queries
+                if isinstance(query, str)
+            ]
+            if messages and not get_audit_publisher().publish_many(messages):
+                logger.warning(
+                    "Audit queue and spool are full, search query logs dropped"
+                )
 
         return func(view_instance, request, *args, **kwargs)
 
@@ -1,3 +1,8 @@
+import base64
+import hashlib
+import json
+
+from rest_framework.exceptions import NotFound, ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
@@ -7,6 +12,32 @@ class SearchPagination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
+    def get_page_window(self, request):
+        """Resolve the requested page into an Elasticsearch ``from``/``size`` window"""
+        page_size = self.get_page_size(request)
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            page_number = int(page_number)
+            if page_number < 1:
+                raise ValueError("That page number is less than 1")
+        except (TypeError, ValueError) as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+
+        return page_number, page_size
+
+    def validate_page(self, page_number, page_size, total):
+        """Reject pages that start beyond the last matching document"""
+        if page_number > 1 and (page_number - 1) * page_size >= total:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message="That page contains no results"
+                )
+            )
+
     def get_paginated_response(self, data):
         return Response(
             {
@@ -18,3 +49,61 @@ class SearchPagination(PageNumberPagination):
                 "results": data,
             }
         )
+
+
+class SearchCursorPagination(SearchPagination):
+    """Cursor pagination over an Elasticsearch point-in-time with search_after.
+
+    The ``next_cursor`` handed to clients is an opaque token wrapping the
+    point-in-time id, the ``search_after`` sort values of the last hit and a
+    fingerprint of the query, so each page costs the same regardless of depth.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+    max_page_size = 1000
+
+    def is_cursor_request(self, request):
+        """An empty ``cursor`` parameter starts a new cursor"""
+        return self.cursor_query_param in request.query_params
+
+    def decode_cursor(self, request, query):
+        """Return the ``(pit_id, search_after)`` pair for the requested cursor
+
+        Malformed cursors and cursors of another query raise ``ParseError``.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None
+
+        try:
+            padding = "=" * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            pit_id, search_after = cursor["pit"], cursor["after"]
+            fingerprint = cursor["q"]
+        except (TypeError, ValueError, KeyError):
+            raise ParseError(self.invalid_cursor_message)
+
+        if fingerprint != self._fingerprint(query):
+            raise ParseError(self.invalid_cursor_message)
+
+        return pit_id, search_after
+
+    def encode_cursor(self, result, query):
+        """Build the opaque ``next_cursor`` token, or None once exhausted"""
+        if result.exhausted:
+            return None
+
+        cursor = {
+            "pit": result.pit_id,
+            "after": result.search_after,
+            "q": self._fingerprint(query),
+        }
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(cursor, separators=(",", ":")).encode("utf-8")
+        )
+        return encoded.decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _fingerprint(query):
+        return hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
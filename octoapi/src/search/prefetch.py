@@ -0,0 +1,160 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cache import get_search_result_cache
+
+logger = logging.getLogger(__name__)
+
+# Elasticsearch's default index.max_result_window, deeper pages are rejected
+MAX_RESULT_WINDOW = 10000
+
+
+class PagePrefetcher:
+    """Fetch the next page window of a search into the result cache in the background.
+
+    Prefetches run on a small thread pool and are admitted by a token bucket
+    refilled at ``rate`` per second, so they can never add more than that to
+    the Elasticsearch load. While the result cache's in-process tier is more
+    than ``max_cache_fill`` full, new prefetches are refused and queued ones
+    cancelled, as their pages would only evict entries that are in use.
+    """
+
+    def __init__(
+        self, result_cache, rate=5, burst=10, max_workers=2, max_cache_fill=0.9
+    ):
+        self.result_cache = result_cache
+        self.rate = rate
+        self.burst = burst
+        self.max_cache_fill = max_cache_fill
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="search-prefetch"
+        )
+        self._pending = {}
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "duplicates": 0,
+            "rate_limited": 0,
+            "cancelled": 0,
+        }
+
+    def schedule(self, service, es_query_str, offset, size, fields=None):
+        """Queue a fetch of one page window; returns its future or None if refused"""
+        if offset + size > MAX_RESULT_WINDOW:
+            return None
+        if self.under_memory_pressure():
+            self.cancel_pending()
+            return None
+
+        key = (es_query_str, offset, size, fields)
+        with self._lock:
+            if key in self._pending:
+                self._stats["duplicates"] += 1
+                return None
+            if not self._take_token():
+                self._stats["rate_limited"] += 1
+                return None
+            self._stats["scheduled"] += 1
+            future = self._pending[key] = self._executor.submit(
+                self._prefetch, service, es_query_str, offset, size, fields
+            )
+
+        future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    def under_memory_pressure(self):
+        stats = self.result_cache.stats()
+        return stats["entries"] >= stats["max_entries"] * self.max_cache_fill
+
+    def cancel_pending(self):
+        """Cancel every prefetch that has not started yet"""
+        with self._lock:
+            futures = list(self._pending.values())
+        cancelled = sum(1 for future in futures if future.cancel())
+        if cancelled:
+            with self._lock:
+                self._stats["cancelled"] += cancelled
+        return cancelled
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+    def close(self, wait=False):
+        """Stop the worker threads, waiting for queued prefetches or dropping them"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _prefetch(self, service, es_query_str, offset, size, fields):
+        # The cache may have filled up while this prefetch was queued
+        if self.under_memory_pressure():
+            with self._lock:
+                self._stats["cancelled"] += 1
+            return False
+
+        try:
+            service.execute_search(es_query_str, offset, size, fields)
+        except Exception as e:
+            logger.warning(f"Search prefetch failed: {str(e)}")
+            with self._lock:
+                self._stats["failed"] += 1
+            return False
+
+        with self._lock:
+            self._stats["completed"] += 1
+        return True
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+
+_page_prefetcher = None
+_page_prefetcher_lock = threading.Lock()
+
+
+def get_page_prefetcher():
+    """Return the process-wide prefetcher of next result pages"""
+    global _page_prefetcher
+    if _page_prefetcher is None:
+        with _page_prefetcher_lock:
+            if _page_prefetcher is None:
+                _page_prefetcher = PagePrefetcher(
+                    get_search_result_cache(),
+                    rate=settings.SEARCH_PREFETCH_RATE,
+                    burst=settings.SEARCH_PREFETCH_BURST,
+                    max_workers=settings.SEARCH_PREFETCH_MAX_WORKERS,
+                    max_cache_fill=settings.SEARCH_PREFETCH_MAX_CACHE_FILL,
+                )
+    return _page_prefetcher
+
+
+def close_page_prefetcher():
+    """Stop the prefetcher, dropping prefetches that have not started"""
+    global _page_prefetcher
+    with _page_prefetcher_lock:
+        if _page_prefetcher is not None:
+            _page_prefetcher.close()
+            _page_prefetcher = None
+
+
+atexit.register(close_page_prefetcher)
@@ -0,0 +1,41 @@
+import re
+
+# A "field = value" clause of the converter's query language: at the start of
+# the query, after an opening parenthesis or after AND, OR or NOT. Values are
+# /regexps/ or run up to the next AND / OR, closing parenthesis or the end.
+CLAUSE_PATTERN = re.compile(
+    r"(?:^|\(|\b(?:AND|OR|NOT)\b)\s*(\w+)\s*=\s*"
+    r"(/[^/]*/(?=\s|\)|$)|(?:(?!\s+(?:AND|OR)\b)[^)])+)"
+)
+
+
+def iter_query_clauses(query):
+    """Yield the ``(field, value)`` clauses of a search query, left to right
+
+    A cheap scan for validation and throttling; the query converter does the
+    actual parsing and rejects anything malformed.
+    """
+    for match in CLAUSE_PATTERN.finditer(query.strip()):
+        yield match.group(1), match.group(2).strip()
+
+
+def normalize_query(query):
+    """Spelling-independent form of a search query, for cache keys
+
+    Field names are case-folded and the whitespace around clauses, operators
+    and parentheses collapsed. Values are kept as written, as the converter
+    does.
+    """
+    query = query.strip()
+    parts = []
+    position = 0
+    for match in CLAUSE_PATTERN.finditer(query):
+        parts.extend(_tokens(query[position : match.start(1)]))
+        parts.append(f"{match.group(1).lower()}={match.group(2).strip()}")
+        position = match.end()
+    parts.extend(_tokens(query[position:]))
+    return " ".join(parts)
+
+
+def _tokens(text):
+    return text.replace("(", " ( ").replace(")", " ) ").split()
@@ -0,0 +1,60 @@
+import logging
+
+from django.http import HttpResponse
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+    logger.warning("orjson is not installed, rendering JSON with the stdlib encoder")
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer producing the same compact UTF-8 output through orjson
+
+    Indented output for the browsable API, data orjson cannot encode, and
+    deployments without orjson installed all use the stock renderer. Unlike
+    it, orjson writes NaN and Infinity as null instead of failing.
+    """
+
+    encoder = JSONEncoder()
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS
+        if orjson is not None
+        else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            content = orjson.dumps(
+                data, default=self.encoder.default, option=self.options
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as the stock renderer, for inlining in <script> tags
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+def dumps(data):
+    """Serialize ``data`` to compact JSON bytes, with orjson when installed"""
+    return ORJSONRenderer().render(data)
+
+
+class ORJSONResponse(HttpResponse):
+    """JsonResponse rendered like the API views, for plain Django views"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -1,8 +1,16 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.validators import ProhibitNullCharactersValidator
 from rest_framework import serializers
+from rest_framework.validators import ProhibitSurrogateCharactersValidator
+
+from .fields import get_field_registry
+from .query_syntax import iter_query_clauses
 
 
 class SearchQuerySerializer(serializers.Serializer):
-    query = serializers.CharField(required=True, max_length=50)
+    query = serializers.CharField(required=True, max_length=200)
 
     def validate_query(self, value):
         if not value or len(value.strip()) == 0:
@@ -38,16 +46,158 @@ class SearchQuerySerializer(serializers.Serializer):
                     f"Query contains forbidden pattern: {pattern}"
                 )
 
-        field = value.split("=")[0].strip().lower()
-        allowed_fields = {"hostname", "ip"}
-        if field not in allowed_fields:
-            raise serializers.ValidationError(
-                f"Invalid field name: {field}. Allowed fields are: {', '.join(allowed_fields)}"
-            )
+        fields = [field for field, _ in iter_query_clauses(value)] or [
+            value.split("=")[0]
+        ]
+        registry = get_field_registry()
+        for field in fields:
+            if registry.get(field) is None:
+                raise serializers.ValidationError(
+                    f"Invalid field name: {field.strip().lower()}. "
+                    f"Allowed fields are: {', '.join(registry.names)}"
+                )
 
         return value
 
 
+class SearchBatchQuerySerializer(serializers.Serializer):
+    # Each query is validated on its own so one bad query does not fail the batch
+    queries = serializers.ListField(
+        child=serializers.CharField(allow_blank=True, trim_whitespace=False),
+        allow_empty=False,
+        max_length=settings.SEARCH_BATCH_MAX_QUERIES,
+    )
+
+
+# Serializer fields for the values of Elasticsearch field types, strings otherwise
+RESULT_FIELD_CLASSES = {
+    "long": serializers.IntegerField,
+    "integer": serializers.IntegerField,
+    "short": serializers.IntegerField,
+    "byte": serializers.IntegerField,
+    "double": serializers.FloatField,
+    "float": serializers.FloatField,
+    "half_float": serializers.FloatField,
+    "scaled_float": serializers.FloatField,
+    "boolean": serializers.BooleanField,
+    "object": serializers.DictField,
+}
+
+
 class SearchResultSerializer(serializers.Serializer):
-    Hostname = serializers.CharField()
-    Ip = serializers.ListField(child=serializers.CharField())
+    """A search hit, with one field per searchable field of the index mapping"""
+
+    def get_fields(self):
+        return _result_fields(get_field_registry())
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            # Only validate and render the projected fields
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """Parse a comma separated ``fields`` parameter; None selects every field"""
+        if not value:
+            return None
+
+        registry = get_field_registry()
+        names = {name.strip() for name in value.split(",")} - {""}
+        unknown = sorted(name for name in names if registry.get(name) is None)
+        if unknown or not names:
+            raise serializers.ValidationError(
+                {
+                    "fields": [
+                        f"Invalid fields: {', '.join(unknown)}. Allowed fields "
+                        f"are: {', '.join(registry.names)}"
+                    ]
+                }
+            )
+        # Canonical names, as stored in the documents
+        return tuple(sorted({registry.get(name)["name"] for name in names}))
+
+    @classmethod
+    def render_hits(cls, hits, fields=None):
+        """Project trusted Elasticsearch documents without full validation
+
+        A cheap stand-in for ``is_valid()`` on documents from our own index.
+        Values already in their field's canonical form, such as non-blank
+        strings, are only type-checked against a schema compiled once per
+        projection; anything else goes through the field's own validation.
+        Returns None if any hit would fail ``is_valid()``.
+        """
+        schema = _compile_schema(get_field_registry(), fields)
+        rendered = []
+        try:
+            for hit in hits:
+                document = {}
+                for name, required, to_value in schema:
+                    if name in hit:
+                        document[name] = to_value(hit[name])
+                    elif required:
+                        return None
+                rendered.append(document)
+        except (TypeError, serializers.ValidationError):
+            return None
+        return rendered
+
+
+# Validators every CharField has, checked inline on the fast path
+TEXT_VALIDATORS = (
+    ProhibitNullCharactersValidator,
+    ProhibitSurrogateCharactersValidator,
+)
+
+
+def _result_fields(registry):
+    result_fields = {}
+    for field in registry.fields:
+        field_class = RESULT_FIELD_CLASSES.get(field["type"], serializers.CharField)
+        if field["multi_valued"]:
+            result_fields[field["name"]] = serializers.ListField(child=field_class())
+        else:
+            result_fields[field["name"]] = field_class()
+    return result_fields
+
+
+@lru_cache(maxsize=64)
+def _compile_schema(registry, fields):
+    return tuple(
+        (name, field.required, _value_check(field))
+        for name, field in _result_fields(registry).items()
+        if fields is None or name in fields
+    )
+
+
+def _value_check(field):
+    if isinstance(field, serializers.ListField) and not field.validators:
+        to_item = _value_check(field.child)
+
+        def to_list(value):
+            if type(value) is not list or not (value or field.allow_empty):
+                return field.run_validation(value)
+            return [to_item(item) for item in value]
+
+        return to_list
+
+    if isinstance(field, serializers.CharField) and all(
+        isinstance(validator, TEXT_VALIDATORS) for validator in field.validators
+    ):
+
+        def to_text(value):
+            # ASCII text cannot contain surrogates
+            if (
+                type(value) is not str
+                or not value.isascii()
+                or not (value or field.allow_blank)
+                or (field.trim_whitespace and value != value.strip())
+                or "\x00" in value
+            ):
+                return field.run_validation(value)
+            return value
+
+        return to_text
+
+    return field.run_validation
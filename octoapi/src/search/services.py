@@ -1,48 +1,686 @@
+import asyncio
+import atexit
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from elasticsearch import Elasticsearch
-from functools import lru_cache
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 import logging
 import json
 
+from .cache import (
+    get_query_conversion_cache,
+    get_query_failure_cache,
+    get_search_result_cache,
+)
+from .coalescing import get_single_flight
+from .converter import (
+    QueryConverterMode,
+    QueryConverterUnavailable,
+    get_async_remote_query_converter,
+    get_embedded_query_converter,
+    get_remote_query_converter,
+)
+from .prefetch import get_page_prefetcher
+from .query_syntax import normalize_query
+
 logger = logging.getLogger(__name__)
 
+_es_client = None
+_es_client_lock = threading.Lock()
+
+
+def get_elasticsearch_client():
+    """Return the process-wide pooled Elasticsearch client, creating it on first use"""
+    global _es_client
+    if _es_client is None:
+        with _es_client_lock:
+            if _es_client is None:
+                _es_client = Elasticsearch(
+                    settings.ELASTICSEARCH_HOST, **_elasticsearch_client_options()
+                )
+                logger.info(
+                    "Created pooled Elasticsearch client with "
+                    f"{settings.ELASTICSEARCH_CONNECTIONS_PER_NODE} connections per node"
+                )
+    return _es_client
+
+
+def _elasticsearch_client_options():
+    headers = {}
+    if not settings.ELASTICSEARCH_HTTP_KEEP_ALIVE:
+        headers["connection"] = "close"
+    return {
+        "connections_per_node": settings.ELASTICSEARCH_CONNECTIONS_PER_NODE,
+        "request_timeout": settings.ELASTICSEARCH_REQUEST_TIMEOUT,
+        "max_retries": settings.ELASTICSEARCH_MAX_RETRIES,
+        "retry_on_timeout": True,
+        "headers": headers,
+    }
+
+
+def close_elasticsearch_client():
+    """Close the process-wide Elasticsearch client and its connection pool"""
+    global _es_client
+    with _es_client_lock:
+        if _es_client is not None:
+            try:
+                _es_client.close()
+            except Exception as e:
+                logger.warning(f"Failed to close Elasticsearch client: {str(e)}")
+            finally:
+                _es_client = None
+
+
+atexit.register(close_elasticsearch_client)
+
+
+_async_es_client = None
+_async_es_client_loop = None
+
+
+def get_async_elasticsearch_client():
+    """Return the pooled AsyncElasticsearch client of the running event loop
+
+    Async connection pools are bound to the event loop they were opened on,
+    so a new client is created when called from a different loop.
+    """
+    global _async_es_client, _async_es_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_es_client is None or _async_es_client_loop is not loop:
+        _async_es_client = AsyncElasticsearch(
+            settings.ELASTICSEARCH_HOST,
+            node_class="httpxasync",
+            **_elasticsearch_client_options(),
+        )
+        _async_es_client_loop = loop
+    return _async_es_client
+
+
+async def close_async_elasticsearch_client():
+    """Close the AsyncElasticsearch client and its connection pool"""
+    global _async_es_client, _async_es_client_loop
+    if _async_es_client is not None:
+        client = _async_es_client
+        _async_es_client = _async_es_client_loop = None
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close AsyncElasticsearch client: {str(e)}")
+
+
+def get_elasticsearch_pool_stats():
+    """Report connection pool usage for each node of the shared client"""
+    if _es_client is None:
+        return []
+
+    stats = []
+    for node in _es_client.transport.node_pool.all():
+        pool = getattr(node, "pool", None)
+        max_connections = node.config.connections_per_node
+        # urllib3 keeps one queue slot per connection that is not checked out
+        idle_slots = pool.pool.qsize() if pool is not None and pool.pool else 0
+        stats.append(
+            {
+                "node": node.base_url,
+                "max_connections": max_connections,
+                "in_use": max(max_connections - idle_slots, 0),
+                "connections_opened": getattr(pool, "num_connections", 0),
+                "requests": getattr(pool, "num_requests", 0),
+            }
+        )
+    return stats
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """A window of search hits together with the total number of matches"""
+
+    hits: list = field(default_factory=list)
+    total: int = 0
+
+
+@dataclass(frozen=True)
+class CursorSearchResult:
+    """A batch of search hits read through a point-in-time with search_after"""
+
+    hits: list = field(default_factory=list)
+    pit_id: str = None
+    search_after: list = None
+
+    @property
+    def exhausted(self):
+        return self.pit_id is None
+
+
+def _search_body(converted):
+    # Only the query goes on to Elasticsearch, not its estimated cost
+    return {"query": converted["query"]}
+
+
+def _failure_record(error):
+    # Exceptions do not survive the shared cache tier, keep what the view answers
+    if isinstance(error, QueryConverterUnavailable):
+        return {
+            "unavailable": True,
+            "details": str(error),
+            "retry_after": error.retry_after,
+        }
+    return {"unavailable": False, "details": str(error)}
+
+
+def _failure_error(record):
+    if record["unavailable"]:
+        return QueryConverterUnavailable(
+            record["details"], retry_after=record["retry_after"]
+        )
+    return ValueError(record["details"])
+
+
+def _fields_key(fields):
+    # Projected and full documents of the same page are cached apart
+    return "*" if fields is None else ",".join(fields)
+
 
 class SearchService:
-    def __init__(self, elasticsearch_client=None):
-        self.es_client = elasticsearch_client or Elasticsearch(
-            settings.ELASTICSEARCH_HOST
+    def __init__(
+        self,
+        elasticsearch_client=None,
+        result_cache=None,
+        single_flight=None,
+        conversion_cache=None,
+        failure_cache=None,
+    ):
+        self.es_client = elasticsearch_client or get_elasticsearch_client()
+        self.result_cache = result_cache or get_search_result_cache()
+        self.single_flight = single_flight or get_single_flight()
+        self.conversion_cache = conversion_cache or get_query_conversion_cache()
+        self.failure_cache = failure_cache or get_query_failure_cache()
+
+    def search(self, query, offset=0, size=20, fields=None):
+        """Main search method combining conversion and execution
+
+        Concurrent searches converting to the same Elasticsearch query share
+        a single Elasticsearch round trip, however the query was spelled.
+        ``fields`` limits the returned documents to those source fields. With
+        ``SEARCH_PREFETCH_ENABLED`` the next page window is then fetched into
+        the result cache in the background.
+        """
+        es_query_str = self._canonical_query(query)
+        logger.info(f"Elasticsearch query: {es_query_str}")
+        key = self.single_flight.make_key(es_query_str, offset, size, fields)
+        return self.single_flight.do(
+            key, lambda: self._search(es_query_str, offset, size, fields)
         )
 
-    def search(self, query):
-        """Main search method combining conversion and execution"""
-        es_query = self.convert_query(query)
-        logger.info(f"Elasticsearch query: {es_query}")
+    def _search(self, es_query_str, offset, size, fields=None):
+        result = self.execute_search(es_query_str, offset, size, fields)
+        if settings.SEARCH_PREFETCH_ENABLED and offset + size < result.total:
+            get_page_prefetcher().schedule(
+                self, es_query_str, offset + size, size, fields
+            )
+        return result
+
+    def count(self, query):
+        """Count the documents matching a query without fetching any of them"""
+        es_query_str = self._canonical_query(query)
+        key = self.single_flight.make_key("count", es_query_str)
+        return self.single_flight.do(key, lambda: self.execute_count(es_query_str))
+
+    def exists(self, query):
+        """Tell whether any document matches a query"""
+        es_query_str = self._canonical_query(query)
+        key = self.single_flight.make_key("exists", es_query_str)
+        return self.single_flight.do(key, lambda: self.execute_exists(es_query_str))
+
+    def _canonical_query(self, query):
         # Convert dict to string for caching
-        es_query_str = json.dumps(es_query, sort_keys=True)
-        return self.execute_search(es_query_str)
+        return json.dumps(self.convert_query(query), sort_keys=True)
+
+    def cursor_search(self, query, size=20, pit_id=None, search_after=None):
+        """Search method for cursor pagination over a point-in-time"""
+        es_query = self.convert_query(query)
+        logger.info(f"Elasticsearch cursor query: {es_query}")
+        return self.execute_cursor_search(es_query, size, pit_id, search_after)
+
+    def iter_search_batches(self, query, batch_size=1000):
+        """Yield every matching document in batches of at most ``batch_size``
+
+        Batches are read through a point-in-time with search_after, so memory
+        use stays constant however many documents match. The point-in-time is
+        released even if the consumer stops iterating early.
+        """
+        es_query = self.convert_query(query)
+        logger.info(f"Elasticsearch export query: {es_query}")
+        result = self.execute_cursor_search(es_query, batch_size)
+        try:
+            while True:
+                if result.hits:
+                    yield result.hits
+                if result.exhausted:
+                    return
+                result = self.execute_cursor_search(
+                    es_query, batch_size, result.pit_id, result.search_after
+                )
+        finally:
+            if not result.exhausted:
+                self.close_point_in_time(result.pit_id)
+
+    def multi_search(self, queries, offset=0, size=20):
+        """Run several searches with one conversion step and one _msearch
+
+        Returns a SearchResult or the exception that query failed with for
+        every query, in the order the queries were given.
+        """
+        results = [None] * len(queries)
+        pending = []
+        for index, es_query in enumerate(self.convert_queries(queries)):
+            if isinstance(es_query, Exception):
+                results[index] = es_query
+                continue
+
+            es_query_str = json.dumps(es_query, sort_keys=True)
+            cache_key = self.result_cache.make_key(
+                es_query_str, offset, size, _fields_key(None)
+            )
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, cache_key, es_query))
+
+        if pending:
+            self._execute_multi_search(pending, results, offset, size)
+        return results
+
+    def _execute_multi_search(self, pending, results, offset, size):
+        body = []
+        for _, _, es_query in pending:
+            body.append({"index": settings.ELASTICSEARCH_INDEX})
+            body.append(self._page_body(es_query, offset, size))
+
+        try:
+            response = self.es_client.msearch(body=body)
+        except Exception as e:
+            logger.error(f"Elasticsearch multi search failed: {str(e)}", exc_info=True)
+            for index, _, _ in pending:
+                results[index] = e
+            return
+
+        for (index, cache_key, _), item in zip(pending, response["responses"]):
+            if "error" in item:
+                error = item["error"]
+                reason = (
+                    error.get("reason", error) if isinstance(error, dict) else error
+                )
+                results[index] = RuntimeError(f"Elasticsearch search failed: {reason}")
+                continue
+            result = self._to_search_result(item["hits"])
+            self.result_cache.set(cache_key, result)
+            results[index] = result
+
+    def convert_queries(self, queries):
+        """Convert several queries, converting duplicates only once
+
+        Returns the Elasticsearch query or the exception conversion failed
+        with for every query, in order.
+        """
+        return [
+            converted if isinstance(converted, Exception) else _search_body(converted)
+            for converted in self.convert_all(queries)
+        ]
+
+    def query_cost(self, query):
+        """The converter's estimated cost of a query, None if conversion failed"""
+        try:
+            return self.convert(query)["cost"]
+        except Exception:
+            return None
+
+    def query_costs(self, queries):
+        """The converter's estimated cost of every query, None if it failed"""
+        return [
+            None if isinstance(converted, Exception) else converted["cost"]
+            for converted in self.convert_all(queries)
+        ]
+
+    def convert_all(self, queries):
+        """Convert several queries with their costs, like ``convert``
+
+        Queries converted before come from the cache, and a remote converter
+        gets the rest in one batch request. Returns the conversion or the
+        exception it failed with for every query, in order.
+        """
+        converted = {}
+        for query in dict.fromkeys(queries):
+            cached = self.conversion_cache.get(self._conversion_key(query))
+            if cached is None:
+                failure = self.failure_cache.get(self._failure_key(query))
+                cached = None if failure is None else _failure_error(failure)
+            if cached is not None:
+                converted[query] = cached
+
+        missing = [query for query in dict.fromkeys(queries) if query not in converted]
+        if missing:
+            fresh = None
+            if settings.QUERY_CONVERTER_MODE != QueryConverterMode.EMBEDDED:
+                fresh = self._convert_batch(missing)
+            if fresh is None:
+                fresh = self._convert_concurrently(missing)
+            converted.update(fresh)
+        return [converted[query] for query in queries]
+
+    def _convert_batch(self, queries):
+        try:
+            results = get_remote_query_converter().convert_batch(queries)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (404, 405):
+                # A converter without the batch endpoint, convert one by one
+                logger.warning("Query converter has no batch endpoint")
+                return None
+            logger.error(f"Batch query conversion failed: {str(e)}")
+            results = [e] * len(queries)
+        except QueryConverterUnavailable as e:
+            logger.error(f"Batch query conversion failed: {str(e)}")
+            results = [e] * len(queries)
+
+        for query, converted in zip(queries, results):
+            if isinstance(converted, Exception):
+                self._remember_failure(query, converted)
+            else:
+                self.conversion_cache.set(self._conversion_key(query), converted)
+        return dict(zip(queries, results))
+
+    def _convert_concurrently(self, queries):
+        max_workers = min(len(queries), settings.QUERY_CONVERTER_MAX_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            futures = {query: executor.submit(self.convert, query) for query in queries}
+
+        converted = {}
+        for query, future in futures.items():
+            error = future.exception()
+            converted[query] = error if error is not None else future.result()
+        return converted
 
     def convert_query(self, query):
         """Convert search query using converter service"""
+        return _search_body(self.convert(query))
+
+    def convert(self, query):
+        """Convert a query, returning its Elasticsearch query and estimated cost
+
+        Conversions are cached under the normalized query, so the search that
+        follows the cost throttle's conversion does not convert it again, and
+        concurrent conversions of the same query share one converter call.
+        Failed conversions are cached for ``SEARCH_CONVERSION_FAILURE_TTL``
+        seconds and raised again as ``ValueError`` or
+        ``QueryConverterUnavailable``.
+        """
+        cache_key = self._conversion_key(query)
+        converted = self.conversion_cache.get(cache_key)
+        if converted is not None:
+            return converted
+        self._raise_failure(query)
+
+        key = self.single_flight.make_key("convert", normalize_query(query))
+        return self.single_flight.do(key, lambda: self._convert(query, cache_key))
+
+    def _convert(self, query, cache_key):
+        # A leader that finished just before this one started cached it
+        converted = self.conversion_cache.get(cache_key)
+        if converted is not None:
+            return converted
+        self._raise_failure(query)
+
+        if settings.QUERY_CONVERTER_MODE == QueryConverterMode.EMBEDDED:
+            converter = get_embedded_query_converter()
+        else:
+            converter = get_remote_query_converter()
+
+        try:
+            converted = converter.convert(query)
+        except (ValueError, requests.RequestException, QueryConverterUnavailable) as e:
+            logger.error(f"Query conversion failed: {str(e)}")
+            self._remember_failure(query, e)
+            raise
+
+        self.conversion_cache.set(cache_key, converted)
+        return converted
+
+    def _conversion_key(self, query):
+        return self.conversion_cache.make_key(normalize_query(query))
+
+    def _raise_failure(self, query):
+        failure = self.failure_cache.get(self._failure_key(query))
+        if failure is not None:
+            raise _failure_error(failure)
+
+    def _remember_failure(self, query, error):
+        self.failure_cache.set(self._failure_key(query), _failure_record(error))
+
+    def _failure_key(self, query):
+        return self.failure_cache.make_key(normalize_query(query))
+
+    def execute_search(self, es_query_str, offset=0, size=20, fields=None):
+        """Execute search query on Elasticsearch for a single page window"""
+        cache_key = self.result_cache.make_key(
+            es_query_str, offset, size, _fields_key(fields)
+        )
+        result = self.result_cache.get(cache_key)
+        if result is not None:
+            return result
+
+        try:
+            body = self._page_body(json.loads(es_query_str), offset, size, fields)
+            response = self.es_client.search(
+                index=settings.ELASTICSEARCH_INDEX, body=body
+            )
+            result = self._to_search_result(response["hits"])
+        except Exception as e:
+            logger.error(f"Elasticsearch search failed: {str(e)}", exc_info=True)
+            raise
+
+        self.result_cache.set(cache_key, result)
+        return result
+
+    def execute_count(self, es_query_str):
+        """Count matching documents with the _count API"""
+        cache_key = self.result_cache.make_key(es_query_str, "count")
+        count = self.result_cache.get(cache_key)
+        if count is not None:
+            return count
+
         try:
-            response = requests.post(
-                settings.QUERY_CONVERTER_SERVICE_URL, json={"query": query}
+            response = self.es_client.count(
+                index=settings.ELASTICSEARCH_INDEX, body=json.loads(es_query_str)
             )
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            logger.error(f"Query conversion failed: {str(e)}", exc_info=True)
+            count = response["count"]
+        except Exception as e:
+            logger.error(f"Elasticsearch count failed: {str(e)}", exc_info=True)
             raise
 
-    @lru_cache(maxsize=1000)
-    def execute_search(self, es_query_str):
-        """Execute search query on Elasticsearch"""
+        self.result_cache.set(cache_key, count)
+        return count
+
+    def execute_exists(self, es_query_str):
+        """Check for a match, stopping each shard at its first matching document"""
+        cache_key = self.result_cache.make_key(es_query_str, "exists")
+        exists = self.result_cache.get(cache_key)
+        if exists is not None:
+            return exists
+
         try:
-            es_query = json.loads(es_query_str)
+            body = {**json.loads(es_query_str), "size": 0, "terminate_after": 1}
             response = self.es_client.search(
-                index=settings.ELASTICSEARCH_INDEX, body=es_query
+                index=settings.ELASTICSEARCH_INDEX, body=body
             )
-            return [hit["_source"] for hit in response["hits"]["hits"]]
+            exists = self._get_total(response["hits"]) > 0
+        except Exception as e:
+            logger.error(f"Elasticsearch exists check failed: {str(e)}", exc_info=True)
+            raise
+
+        self.result_cache.set(cache_key, exists)
+        return exists
+
+    @staticmethod
+    def _page_body(es_query, offset, size, fields=None):
+        body = {**es_query, "from": offset, "size": size, "track_total_hits": True}
+        if fields is not None:
+            # Elasticsearch only loads and ships the requested source fields
+            body["_source"] = {"includes": list(fields)}
+        return body
+
+    @classmethod
+    def _to_search_result(cls, hits):
+        return SearchResult(
+            hits=[hit["_source"] for hit in hits["hits"]],
+            total=cls._get_total(hits),
+        )
+
+    @staticmethod
+    def _get_total(hits):
+        """Read the total match count from an Elasticsearch ``hits`` section"""
+        total = hits.get("total", 0)
+        # Elasticsearch 7+ returns {"value": n, "relation": "eq"}
+        if isinstance(total, dict):
+            return total.get("value", 0)
+        return total
+
+    def execute_cursor_search(self, es_query, size=20, pit_id=None, search_after=None):
+        """Execute a search_after query against a point-in-time snapshot
+
+        A new point-in-time is opened when no ``pit_id`` is given, so every page
+        of a cursor sees the same index snapshot while the index is written to.
+        The point-in-time is closed once the last batch has been read.
+        """
+        try:
+            keep_alive = settings.ELASTICSEARCH_PIT_KEEP_ALIVE
+            if pit_id is None:
+                pit_id = self.es_client.open_point_in_time(
+                    index=settings.ELASTICSEARCH_INDEX, keep_alive=keep_alive
+                )["id"]
+
+            body = {
+                **es_query,
+                "size": size,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                # _shard_doc is the cheapest stable tiebreaker for a point-in-time
+                "sort": [{"_shard_doc": "asc"}],
+                "track_total_hits": False,
+            }
+            if search_after:
+                body["search_after"] = search_after
+
+            response = self.es_client.search(body=body)
+            hits = response["hits"]["hits"]
+            pit_id = response.get("pit_id", pit_id)
+            sources = [hit["_source"] for hit in hits]
+
+            if len(hits) < size:
+                self.close_point_in_time(pit_id)
+                return CursorSearchResult(hits=sources)
+
+            return CursorSearchResult(
+                hits=sources, pit_id=pit_id, search_after=hits[-1]["sort"]
+            )
+        except Exception as e:
+            logger.error(f"Elasticsearch cursor search failed: {str(e)}", exc_info=True)
+            raise
+
+    def close_point_in_time(self, pit_id):
+        """Release a point-in-time, ignoring ones that already expired"""
+        try:
+            self.es_client.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"Failed to close point-in-time: {str(e)}")
+
+
+class AsyncSearchService:
+    """Non-blocking counterpart of ``SearchService`` for the ASGI search path
+
+    Converter calls and Elasticsearch searches are awaited on the event loop,
+    so a worker can keep many searches in flight at once.
+    """
+
+    def __init__(
+        self,
+        elasticsearch_client=None,
+        result_cache=None,
+        conversion_cache=None,
+        failure_cache=None,
+    ):
+        self.es_client = elasticsearch_client or get_async_elasticsearch_client()
+        self.result_cache = result_cache or get_search_result_cache()
+        self.conversion_cache = conversion_cache or get_query_conversion_cache()
+        self.failure_cache = failure_cache or get_query_failure_cache()
+
+    async def search(self, query, offset=0, size=20, fields=None):
+        """Search for a single page window of results"""
+        es_query = await self.convert_query(query)
+        es_query_str = json.dumps(es_query, sort_keys=True)
+        return await self.execute_search(es_query_str, offset, size, fields)
+
+    async def convert_query(self, query):
+        """Convert search query using converter service"""
+        # Usually converted already, by the cost throttle
+        cache_key = self.conversion_cache.make_key(normalize_query(query))
+        converted = await sync_to_async(
+            self.conversion_cache.get, thread_sensitive=False
+        )(cache_key)
+        if converted is not None:
+            return _search_body(converted)
+        failure_key = self.failure_cache.make_key(normalize_query(query))
+        failure = await sync_to_async(self.failure_cache.get, thread_sensitive=False)(
+            failure_key
+        )
+        if failure is not None:
+            raise _failure_error(failure)
+
+        try:
+            if settings.QUERY_CONVERTER_MODE == QueryConverterMode.EMBEDDED:
+                # Conversion is pure CPU work measured in microseconds
+                converted = get_embedded_query_converter().convert(query)
+            else:
+                converted = await get_async_remote_query_converter().convert(query)
+        except Exception as e:
+            logger.error(f"Query conversion failed: {str(e)}")
+            await sync_to_async(self.failure_cache.set, thread_sensitive=False)(
+                failure_key, _failure_record(e)
+            )
+            raise
+
+        await sync_to_async(self.conversion_cache.set, thread_sensitive=False)(
+            cache_key, converted
+        )
+        return _search_body(converted)
+
+    async def execute_search(self, es_query_str, offset=0, size=20, fields=None):
+        """Execute search query on Elasticsearch for a single page window"""
+        cache_key = self.result_cache.make_key(
+            es_query_str, offset, size, _fields_key(fields)
+        )
+        # The shared cache tier may do network I/O, keep it off the event loop
+        result = await sync_to_async(self.result_cache.get, thread_sensitive=False)(
+            cache_key
+        )
+        if result is not None:
+            return result
+
+        try:
+            body = SearchService._page_body(
+                json.loads(es_query_str), offset, size, fields
+            )
+            response = await self.es_client.search(
+                index=settings.ELASTICSEARCH_INDEX, body=body
+            )
+            result = SearchService._to_search_result(response["hits"])
         except Exception as e:
             logger.error(f"Elasticsearch search failed: {str(e)}", exc_info=True)
             raise
+
+        await sync_to_async(self.result_cache.set, thread_sensitive=False)(
+            cache_key, result
+        )
+        return result
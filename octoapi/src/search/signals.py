@@ -0,0 +1,11 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_principal_cache
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_principal(sender, instance, **kwargs):
+    """Stop authenticating with a cached copy of a changed or deleted user"""
+    get_principal_cache().invalidate(instance)
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class FsyncPolicy:
+    """Constants for when spooled data is forced to disk."""
+
+    ALWAYS = "always"
+    SEGMENT = "segment"
+    NEVER = "never"
+
+
+class AuditSpool:
+    """Append-only, segmented on-disk spool for audit messages.
+
+    Each process appends newline-delimited JSON to its own open segment, which
+    is sealed once it grows past ``segment_bytes``. Sealed segments are claimed
+    for replay with an atomic rename, so several workers can share a directory.
+    Segment names start with a timestamp so replay goes oldest first.
+
+    File names:
+        ``<ts>-<writer pid>.open``                  being appended to
+        ``<ts>-<writer pid>.log``                   sealed, waiting for replay
+        ``<ts>-<writer pid>.<claimer pid>.replay``  being replayed
+    """
+
+    def __init__(
+        self,
+        directory,
+        segment_bytes=1024 * 1024,
+        max_bytes=100 * 1024 * 1024,
+        fsync=FsyncPolicy.SEGMENT,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._usage = None
+        self._usage_checked_at = 0.0
+        self._stats = {"spooled": 0, "dropped": 0}
+        if self.directory.exists():
+            self._recover_orphans()
+
+    def append(self, messages):
+        """Append messages to the open segment; returns False if the spool is full"""
+        data = "".join(
+            json.dumps(message, separators=(",", ":")) + "\n" for message in messages
+        ).encode("utf-8")
+
+        with self._lock:
+            if self._disk_usage() + len(data) > self.max_bytes:
+                self._stats["dropped"] += len(messages)
+                return False
+
+            if self._file is None:
+                self._open_segment()
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync == FsyncPolicy.ALWAYS:
+                os.fsync(self._file.fileno())
+            self._usage += len(data)
+            self._stats["spooled"] += len(messages)
+
+            if self._file.tell() >= self.segment_bytes:
+                self._seal_segment()
+        return True
+
+    def claim(self):
+        """Claim the oldest sealed segment, returning ``(path, messages)`` or None"""
+        with self._lock:
+            segments = self._sealed_segments()
+            if not segments and self._file is not None and self._file.tell() > 0:
+                # Nothing else to replay, so hand over the segment being written
+                self._seal_segment()
+                segments = self._sealed_segments()
+
+            for segment in segments:
+                claimed = segment.with_name(f"{segment.stem}.{os.getpid()}.replay")
+                try:
+                    segment.rename(claimed)
+                except FileNotFoundError:
+                    # Another worker claimed it first
+                    continue
+                return claimed, self._read_segment(claimed)
+        return None
+
+    def release(self, path, remaining=None):
+        """Hand a claimed segment back for a later replay
+
+        Without ``remaining`` the whole segment is unclaimed as it is, otherwise
+        only the ``remaining`` messages are spooled again.
+        """
+        if remaining is None:
+            stem = path.name[: -len(".replay")].rsplit(".", 1)[0]
+            path.rename(path.with_name(f"{stem}.log"))
+            return
+        if remaining:
+            self.append(remaining)
+        self.remove(path)
+
+    def remove(self, path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._usage is not None:
+                self._usage = max(self._usage - size, 0)
+
+    def has_pending(self):
+        if not self.directory.exists():
+            return False
+        return any(self.directory.glob("*.log")) or (
+            self._file is not None and self._file.tell() > 0
+        )
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._seal_segment()
+
+    def stats(self):
+        with self._lock:
+            segments = (
+                len(list(self.directory.iterdir())) if self.directory.exists() else 0
+            )
+            return {**self._stats, "segments": segments, "bytes": self._disk_usage()}
+
+    def _open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / f"{time.time_ns():020d}-{os.getpid()}.open"
+        self._file = open(self._path, "ab")
+
+    def _seal_segment(self):
+        if self.fsync != FsyncPolicy.NEVER:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        if self._path.stat().st_size == 0:
+            self._path.unlink()
+        else:
+            self._path.rename(self._path.with_suffix(".log"))
+        self._file = None
+        self._path = None
+
+    def _sealed_segments(self):
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.log"))
+
+    def _read_segment(self, path):
+        messages = []
+        with open(path, "rb") as segment:
+            for line in segment:
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    logger.warning(f"Skipping corrupt audit spool record in {path}")
+        return messages
+
+    def _disk_usage(self):
+        # Other workers write to the same directory, so rescan it now and then
+        now = time.monotonic()
+        if self._usage is None or now - self._usage_checked_at > 1:
+            self._usage = (
+                sum(path.stat().st_size for path in self.directory.iterdir())
+                if self.directory.exists()
+                else 0
+            )
+            self._usage_checked_at = now
+        return self._usage
+
+    def _recover_orphans(self):
+        """Make segments left behind by dead processes replayable again"""
+        for path in self.directory.iterdir():
+            name = path.name
+            try:
+                if name.endswith(".open"):
+                    owner = int(name[: -len(".open")].split("-")[1])
+                    target = path.with_suffix(".log")
+                elif name.endswith(".replay"):
+                    stem, owner = name[: -len(".replay")].rsplit(".", 1)
+                    owner = int(owner)
+                    target = path.with_name(f"{stem}.log")
+                else:
+                    continue
+            except (IndexError, ValueError):
+                continue
+
+            if not _pid_alive(owner):
+                logger.info(f"Recovering orphaned audit spool segment {name}")
+                try:
+                    path.rename(target)
+                except FileNotFoundError:
+                    pass
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
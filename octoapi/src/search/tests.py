@@ -1,20 +1,99 @@
+import asyncio
 import base64
-from unittest.mock import patch, MagicMock
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, patch, MagicMock
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ValidationError
+from rest_framework.throttling import UserRateThrottle
+import httpx
+from pika.exceptions import NackError, UnroutableError
 import requests
 
+from search.authentication import get_principal_cache
+from search.cache import (
+    SearchResultCache,
+    get_query_conversion_cache,
+    get_query_failure_cache,
+    get_search_response_cache,
+    get_search_result_cache,
+)
+from search.coalescing import SingleFlight
+from search.fields import FieldRegistry, get_field_registry, reset_field_registry
+from search.converter import (
+    EMBEDDED_CONVERTER_PACKAGE,
+    CircuitBreaker,
+    QueryConverterUnavailable,
+    RemoteQueryConverter,
+    close_remote_query_converter,
+    get_embedded_query_converter,
+)
+from search.messaging import (
+    SEARCH_QUERY_QUEUE,
+    AuditPublisher,
+    RabbitMQClient,
+    UndeliveredMessages,
+    close_audit_publisher,
+    get_audit_publisher,
+)
+from search.pagination import SearchCursorPagination
+from search.query_syntax import normalize_query
+from search.prefetch import PagePrefetcher, close_page_prefetcher, get_page_prefetcher
+from search.renderers import ORJSONRenderer
+from search.serializers import SearchQuerySerializer, SearchResultSerializer
+from search.spool import AuditSpool
+from search.throttles import SearchCostRateThrottle, SlidingWindowRateThrottle
+from search.services import (
+    CursorSearchResult,
+    SearchService,
+    close_elasticsearch_client,
+    get_elasticsearch_client,
+)
+from search.views import SearchExportView
 
+
+@override_settings(AUDIT_SPOOL_DIR="")
 class SearchViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = User.objects.create_user(username="octoAdmin")
         self.auth_token = base64.b64encode(b"octoAdmin").decode("utf-8")
         self.client.credentials(HTTP_AUTHORIZATION=f"Octoxlabs {self.auth_token}")
+        # Every test gets its own (possibly mocked) shared Elasticsearch client
+        close_elasticsearch_client()
+        self.addCleanup(close_elasticsearch_client)
+        cache.clear()
+        get_search_result_cache().clear()
+        get_search_response_cache().clear()
+        get_query_conversion_cache().clear()
+        get_query_failure_cache().clear()
+        # Audit messages still queued after a test are flushed to a mock broker
+        pika_patcher = patch("search.messaging.pika.BlockingConnection")
+        pika_patcher.start()
+        self.addCleanup(pika_patcher.stop)
+        close_audit_publisher()
+        self.addCleanup(close_audit_publisher)
+        get_principal_cache().clear()
+        # Breaker state must not leak between tests
+        close_remote_query_converter()
+        self.addCleanup(close_remote_query_converter)
+        close_page_prefetcher()
+        self.addCleanup(close_page_prefetcher)
 
-    @patch("search.services.requests.post")
+    @patch("search.converter.requests.Session.post")
     @patch("search.services.Elasticsearch")
     @patch("search.messaging.pika.BlockingConnection")
     def test_search_success(self, mock_pika, mock_es, mock_requests_post):
@@ -63,7 +142,8 @@ class SearchViewTests(TestCase):
         # Verify Elasticsearch was called
         mock_es.return_value.search.assert_called_once()
 
-        # Verify logging was attempted
+        # Verify logging was attempted by the background publisher
+        self.assertTrue(get_audit_publisher().flush(timeout=5))
         mock_channel.queue_declare.assert_called_once()
         mock_channel.basic_publish.assert_called_once()
 
@@ -86,7 +166,7 @@ class SearchViewTests(TestCase):
         # Assert validation error
         self.assertEqual(response.status_code, 400)
 
-    @patch("search.services.requests.post")
+    @patch("search.converter.requests.Session.post")
     @patch("search.services.Elasticsearch")
     @patch("search.messaging.pika.BlockingConnection")
     def test_pagination(self, mock_pika, mock_es, mock_requests_post):
@@ -150,10 +230,42 @@ class SearchViewTests(TestCase):
             format="json",
         )
 
-        self.assertEqual(response.status_code, 500)
-        self.assertIn("error", response.data)
-        self.assertEqual(response.data["error"], "Search failed")
-        self.assertEqual(response.data["details"], "Invalid page.")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data["detail"], "Invalid page.")
+
+        response = self.client.post(
+            f"{reverse('search')}?page=last",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+        # An unusable page_size falls back to the default page size
+        response = self.client.post(
+            f"{reverse('search')}?page_size=abc",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_es_instance.search.call_args.kwargs["body"]["size"], 20)
+
+        # In a batch only the search whose page is out of range fails
+        mock_es_instance.msearch.return_value = {
+            "responses": [mock_es_instance.search.return_value]
+        }
+        response = self.client.post(
+            f"{reverse('search-batch')}?page=2&page_size=10",
+            {"queries": ["Hostname = octoxlabs*"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["error"], "Invalid page")
+        response = self.client.post(
+            f"{reverse('search-batch')}?page=0",
+            {"queries": ["Hostname = octoxlabs*"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
 
     def test_invalid_query_patterns(self):
         # Test SQL injection pattern
@@ -174,7 +286,15 @@ class SearchViewTests(TestCase):
         )
         self.assertEqual(response.status_code, 400)
 
-    @patch("search.services.requests.post")
+        # Test invalid field in a later clause
+        response = self.client.post(
+            reverse("search"),
+            {"query": "(Hostname = octoxlabs* OR Status = active)"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @patch("search.converter.requests.Session.post")
     def test_converter_service_error(self, mock_requests_post):
         # Mock converter service error
         mock_requests_post.side_effect = requests.RequestException(
@@ -185,10 +305,30 @@ class SearchViewTests(TestCase):
             reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
         )
 
-        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.status_code, 503)
         self.assertIn("error", response.data)
 
-    @patch("search.services.requests.post")
+    @override_settings(QUERY_CONVERTER_BREAKER_FAILURE_THRESHOLD=2)
+    @patch("search.converter.requests.Session.post")
+    def test_open_converter_circuit_fails_fast(self, mock_requests_post):
+        mock_requests_post.side_effect = requests.Timeout("Read timed out")
+
+        for i in range(2):
+            response = self.client.post(
+                reverse("search"), {"query": f"Hostname = octoxlabs{i}*"}, format="json"
+            )
+            self.assertEqual(response.status_code, 503)
+
+        response = self.client.post(
+            reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data["details"], "Query converter circuit is open")
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(mock_requests_post.call_count, 2)
+
+    @patch("search.converter.requests.Session.post")
     @patch("search.services.Elasticsearch")
     def test_elasticsearch_error(self, mock_es, mock_requests_post):
         # Mock converter response
@@ -208,9 +348,10 @@ class SearchViewTests(TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertIn("error", response.data)
 
+    @override_settings(AUDIT_PUBLISHER_MAX_RETRIES=0)
     @patch("search.messaging.pika.BlockingConnection")
     @patch("search.services.Elasticsearch")
-    @patch("search.services.requests.post")
+    @patch("search.converter.requests.Session.post")
     def test_rabbitmq_logging_failure(self, mock_requests_post, mock_es, mock_pika):
         # Mock converter response
         mock_response = MagicMock()
@@ -244,4 +385,1652 @@ class SearchViewTests(TestCase):
         self.assertEqual(len(response.data["results"]), 1)
 
         # Verify RabbitMQ connection was attempted
+        self.assertTrue(get_audit_publisher().flush(timeout=5))
         mock_pika.assert_called_once()
+        self.assertEqual(get_audit_publisher().stats()["failed"], 1)
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_pagination_window_pushed_to_elasticsearch(
+        self, mock_pika, mock_es, mock_requests_post
+    ):
+        # Mock converter response
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"query": {"match_all": {}}}
+        mock_requests_post.return_value = mock_response
+
+        # Elasticsearch only returns the requested window but reports the full total
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "total": {"value": 25, "relation": "eq"},
+                "hits": [
+                    {"_source": {"Hostname": "octoxlabs11", "Ip": ["10.0.0.11"]}},
+                    {"_source": {"Hostname": "octoxlabs12", "Ip": ["10.0.0.12"]}},
+                ],
+            }
+        }
+
+        response = self.client.post(
+            f"{reverse('search')}?page=3&page_size=5",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total"], 25)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        body = mock_es.return_value.search.call_args.kwargs["body"]
+        self.assertEqual(body["from"], 10)
+        self.assertEqual(body["size"], 5)
+        self.assertTrue(body["track_total_hits"])
+        self.assertEqual(body["query"], {"match_all": {}})
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_cursor_pagination(self, mock_pika, mock_es, mock_requests_post):
+        # Mock converter response
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"query": {"match_all": {}}}
+        mock_requests_post.return_value = mock_response
+
+        mock_es_instance = mock_es.return_value
+        mock_es_instance.open_point_in_time.return_value = {"id": "pit-1"}
+        mock_es_instance.search.side_effect = [
+            {
+                "pit_id": "pit-2",
+                "hits": {
+                    "hits": [
+                        {
+                            "_source": {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"]},
+                            "sort": [0],
+                        },
+                        {
+                            "_source": {"Hostname": "octoxlabs02", "Ip": ["10.0.0.2"]},
+                            "sort": [1],
+                        },
+                    ]
+                },
+            },
+            {
+                "pit_id": "pit-3",
+                "hits": {
+                    "hits": [
+                        {
+                            "_source": {"Hostname": "octoxlabs03", "Ip": ["10.0.0.3"]},
+                            "sort": [2],
+                        }
+                    ]
+                },
+            },
+        ]
+
+        # First page opens a point-in-time and returns a cursor
+        response = self.client.post(
+            f"{reverse('search')}?cursor=&page_size=2",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+        next_cursor = response.data["next_cursor"]
+        self.assertIsNotNone(next_cursor)
+        mock_es_instance.open_point_in_time.assert_called_once()
+
+        # Second page continues from the cursor and exhausts the results
+        response = self.client.post(
+            f"{reverse('search')}?cursor={next_cursor}&page_size=2",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next_cursor"])
+
+        body = mock_es_instance.search.call_args.kwargs["body"]
+        self.assertEqual(body["pit"]["id"], "pit-2")
+        self.assertEqual(body["search_after"], [1])
+        self.assertNotIn("from", body)
+        mock_es_instance.open_point_in_time.assert_called_once()
+        mock_es_instance.close_point_in_time.assert_called_once_with(id="pit-3")
+
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_cursor_for_different_query_rejected(self, mock_pika):
+        cursor = SearchCursorPagination().encode_cursor(
+            CursorSearchResult(pit_id="pit-1", search_after=[1]), "Hostname = other*"
+        )
+
+        response = self.client.post(
+            f"{reverse('search')}?cursor={cursor}",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["details"], "Invalid cursor")
+
+        response = self.client.post(
+            f"{reverse('search')}?cursor=not-a-cursor",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_repeated_search_served_from_result_cache(
+        self, mock_pika, mock_es, mock_requests_post
+    ):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"query": {"match_all": {}}}
+        mock_requests_post.return_value = mock_response
+
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "total": {"value": 1},
+                "hits": [{"_source": {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"]}}],
+            }
+        }
+
+        # Both queries convert to the same Elasticsearch query
+        for query in ["Hostname = octoxlabs*", "IP = 10.0.0.1"]:
+            response = self.client.post(
+                reverse("search"), {"query": query}, format="json"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["total"], 1)
+
+        mock_es.return_value.search.assert_called_once()
+        self.assertEqual(get_search_result_cache().stats()["l1_hits"], 1)
+
+    @override_settings(SEARCH_PREFETCH_ENABLED=True)
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_next_page_prefetched(self, mock_es, mock_requests_post):
+        self._mock_converter(mock_requests_post)
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "total": {"value": 3},
+                "hits": [{"_source": {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"]}}],
+            }
+        }
+
+        response = self.client.post(
+            reverse("search") + "?page=1&page_size=2",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        # Let the prefetch of page 2 finish before asking for it
+        get_page_prefetcher().close(wait=True)
+        self.assertEqual(get_page_prefetcher().stats()["completed"], 1)
+        close_page_prefetcher()
+
+        response = self.client.post(
+            reverse("search") + "?page=2&page_size=2",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        windows = [
+            (call.kwargs["body"]["from"], call.kwargs["body"]["size"])
+            for call in mock_es.return_value.search.call_args_list
+        ]
+        # Page 2 was served from the cache and is the last page
+        self.assertEqual(windows, [(0, 2), (2, 2)])
+        self.assertEqual(get_search_result_cache().stats()["l1_hits"], 1)
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_response_cache_and_conditional_requests(self, mock_es, mock_requests_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"query": {"match_all": {}}}
+        mock_requests_post.return_value = mock_response
+
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "total": {"value": 1},
+                "hits": [{"_source": {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"]}}],
+            }
+        }
+
+        response = self.client.post(
+            reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("max-age", response["Cache-Control"])
+
+        # Same body is answered from the response cache
+        response = self.client.post(
+            reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.data["total"], 1)
+
+        # Matching If-None-Match skips the body entirely
+        response = self.client.post(
+            reverse("search"),
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        mock_requests_post.assert_called_once()
+        mock_es.return_value.search.assert_called_once()
+
+        # A different page window is a different response
+        response = self.client.post(
+            f"{reverse('search')}?page_size=5",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_es.return_value.search.call_count, 2)
+
+    def _mock_export_elasticsearch(self, mock_es, mock_requests_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"query": {"match_all": {}}}
+        mock_requests_post.return_value = mock_response
+
+        mock_es_instance = mock_es.return_value
+        mock_es_instance.open_point_in_time.return_value = {"id": "pit-1"}
+        mock_es_instance.search.side_effect = [
+            {
+                "pit_id": "pit-1",
+                "hits": {
+                    "hits": [
+                        {
+                            "_source": {
+                                "Hostname": f"octoxlabs{i}",
+                                "Ip": ["10.0.0.1"],
+                            },
+                            "sort": [i],
+                        }
+                        for i in range(2)
+                    ]
+                },
+            },
+            {
+                "pit_id": "pit-1",
+                "hits": {
+                    "hits": [
+                        {
+                            "_source": {"Hostname": "octoxlabs2", "Ip": ["10.0.0.2"]},
+                            "sort": [2],
+                        }
+                    ]
+                },
+            },
+        ]
+        return mock_es_instance
+
+    @override_settings(SEARCH_EXPORT_BATCH_SIZE=2)
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_export_streams_ndjson(self, mock_es, mock_requests_post):
+        mock_es_instance = self._mock_export_elasticsearch(mock_es, mock_requests_post)
+
+        response = self.client.post(
+            reverse("search-export"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(
+            [json.loads(line)["Hostname"] for line in lines],
+            ["octoxlabs0", "octoxlabs1", "octoxlabs2"],
+        )
+        self.assertEqual(mock_es_instance.search.call_count, 2)
+        mock_es_instance.close_point_in_time.assert_called_once_with(id="pit-1")
+
+    @override_settings(SEARCH_EXPORT_BATCH_SIZE=2)
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_export_gzip_stream(self, mock_es, mock_requests_post):
+        self._mock_export_elasticsearch(mock_es, mock_requests_post)
+
+        response = self.client.post(
+            reverse("search-export"),
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+            HTTP_ACCEPT_ENCODING="gzip, deflate",
+        )
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(content.decode("utf-8").splitlines()), 3)
+
+    @override_settings(SEARCH_EXPORT_BATCH_SIZE=2)
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_export_gzip_refused_with_zero_quality(self, mock_es, mock_requests_post):
+        self._mock_export_elasticsearch(mock_es, mock_requests_post)
+
+        response = self.client.post(
+            reverse("search-export"),
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+            HTTP_ACCEPT_ENCODING="gzip;q=0, deflate",
+        )
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        content = b"".join(response.streaming_content)
+        self.assertEqual(len(content.decode("utf-8").splitlines()), 3)
+
+    def test_accept_encoding_parsing(self):
+        cases = {
+            "gzip": True,
+            "GZIP;q=0.5, br": True,
+            "deflate, gzip ; q=0.001": True,
+            "*": True,
+            "gzip;q=0": False,
+            "gzip; q=0.0, *": False,
+            "*;q=0": False,
+            "deflate, br": False,
+            "gzip;q=abc": False,
+            "": False,
+        }
+        for header, accepted in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(SearchExportView._accepts_gzip(header), accepted)
+
+    @override_settings(SEARCH_EXPORT_BATCH_SIZE=2)
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_export_closes_point_in_time_on_disconnect(
+        self, mock_es, mock_requests_post
+    ):
+        mock_es_instance = self._mock_export_elasticsearch(mock_es, mock_requests_post)
+
+        response = self.client.post(
+            reverse("search-export"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+        next(iter(response.streaming_content))
+        response.close()
+
+        mock_es_instance.close_point_in_time.assert_called_once_with(id="pit-1")
+        self.assertEqual(mock_es_instance.search.call_count, 1)
+
+    def _mock_converter(self, mock_requests_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "query": {"wildcard": {"Hostname.keyword": "octoxlabs*"}}
+        }
+        mock_requests_post.return_value = mock_response
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_fields_projection(self, mock_es, mock_requests_post):
+        self._mock_converter(mock_requests_post)
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "hits": [{"_source": {"Hostname": "octoxlabs01"}}],
+                "total": {"value": 1},
+            }
+        }
+
+        response = self.client.post(
+            reverse("search") + "?fields=Hostname",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [{"Hostname": "octoxlabs01"}])
+        body = mock_es.return_value.search.call_args.kwargs["body"]
+        self.assertEqual(body["_source"], {"includes": ["Hostname"]})
+
+        # The full document is a different cache entry
+        response = self.client.post(
+            reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+        self.assertEqual(mock_es.return_value.search.call_count, 2)
+        self.assertNotIn(
+            "_source", mock_es.return_value.search.call_args.kwargs["body"]
+        )
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_malformed_hits_rejected(self, mock_es, mock_requests_post):
+        self._mock_converter(mock_requests_post)
+        mock_es.return_value.search.return_value = {
+            "hits": {
+                "hits": [{"_source": {"Hostname": "octoxlabs01", "Ip": "10.0.0.1"}}],
+                "total": {"value": 1},
+            }
+        }
+
+        response = self.client.post(
+            reverse("search"), {"query": "Hostname = octoxlabs*"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data["error"], "Invalid search results")
+
+    def test_unknown_fields_rejected(self):
+        response = self.client.post(
+            reverse("search") + "?fields=Hostname,Password",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.data["details"])
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_count_uses_count_api_and_cache(self, mock_es, mock_requests_post):
+        self._mock_converter(mock_requests_post)
+        mock_es.return_value.count.return_value = {"count": 42}
+
+        for _ in range(2):
+            response = self.client.post(
+                reverse("search-count"),
+                {"query": "Hostname = octoxlabs*"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {"count": 42})
+
+        mock_es.return_value.count.assert_called_once_with(
+            index=settings.ELASTICSEARCH_INDEX,
+            body={"query": {"wildcard": {"Hostname.keyword": "octoxlabs*"}}},
+        )
+        mock_es.return_value.search.assert_not_called()
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_exists_stops_at_first_match(self, mock_es, mock_requests_post):
+        self._mock_converter(mock_requests_post)
+        mock_es.return_value.search.return_value = {
+            "hits": {"hits": [], "total": {"value": 1, "relation": "eq"}},
+            "terminated_early": True,
+        }
+
+        response = self.client.post(
+            reverse("search-count") + "?exists=true",
+            {"query": "Hostname = octoxlabs*"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"exists": True})
+        body = mock_es.return_value.search.call_args.kwargs["body"]
+        self.assertEqual(body["size"], 0)
+        self.assertEqual(body["terminate_after"], 1)
+        mock_es.return_value.count.assert_not_called()
+
+    def _mock_async_search(self, mock_es, mock_converter_post):
+        mock_converter_post.return_value = httpx.Response(
+            200,
+            json={"query": {"wildcard": {"Hostname.keyword": "octoxlabs*"}}},
+            request=httpx.Request("POST", "http://converter/convert"),
+        )
+        mock_es.return_value.search = AsyncMock(
+            return_value={
+                "hits": {
+                    "hits": [
+                        {"_source": {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"]}},
+                        {"_source": {"Hostname": "octoxlabs02", "Ip": ["10.0.0.2"]}},
+                    ],
+                    "total": {"value": 12},
+                }
+            }
+        )
+        return mock_es.return_value
+
+    @patch("search.converter.httpx.AsyncClient.post", new_callable=AsyncMock)
+    @patch("search.services.AsyncElasticsearch")
+    @patch("search.messaging.pika.BlockingConnection")
+    async def test_async_search(self, mock_pika, mock_es, mock_converter_post):
+        mock_es_instance = self._mock_async_search(mock_es, mock_converter_post)
+        mock_channel = MagicMock()
+        mock_pika.return_value.channel.return_value = mock_channel
+
+        response = await self.async_client.post(
+            reverse("search-async") + "?page=2&page_size=2",
+            {"query": "Hostname = octoxlabs*"},
+            content_type="application/json",
+            headers={"Authorization": f"Octoxlabs {self.auth_token}"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["total"], 12)
+        self.assertEqual(len(data["results"]), 2)
+        # Rendered like /search/, compact
+        self.assertEqual(response.content, JSONRenderer().render(data))
+        body = mock_es_instance.search.call_args.kwargs["body"]
+        self.assertEqual(body["from"], 2)
+        self.assertEqual(body["size"], 2)
+
+        self.assertTrue(get_audit_publisher().flush(timeout=5))
+        mock_channel.basic_publish.assert_called_once()
+
+    async def test_async_search_requires_authentication(self):
+        response = await self.async_client.post(
+            reverse("search-async"),
+            {"query": "Hostname = octoxlabs*"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    @patch("search.converter.httpx.AsyncClient.post", new_callable=AsyncMock)
+    @patch("search.services.AsyncElasticsearch")
+    async def test_async_searches_in_flight_concurrently(
+        self, mock_es, mock_converter_post
+    ):
+        mock_es_instance = self._mock_async_search(mock_es, mock_converter_post)
+        concurrency = 20
+        barrier = asyncio.Barrier(concurrency)
+        response_body = mock_es_instance.search.return_value
+
+        async def search(index, body):
+            # Only returns once every request is waiting on Elasticsearch
+            await barrier.wait()
+            return response_body
+
+        mock_es_instance.search.side_effect = search
+
+        responses = await asyncio.wait_for(
+            asyncio.gather(
+                *[
+                    self.async_client.post(
+                        reverse("search-async") + f"?page_size={size}",
+                        {"query": "Hostname = octoxlabs*"},
+                        content_type="application/json",
+                        headers={"Authorization": f"Octoxlabs {self.auth_token}"},
+                    )
+                    for size in range(1, concurrency + 1)
+                ]
+            ),
+            timeout=10,
+        )
+
+        self.assertEqual([r.status_code for r in responses], [200] * concurrency)
+        self.assertEqual(mock_es_instance.search.call_count, concurrency)
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_batch_search_uses_single_msearch(
+        self, mock_pika, mock_es, mock_requests_post
+    ):
+        def convert(url, json, **kwargs):
+            self.assertTrue(url.endswith("/batch"))
+            response = MagicMock()
+            response.json.return_value = {
+                "results": [
+                    (
+                        {"error": "Query conversion failed: unsupported"}
+                        if query == "Ip = 10.0.0.1"
+                        else {"query": {"term": {"q": query}}}
+                    )
+                    for query in json["queries"]
+                ]
+            }
+            return response
+
+        mock_requests_post.side_effect = convert
+        mock_es.return_value.msearch.return_value = {
+            "responses": [
+                {
+                    "hits": {
+                        "hits": [
+                            {"_source": {"Hostname": "host1", "Ip": ["10.0.0.2"]}}
+                        ],
+                        "total": {"value": 1},
+                    }
+                },
+                {"error": {"reason": "shard failure"}},
+            ]
+        }
+        mock_channel = MagicMock()
+        mock_pika.return_value.channel.return_value = mock_channel
+
+        response = self.client.post(
+            reverse("search-batch") + "?page_size=5",
+            {
+                "queries": [
+                    "Hostname = host1",
+                    "invalid_field = value",
+                    "Ip = 10.0.0.1",
+                    "Hostname = host2",
+                ]
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]["total"], 1)
+        self.assertEqual(results[0]["results"][0]["Hostname"], "host1")
+        self.assertEqual(results[1]["error"], "Invalid input")
+        self.assertEqual(results[2]["error"], "Search failed")
+        self.assertIn("unsupported", results[2]["details"])
+        self.assertIn("shard failure", results[3]["details"])
+
+        # Valid queries are converted in one round trip when the cost throttle
+        # prices them; the search reuses those conversions and the rejection
+        mock_requests_post.assert_called_once()
+        self.assertEqual(
+            mock_requests_post.call_args.kwargs["json"],
+            {"queries": ["Hostname = host1", "Ip = 10.0.0.1", "Hostname = host2"]},
+        )
+
+        # Only the converted queries go out, in one round trip
+        mock_es.return_value.msearch.assert_called_once()
+        body = mock_es.return_value.msearch.call_args.kwargs["body"]
+        self.assertEqual(len(body), 4)
+        self.assertEqual(body[1]["size"], 5)
+        self.assertEqual(body[3]["query"], {"term": {"q": "Hostname = host2"}})
+
+        # Every query of the batch is audited
+        self.assertTrue(get_audit_publisher().flush(timeout=5))
+        self.assertEqual(mock_channel.basic_publish.call_count, 4)
+
+    @patch("search.converter.requests.Session.post")
+    @patch("search.services.Elasticsearch")
+    def test_batch_conversion_falls_back_to_single_queries(
+        self, mock_es, mock_requests_post
+    ):
+        def convert(url, json, **kwargs):
+            response = requests.Response()
+            if url.endswith("/batch"):
+                response.status_code = 404
+            elif json["query"] == "Ip = 10.0.0.1":
+                raise requests.RequestException("Converter unavailable")
+            else:
+                response.status_code = 200
+                response._content = b'{"query": {"match_all": {}}}'
+            return response
+
+        mock_requests_post.side_effect = convert
+        mock_es.return_value.msearch.return_value = {
+            "responses": [{"hits": {"hits": [], "total": {"value": 0}}}]
+        }
+
+        response = self.client.post(
+            reverse("search-batch"),
+            {"queries": ["Hostname = host1", "Ip = 10.0.0.1"]},
+            format="json",
+        )
+
+        results = response.data["results"]
+        self.assertEqual(results[0]["total"], 0)
+        self.assertEqual(results[1]["error"], "Query converter unavailable")
+        # The cost throttle converts both, the search reuses even the failure
+        self.assertEqual(mock_requests_post.call_count, 3)
+
+    def test_batch_search_limits(self):
+        response = self.client.post(
+            reverse("search-batch"), {"queries": []}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with patch.object(SearchService, "multi_search") as mock_multi_search:
+            response = self.client.post(
+                reverse("search-batch"),
+                {"queries": ["Hostname = host"] * 51},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 400)
+        mock_multi_search.assert_not_called()
+
+
+class SearchRenderingTests(TestCase):
+    def test_shape_check_matches_serializer(self):
+        hits = [
+            {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"], "Os": "linux"},
+            {"Hostname": " octoxlabs02 ", "Ip": [1, "fé80::1"]},
+        ]
+        serializer = SearchResultSerializer(data=hits, many=True)
+        self.assertTrue(serializer.is_valid())
+
+        self.assertEqual(SearchResultSerializer.render_hits(hits), serializer.data)
+        self.assertEqual(
+            SearchResultSerializer.render_hits(hits, ("Hostname",)),
+            [{"Hostname": "octoxlabs01"}, {"Hostname": "octoxlabs02"}],
+        )
+
+    def test_shape_check_rejects_what_serializer_rejects(self):
+        for hit in [
+            {"Hostname": "octoxlabs01"},
+            {"Hostname": "", "Ip": []},
+            {"Hostname": "octoxlabs01", "Ip": "10.0.0.1"},
+            {"Hostname": "octoxlabs01", "Ip": [None]},
+            {"Hostname": "octoxlabs\x00", "Ip": []},
+            {"Hostname": "octoxlabs\ud800", "Ip": []},
+            ["octoxlabs01"],
+        ]:
+            with self.subTest(hit=hit):
+                self.assertFalse(
+                    SearchResultSerializer(data=[hit], many=True).is_valid()
+                )
+                self.assertIsNone(SearchResultSerializer.render_hits([hit]))
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            "total": 1,
+            "results": [{"Hostname": "octö\u2028", "Ip": ["10.0.0.1"]}],
+            "at": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901),
+        }
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+
+class PagePrefetcherTests(TestCase):
+    def setUp(self):
+        self.result_cache = SearchResultCache(max_entries=10)
+        self.service = MagicMock()
+
+    def _prefetcher(self, **kwargs):
+        prefetcher = PagePrefetcher(self.result_cache, **kwargs)
+        self.addCleanup(prefetcher.close)
+        return prefetcher
+
+    def test_rate_limited(self):
+        prefetcher = self._prefetcher(rate=0, burst=2)
+
+        futures = [prefetcher.schedule(self.service, f"q{i}", 20, 20) for i in range(3)]
+
+        self.assertIsNone(futures[2])
+        self.assertTrue(all(future.result() for future in futures[:2]))
+        self.assertEqual(self.service.execute_search.call_count, 2)
+        self.assertEqual(prefetcher.stats()["rate_limited"], 1)
+
+    def test_cancelled_under_memory_pressure(self):
+        prefetcher = self._prefetcher(max_workers=1, max_cache_fill=0.5)
+        started = threading.Event()
+        release = threading.Event()
+        self.service.execute_search.side_effect = lambda *args: (
+            started.set(),
+            release.wait(),
+        )
+
+        running = prefetcher.schedule(self.service, "q1", 20, 20)
+        queued = prefetcher.schedule(self.service, "q2", 20, 20)
+        started.wait()
+        for i in range(5):
+            self.result_cache.set(f"key{i}", i)
+
+        self.assertIsNone(prefetcher.schedule(self.service, "q3", 20, 20))
+        self.assertTrue(queued.cancelled())
+        release.set()
+        self.assertTrue(running.result())
+        self.assertEqual(self.service.execute_search.call_count, 1)
+        self.assertEqual(prefetcher.stats()["cancelled"], 1)
+
+    def test_beyond_max_result_window_not_prefetched(self):
+        prefetcher = self._prefetcher()
+
+        self.assertIsNone(prefetcher.schedule(self.service, "q", 9990, 20))
+
+
+class AuditPublisherTests(TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+
+    def test_publish_only_enqueues_and_batches(self):
+        publisher = AuditPublisher(client=self.client, batch_size=10)
+        # Enqueue before the thread starts so all messages land in one batch
+        publisher.start = MagicMock()
+        for i in range(3):
+            self.assertTrue(publisher.publish({"query": f"Hostname = host{i}"}))
+        self.client.publish_messages.assert_not_called()
+        self.assertEqual(publisher.stats()["queue_depth"], 3)
+
+        del publisher.start
+        publisher.start()
+        self.assertTrue(publisher.flush(timeout=5))
+        publisher.stop()
+
+        self.client.publish_messages.assert_called_once()
+        self.assertEqual(len(self.client.publish_messages.call_args.args[1]), 3)
+        self.assertEqual(publisher.stats()["published"], 3)
+
+    def test_full_queue_drops_messages(self):
+        publisher = AuditPublisher(client=self.client, max_queue_size=1)
+        publisher.start = MagicMock()
+
+        self.assertTrue(publisher.publish({"query": "Hostname = host1"}))
+        self.assertFalse(publisher.publish({"query": "Hostname = host2"}))
+        self.assertEqual(publisher.stats()["dropped"], 1)
+
+    def test_reconnects_after_publish_failure(self):
+        self.client.publish_messages.side_effect = [Exception("Connection lost"), None]
+        publisher = AuditPublisher(client=self.client, max_retries=1)
+        publisher._stop_event.wait = MagicMock()
+
+        publisher.publish({"query": "Hostname = host1"})
+        self.assertTrue(publisher.flush(timeout=5))
+        publisher.stop()
+
+        stats = publisher.stats()
+        self.assertEqual(stats["published"], 1)
+        self.assertEqual(stats["reconnects"], 1)
+        self.assertEqual(stats["failed"], 0)
+
+    def test_only_unrouted_messages_retried(self):
+        messages = [{"query": f"Hostname = host{i}"} for i in range(3)]
+        self.client.publish_messages.side_effect = [
+            UndeliveredMessages(messages[1:2]),
+            None,
+        ]
+        publisher = AuditPublisher(client=self.client, batch_size=10)
+        publisher._stop_event.wait = MagicMock()
+        publisher.start = MagicMock()
+        publisher.publish_many(messages)
+
+        del publisher.start
+        publisher.start()
+        self.assertTrue(publisher.flush(timeout=5))
+        publisher.stop()
+
+        retried = self.client.publish_messages.call_args_list[1].args[1]
+        self.assertEqual(retried, messages[1:2])
+        self.assertEqual(publisher.stats()["published"], 3)
+
+    @patch("search.messaging.pika.BlockingConnection")
+    def test_batch_published_with_confirms(self, mock_pika):
+        channel = mock_pika.return_value.channel.return_value
+        client = RabbitMQClient()
+        messages = [{"query": f"Hostname = host{i}"} for i in range(4)]
+
+        client.publish_messages(SEARCH_QUERY_QUEUE, messages)
+
+        self.assertEqual(channel.basic_publish.call_count, 4)
+        channel.confirm_delivery.assert_called_once()
+        self.assertTrue(
+            all(c.kwargs["mandatory"] for c in channel.basic_publish.call_args_list)
+        )
+
+        # Returned and nacked messages are reported, the others were delivered
+        channel.basic_publish.side_effect = [
+            None,
+            UnroutableError([]),
+            NackError([]),
+            None,
+        ]
+        with self.assertRaises(UndeliveredMessages) as context:
+            client.publish_messages(SEARCH_QUERY_QUEUE, messages)
+        self.assertEqual(context.exception.messages, messages[1:3])
+
+        # A lost channel leaves the rest of the batch unconfirmed
+        channel.basic_publish.side_effect = [None, ConnectionError("closed")]
+        with self.assertRaises(UndeliveredMessages) as context:
+            client.publish_messages(SEARCH_QUERY_QUEUE, messages)
+        self.assertEqual(context.exception.messages, messages[1:])
+
+    def test_failed_batches_spooled_and_replayed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = AuditSpool(directory)
+            self.client.publish_messages.side_effect = [
+                Exception("Connection refused"),
+                None,
+            ]
+            publisher = AuditPublisher(
+                client=self.client, spool=spool, flush_interval=0.01
+            )
+
+            publisher.publish({"query": "Hostname = host1"})
+            self.assertTrue(publisher.flush(timeout=5))
+            self.assertEqual(publisher.stats()["spooled"], 1)
+
+            # Once the broker accepts messages again the spool is drained
+            publisher._broker_down_until = 0.0
+            deadline = time.monotonic() + 5
+            while publisher.stats()["replayed"] < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            publisher.stop()
+
+            self.assertEqual(publisher.stats()["replayed"], 1)
+            self.assertEqual(
+                self.client.publish_messages.call_args.args[1],
+                [{"query": "Hostname = host1"}],
+            )
+            self.assertEqual(list(Path(directory).iterdir()), [])
+
+    def test_queue_overflow_spills_to_spool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            publisher = AuditPublisher(
+                client=self.client, max_queue_size=1, spool=AuditSpool(directory)
+            )
+            publisher.start = MagicMock()
+
+            self.assertTrue(publisher.publish({"query": "Hostname = host1"}))
+            self.assertTrue(publisher.publish({"query": "Hostname = host2"}))
+
+            stats = publisher.stats()
+            self.assertEqual(stats["dropped"], 0)
+            self.assertEqual(stats["spool"]["spooled"], 1)
+
+
+class AuditSpoolTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_segments_rotate_and_replay_oldest_first(self):
+        spool = AuditSpool(self.directory, segment_bytes=20)
+        spool.append([{"query": "Hostname = host1"}])
+        spool.append([{"query": "Hostname = host2"}])
+
+        self.assertEqual(len(list(self.directory.glob("*.log"))), 2)
+
+        path, messages = spool.claim()
+        self.assertEqual(messages, [{"query": "Hostname = host1"}])
+        spool.remove(path)
+
+        path, messages = spool.claim()
+        self.assertEqual(messages, [{"query": "Hostname = host2"}])
+        spool.remove(path)
+        self.assertIsNone(spool.claim())
+
+    def test_max_bytes_bounds_disk_usage(self):
+        spool = AuditSpool(self.directory, max_bytes=40)
+
+        self.assertTrue(spool.append([{"query": "Hostname = host1"}]))
+        self.assertFalse(spool.append([{"query": "Hostname = host2"}]))
+        self.assertEqual(spool.stats()["dropped"], 1)
+
+    def test_release_unclaims_segment(self):
+        spool = AuditSpool(self.directory)
+        spool.append([{"query": "Hostname = host1"}, {"query": "Hostname = host2"}])
+
+        path, _ = spool.claim()
+        spool.release(path)
+        _, messages = spool.claim()
+        self.assertEqual(len(messages), 2)
+
+    def test_orphaned_segments_recovered(self):
+        # Segments of a dead writer and a dead replayer
+        (self.directory / "00000000000000000001-999999999.open").write_text(
+            '{"query": "Hostname = host1"}\n'
+        )
+        (self.directory / "00000000000000000002-1.999999999.replay").write_text(
+            '{"query": "Hostname = host2"}\n'
+        )
+
+        spool = AuditSpool(self.directory)
+        self.assertEqual(len(list(self.directory.glob("*.log"))), 2)
+        _, messages = spool.claim()
+        self.assertEqual(messages, [{"query": "Hostname = host1"}])
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = SearchResultCache(max_entries=2, l1_ttl=30, l2_ttl=60)
+
+    def test_key_depends_on_page_window(self):
+        query = '{"query": {"match_all": {}}}'
+        self.assertNotEqual(
+            self.cache.make_key(query, 0, 20), self.cache.make_key(query, 20, 20)
+        )
+        self.assertEqual(
+            self.cache.make_key(query, 0, 20), self.cache.make_key(query, 0, 20)
+        )
+
+    def test_lru_eviction_falls_back_to_l2(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 2)
+
+        # "b" was least recently used, so it is now only in L2
+        self.assertEqual(self.cache.get("b"), 2)
+        self.assertEqual(self.cache.stats()["l2_hits"], 1)
+
+    @patch("search.cache.time.monotonic")
+    def test_expired_l1_entry_counts_as_expiration(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.cache.set("a", 1)
+        cache.clear()
+
+        mock_monotonic.return_value = 131
+        self.assertIsNone(self.cache.get("a"))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["expirations"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_normalized_query_ignores_spelling(self):
+        self.assertEqual(
+            normalize_query(" Hostname  =  a*  AND (NOT ip=10.0.0.1 )"),
+            normalize_query("hostname = a* AND ( NOT Ip = 10.0.0.1)"),
+        )
+        self.assertNotEqual(
+            normalize_query("Hostname = a*"), normalize_query("Hostname = A*")
+        )
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.single_flight = SingleFlight(lock_timeout=5, poll_interval=0.01)
+
+    def test_concurrent_identical_calls_share_one_execution(self):
+        calls = []
+        barrier = threading.Barrier(5)
+        results = []
+
+        def slow_search():
+            calls.append(1)
+            time.sleep(0.1)
+            return "result"
+
+        def worker():
+            barrier.wait()
+            results.append(self.single_flight.do("key", slow_search))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(self.single_flight.stats()["coalesced"], 4)
+
+    def test_follower_waits_for_result_of_other_worker(self):
+        # Simulate a leader in another process holding the lock
+        cache.add(f"{SingleFlight.key_prefix}:lock:key", "other", 5)
+        cache.set(f"{SingleFlight.key_prefix}:result:key", "remote", 5)
+
+        func = MagicMock(return_value="local")
+        self.assertEqual(self.single_flight.do("key", func), "remote")
+        func.assert_not_called()
+        self.assertEqual(self.single_flight.stats()["remote_coalesced"], 1)
+
+    def test_errors_propagate_and_release_lock(self):
+        def failing_search():
+            raise RuntimeError("Elasticsearch error")
+
+        with self.assertRaises(RuntimeError):
+            self.single_flight.do("key", failing_search)
+
+        self.assertIsNone(cache.get(f"{SingleFlight.key_prefix}:lock:key"))
+        self.assertEqual(self.single_flight.do("key", lambda: "ok"), "ok")
+
+    def test_broken_backend_falls_back_to_local_result(self):
+        backend = MagicMock()
+        backend.add.return_value = True
+        backend.set.side_effect = ConnectionError("cache down")
+        backend.get.side_effect = ConnectionError("cache down")
+
+        with patch("search.coalescing.caches") as mock_caches:
+            mock_caches.__getitem__.return_value = backend
+            self.assertEqual(self.single_flight.do("key", lambda: "local"), "local")
+
+            # A follower whose polling fails does the work itself
+            backend.add.return_value = False
+            func = MagicMock(return_value="local")
+            self.assertEqual(self.single_flight.do("key", func), "local")
+            func.assert_called_once()
+
+    def test_searches_keyed_on_converted_query(self):
+        single_flight = MagicMock()
+        service = SearchService(
+            elasticsearch_client=MagicMock(), single_flight=single_flight
+        )
+        es_query = {"query": {"prefix": {"Hostname": "a"}}}
+
+        with patch.object(service, "convert_query", return_value=es_query):
+            service.search("Hostname = a*")
+            service.search("hostname  =  a*")
+
+        first, second = single_flight.make_key.call_args_list
+        self.assertEqual(first, second)
+
+    @patch("search.converter.requests.Session.post")
+    def test_concurrent_conversions_share_one_converter_call(self, mock_post):
+        get_query_conversion_cache().clear()
+        get_query_failure_cache().clear()
+        close_remote_query_converter()
+        self.addCleanup(close_remote_query_converter)
+        barrier = threading.Barrier(5)
+        results = []
+
+        def convert(url, json, **kwargs):
+            time.sleep(0.1)
+            response = MagicMock()
+            response.json.return_value = {"query": {"match_all": {}}, "cost": 1}
+            return response
+
+        def worker(query):
+            service = SearchService(elasticsearch_client=MagicMock())
+            barrier.wait()
+            results.append(service.convert_query(query))
+
+        mock_post.side_effect = convert
+        queries = ["Hostname = a*", "hostname = a*", "Hostname  =  a*"] + [
+            "Hostname = a*"
+        ] * 2
+        threads = [threading.Thread(target=worker, args=(q,)) for q in queries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [{"query": {"match_all": {}}}] * 5)
+        mock_post.assert_called_once()
+        # Later repeats come from the conversion cache
+        SearchService(elasticsearch_client=MagicMock()).convert_query("HOSTNAME = a*")
+        mock_post.assert_called_once()
+
+
+class SearchServiceClientTests(TestCase):
+    def setUp(self):
+        close_elasticsearch_client()
+        self.addCleanup(close_elasticsearch_client)
+
+    @patch("search.services.Elasticsearch")
+    def test_elasticsearch_client_shared_across_services(self, mock_es):
+        first = SearchService()
+        second = SearchService()
+
+        self.assertIs(first.es_client, second.es_client)
+        mock_es.assert_called_once()
+
+    @patch("search.services.Elasticsearch")
+    def test_close_elasticsearch_client(self, mock_es):
+        mock_es.side_effect = lambda *args, **kwargs: MagicMock()
+        client = get_elasticsearch_client()
+        close_elasticsearch_client()
+
+        client.close.assert_called_once()
+        self.assertIsNot(get_elasticsearch_client(), client)
+
+    def test_pool_stats_endpoint_requires_admin(self):
+        client = APIClient()
+        User.objects.create_user(username="octoUser")
+        token = base64.b64encode(b"octoUser").decode("utf-8")
+        client.credentials(HTTP_AUTHORIZATION=f"Octoxlabs {token}")
+
+        response = client.get(reverse("search-stats"))
+        self.assertEqual(response.status_code, 403)
+
+        User.objects.create_superuser(username="octoAdmin")
+        token = base64.b64encode(b"octoAdmin").decode("utf-8")
+        client.credentials(HTTP_AUTHORIZATION=f"Octoxlabs {token}")
+
+        get_elasticsearch_client()
+        response = client.get(reverse("search-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["elasticsearch_pool"][0]["in_use"], 0)
+
+
+class FieldRegistryTests(TestCase):
+    mapping = {
+        "properties": {
+            "Hostname": {"type": "keyword"},
+            "Ip": {"type": "keyword"},
+            "Owner": {"type": "text", "fields": {"raw": {"type": "keyword"}}},
+        }
+    }
+
+    def tearDown(self):
+        reset_field_registry()
+
+    def test_loaded_from_shared_mapping_file(self):
+        registry = get_field_registry()
+
+        self.assertEqual(registry.names, ["Hostname", "Ip"])
+        self.assertEqual(registry.get(" hostname ")["name"], "Hostname")
+        self.assertIsNone(registry.get("status"))
+
+    @override_settings(SEARCH_FIELDS_FILE="")
+    @patch("search.fields.Elasticsearch")
+    def test_loaded_from_index_mapping_without_file(self, mock_es):
+        mock_es.return_value.indices.get_mapping.return_value = {
+            "octoxlabsdata-000001": {"mappings": self.mapping}
+        }
+        reset_field_registry()
+
+        registry = get_field_registry()
+
+        self.assertEqual(registry.names, ["Hostname", "Ip", "Owner"])
+        self.assertEqual(registry.get("owner")["keyword"], "Owner.raw")
+        mock_es.return_value.indices.get_mapping.assert_called_once_with(
+            index=settings.ELASTICSEARCH_INDEX
+        )
+        mock_es.return_value.close.assert_called_once()
+
+    def test_new_field_searchable_without_code_change(self):
+        with patch(
+            "search.serializers.get_field_registry",
+            return_value=FieldRegistry(self.mapping),
+        ):
+            accepted = SearchQuerySerializer(data={"query": "owner = alice"})
+            rejected = SearchQuerySerializer(data={"query": "Status = active"})
+
+            self.assertTrue(accepted.is_valid())
+            self.assertFalse(rejected.is_valid())
+        self.assertIn("Owner", str(rejected.errors["query"][0]))
+
+    def test_new_field_rendered_without_code_change(self):
+        properties = {
+            **self.mapping["properties"],
+            "Ip": {"type": "keyword", "meta": {"multi_valued": "true"}},
+            "Cpus": {"type": "integer"},
+        }
+        hits = [
+            {"Hostname": "octoxlabs01", "Ip": ["10.0.0.1"], "Owner": "al", "Cpus": 4}
+        ]
+        with patch(
+            "search.serializers.get_field_registry",
+            return_value=FieldRegistry({"properties": properties}),
+        ):
+            serializer = SearchResultSerializer(data=hits, many=True)
+            self.assertTrue(serializer.is_valid())
+            self.assertEqual(SearchResultSerializer.render_hits(hits), hits)
+            self.assertEqual(
+                SearchResultSerializer.parse_fields("cpus, owner"), ("Cpus", "Owner")
+            )
+            with self.assertRaises(ValidationError):
+                SearchResultSerializer.parse_fields("Status")
+
+
+class EmbeddedQueryConverterTests(TestCase):
+    def test_matches_converter_service_output(self):
+        converter = get_embedded_query_converter()
+
+        self.assertEqual(
+            converter.convert("Hostname = octo*labs"),
+            {"query": {"wildcard": {"Hostname": "octo*labs"}}, "cost": 5},
+        )
+        self.assertEqual(
+            converter.convert("Hostname = octoxlabs*"),
+            {"query": {"prefix": {"Hostname": "octoxlabs"}}, "cost": 2},
+        )
+        self.assertEqual(
+            converter.convert("Ip = /10\\.0\\.[0-9]+/"),
+            {
+                "query": {
+                    "regexp": {
+                        "Ip": {
+                            "value": "10\\.0\\.[0-9]+",
+                            "max_determinized_states": 10000,
+                        }
+                    }
+                },
+                "cost": 25,
+            },
+        )
+        self.assertEqual(
+            converter.convert("Hostname = octoxlabs01"),
+            {"query": {"term": {"Hostname": "octoxlabs01"}}, "cost": 1},
+        )
+        # Fields are converted under their name in the shared mapping
+        self.assertEqual(
+            converter.convert("hostname = octoxlabs01"),
+            {"query": {"term": {"Hostname": "octoxlabs01"}}, "cost": 1},
+        )
+
+    def test_loaded_under_private_package_name(self):
+        converter = get_embedded_query_converter()
+
+        self.assertNotIn(settings.QUERY_CONVERTER_SOURCE_DIR, sys.path)
+        module = sys.modules[f"{EMBEDDED_CONVERTER_PACKAGE}.services.converter_service"]
+        self.assertIsInstance(converter._service, module.ConverterService)
+        # Its log records go through our logging, loguru is left alone
+        self.assertEqual(module.logger, logging.getLogger(module.__name__))
+
+    def test_applies_converter_service_validation(self):
+        converter = get_embedded_query_converter()
+
+        with self.assertRaises(ValueError):
+            converter.convert("Status = active")
+        with self.assertRaises(ValueError):
+            converter.convert("Hostname = a" + "a" * 200)
+        with self.assertRaises(ValueError):
+            converter.convert("Hostname = a AND Status = active")
+
+    @override_settings(QUERY_CONVERTER_MODE="embedded")
+    @patch("search.converter.requests.Session.post")
+    def test_search_service_converts_in_process(self, mock_requests_post):
+        service = SearchService(elasticsearch_client=MagicMock())
+
+        es_query = service.convert_query("Hostname = inprocess*")
+        cache_stats = get_embedded_query_converter().stats()["conversion_cache"]
+        service.convert_query("Hostname = inprocess*")
+
+        self.assertEqual(es_query, {"query": {"prefix": {"Hostname": "inprocess"}}})
+        mock_requests_post.assert_not_called()
+        # The second conversion comes from our cache, the cost stays out
+        self.assertEqual(
+            get_embedded_query_converter().stats()["conversion_cache"], cache_stats
+        )
+        self.assertEqual(service.convert("Hostname = inprocess*")["cost"], 2)
+
+
+class RemoteQueryConverterTests(TestCase):
+    def _response(self, status_code=200, body=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body or {}).encode("utf-8")
+        return response
+
+    def test_breaker_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # After the reset timeout exactly one trial call is let through
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    @patch("search.converter.requests.Session.post")
+    def test_malformed_answer_ends_trial_call(self, mock_post):
+        mock_post.return_value = self._response(200, {"unexpected": True})
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        converter = RemoteQueryConverter("http://converter/convert", breaker=breaker)
+        self.addCleanup(converter.close)
+
+        with self.assertRaises(KeyError):
+            converter.convert("Hostname = octoxlabs*")
+
+        # The failed trial reopened the circuit instead of leaving it stuck
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        mock_post.return_value = self._response(200, {"query": {}, "cost": 3})
+        self.assertEqual(
+            converter.convert("Hostname = octoxlabs*"), {"query": {}, "cost": 3}
+        )
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    @patch("search.converter.requests.Session.post")
+    def test_rejected_query_does_not_open_circuit(self, mock_post):
+        mock_post.return_value = self._response(400, {"detail": "Invalid query"})
+        converter = RemoteQueryConverter(
+            "http://converter/convert", breaker=CircuitBreaker(failure_threshold=1)
+        )
+        self.addCleanup(converter.close)
+
+        with self.assertRaises(requests.HTTPError):
+            converter.convert("Hostname = octoxlabs*")
+
+        self.assertEqual(converter.breaker.state, CircuitBreaker.CLOSED)
+        mock_post.assert_called_once_with(
+            "http://converter/convert",
+            json={"query": "Hostname = octoxlabs*"},
+            timeout=(0.5, 2),
+        )
+
+    @patch("search.converter.requests.Session.post")
+    def test_server_error_raises_unavailable(self, mock_post):
+        mock_post.return_value = self._response(502)
+        converter = RemoteQueryConverter("http://converter/convert")
+        self.addCleanup(converter.close)
+
+        with self.assertRaises(QueryConverterUnavailable):
+            converter.convert("Hostname = octoxlabs*")
+
+        stats = converter.stats()
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["breaker"]["consecutive_failures"], 1)
+        self.assertEqual(stats["latency_ms"]["samples"], 1)
+
+    @patch("search.converter.requests.Session.post")
+    def test_slow_call_hedged_to_second_replica(self, mock_post):
+        release_primary = threading.Event()
+        self.addCleanup(release_primary.set)
+
+        def post(url, json, timeout):
+            if url == "http://primary/convert":
+                release_primary.wait(5)
+            return self._response(body={"query": {"term": {"from": url}}})
+
+        mock_post.side_effect = post
+        converter = RemoteQueryConverter(
+            "http://primary/convert",
+            hedge_url="http://replica/convert",
+            hedge_after=0.01,
+        )
+        self.addCleanup(converter.close)
+
+        result = converter.convert("Hostname = octoxlabs*")
+
+        # A converter without cost estimates prices it like a term lookup
+        self.assertEqual(
+            result, {"query": {"term": {"from": "http://replica/convert"}}, "cost": 1}
+        )
+        stats = converter.stats()
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["hedge_wins"], 1)
+
+
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        get_principal_cache().clear()
+        self.client = APIClient()
+        self.url = reverse("search-stats")
+
+    def _authenticate(self, username):
+        token = base64.b64encode(username.encode("utf-8")).decode("utf-8")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Octoxlabs {token}")
+
+    def test_known_token_resolved_from_database_once(self):
+        User.objects.create_superuser(username="octoAdmin")
+        self._authenticate("octoAdmin")
+
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.assertEqual(get_principal_cache().stats()["hits"], 2)
+
+    def test_unknown_token_cached_until_user_created(self):
+        self._authenticate("octoAdmin")
+
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(get_principal_cache().stats()["negative_hits"], 2)
+
+        User.objects.create_superuser(username="octoAdmin")
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_saved_or_deleted_user_invalidated(self):
+        user = User.objects.create_superuser(username="octoAdmin")
+        self._authenticate("octoAdmin")
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        user.is_staff = False
+        user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("Invalid authentication token", str(response.data["detail"]))
+
+
+class SlidingWindowRateThrottleTests(TestCase):
+    class MinuteThrottle(SlidingWindowRateThrottle, UserRateThrottle):
+        scope = "test"
+        rate = "4/min"
+
+    def setUp(self):
+        cache.clear()
+        self.request = MagicMock()
+        self.request.user.is_authenticated = True
+        self.request.user.pk = 1
+
+    def _allow(self, now):
+        throttle = self.MinuteThrottle()
+        throttle.timer = lambda: now
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_limits_within_window_with_constant_state(self):
+        for _ in range(4):
+            self.assertTrue(self._allow(60.0)[0])
+
+        allowed, throttle = self._allow(90.0)
+        self.assertFalse(allowed)
+        # Wait for the next window, then for this window's weight to fall to 3
+        self.assertEqual(throttle.wait(), 45.0)
+        # A single integer counter per window instead of a timestamp list
+        self.assertEqual(cache.get("throttle_test_1:1"), 4)
+
+    def test_previous_window_weighted_by_overlap(self):
+        for _ in range(4):
+            self.assertTrue(self._allow(60.0)[0])
+
+        # Halfway into the next window the previous one still counts for 2
+        self.assertTrue(self._allow(150.0)[0])
+        self.assertTrue(self._allow(150.0)[0])
+        self.assertFalse(self._allow(150.0)[0])
+        # Three quarters into it the previous window only counts for 1
+        self.assertTrue(self._allow(165.0)[0])
+
+    @override_settings(
+        SEARCH_THROTTLE_CACHE_ALIAS="throttle",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "throttle": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "throttle",
+            },
+        },
+    )
+    def test_counters_live_in_configured_cache(self):
+        self.assertTrue(self._allow(60.0)[0])
+
+        self.assertEqual(caches["throttle"].get("throttle_test_1:1"), 1)
+        self.assertIsNone(cache.get("throttle_test_1:1"))
+
+
+class SearchCostRateThrottleTests(TestCase):
+    class MinuteCostThrottle(SearchCostRateThrottle):
+        rate = "60/min"
+
+    # What the query converter estimates for each query
+    costs = {
+        "Hostname = octoxlabs01": 1,
+        "Ip = /.+/": 50,
+        "Hostname = *labs": 25,
+        "Hostname = *prod": 25,
+        "Hostname = *dev": 25,
+    }
+
+    def setUp(self):
+        cache.clear()
+        get_query_conversion_cache().clear()
+        get_query_failure_cache().clear()
+        patcher = patch(
+            "search.converter.requests.Session.post", side_effect=self._convert
+        )
+        self.mock_post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _convert(self, url, json, **kwargs):
+        response = MagicMock()
+        if url.endswith("/batch"):
+            response.json.return_value = {
+                "results": [self._answer(query) for query in json["queries"]]
+            }
+        else:
+            response.json.return_value = self._answer(json["query"])
+        return response
+
+    def _answer(self, query):
+        if query not in self.costs:
+            return {"error": f"Unsupported query: {query}"}
+        return {"query": {"match_all": {}}, "cost": self.costs[query]}
+
+    def _allow(self, data, now=60.0):
+        request = MagicMock()
+        request.user.is_authenticated = True
+        request.user.pk = 1
+        request.data = data
+        throttle = self.MinuteCostThrottle()
+        throttle.timer = lambda: now
+        return throttle.allow_request(request, None)
+
+    def test_expensive_queries_cannot_starve_cheap_lookups(self):
+        self.assertTrue(self._allow({"query": "Ip = /.+/"}))
+        # The budget has no room left for a second unbounded regexp
+        self.assertFalse(self._allow({"query": "Ip = /.+/"}))
+
+        for _ in range(10):
+            self.assertTrue(self._allow({"query": "Hostname = octoxlabs01"}))
+        self.assertFalse(self._allow({"query": "Hostname = octoxlabs01"}))
+        # Each query was converted once, the search reuses the conversion
+        self.assertEqual(self.mock_post.call_count, 2)
+        self.assertEqual(
+            SearchService().convert_query("Ip = /.+/"), {"query": {"match_all": {}}}
+        )
+        self.assertEqual(self.mock_post.call_count, 2)
+
+    def test_batch_charged_for_every_query(self):
+        queries = ["Hostname = *labs", "Hostname = *prod", "Hostname = *dev"]
+
+        self.assertFalse(self._allow({"queries": queries}))
+        self.assertTrue(self._allow({"queries": queries[1:]}))
+        self.assertEqual(cache.get("throttle_search_cost_1:1"), 50)
+        self.mock_post.assert_called_once()
+
+    def test_rejected_query_converted_once(self):
+        def reject(url, json, **kwargs):
+            response = requests.Response()
+            response.status_code = 400
+            response.url = url
+            return response
+
+        self.mock_post.side_effect = reject
+        self.assertTrue(self._allow({"query": "Hostname = rejected"}))
+        self.assertEqual(cache.get("throttle_search_cost_1:1"), 1)
+
+        # The search answers the remembered rejection without converting again
+        with self.assertRaisesMessage(ValueError, "400 Client Error"):
+            SearchService().convert_query("Hostname = rejected")
+        self.mock_post.assert_called_once()
+
+    def test_rejected_batch_query_converted_once(self):
+        queries = ["Hostname = octoxlabs01", "Hostname = rejected"]
+        self.assertTrue(self._allow({"queries": queries}))
+
+        converted = SearchService().convert_queries(queries)
+        self.assertEqual(converted[0], {"query": {"match_all": {}}})
+        self.assertEqual(str(converted[1]), "Unsupported query: Hostname = rejected")
+        self.mock_post.assert_called_once()
+
+    def test_invalid_query_charged_without_conversion(self):
+        self.assertTrue(self._allow({"query": "Status = active"}))
+
+        self.assertEqual(cache.get("throttle_search_cost_1:1"), 1)
+        self.mock_post.assert_not_called()
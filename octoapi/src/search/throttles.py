@@ -1,11 +1,139 @@
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import (
+    AnonRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
 
+from .serializers import SearchQuerySerializer
+from .services import SearchService
 
-class SearchUserRateThrottle(UserRateThrottle):
-    rate = "1000/day"
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """Sliding-window counter throttle with O(1) state per client.
+
+    Each client has one counter per fixed window in the shared cache backend,
+    updated with atomic ``add``/``incr``. A request is admitted while the
+    current window's count plus the previous window's count, weighted by how
+    much of it the sliding window still overlaps, leaves room for the
+    request's cost. Every check costs one read and one or two atomic writes,
+    whatever the rate.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.SEARCH_THROTTLE_CACHE_ALIAS]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        current_key = f"{self.key}:{window}"
+        previous_key = f"{self.key}:{window - 1}"
+
+        counts = self.cache.get_many([previous_key, current_key])
+        self.previous = counts.get(previous_key, 0)
+        self.current = counts.get(current_key, 0)
+        self.cost = self.get_cost(request, view)
+        if self.estimate() + self.cost > self.num_requests:
+            return self.throttle_failure()
+
+        # Two windows back are never read again, so counters expire after that
+        self.current = (
+            self.increment(current_key, self.duration * 2, self.cost) - self.cost
+        )
+        # Concurrent requests may have raced past the check above
+        if self.estimate() + self.cost > self.num_requests:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def get_cost(self, request, view):
+        """How much of the rate a request uses up"""
+        return 1
+
+    def estimate(self):
+        weight = 1 - self.elapsed / self.duration
+        return self.previous * weight + self.current
+
+    def increment(self, key, timeout, delta=1):
+        if self.cache.add(key, delta, timeout):
+            return delta
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # The counter expired between add and incr
+            self.cache.add(key, delta, timeout)
+            return delta
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """Seconds until the weighted count leaves room for the request again"""
+        room = self.num_requests - self.cost
+        if room < 0:
+            return None
+        if self.current > room:
+            # Wait for the next window, then for this one's weight to decay
+            decay = self.duration * (1 - room / self.current)
+            return self.duration - self.elapsed + decay
+        if not self.previous:
+            return None
+        decay = self.duration * (1 - (room - self.current) / self.previous)
+        return max(decay - self.elapsed, 0)
+
+
+class SearchUserRateThrottle(SlidingWindowRateThrottle, UserRateThrottle):
     scope = "search_user"
 
 
-class SearchAnonRateThrottle(AnonRateThrottle):
-    rate = "100/day"
+class SearchAnonRateThrottle(SlidingWindowRateThrottle, AnonRateThrottle):
     scope = "search_anon"
+
+
+class SearchCostRateThrottle(SlidingWindowRateThrottle, UserRateThrottle):
+    """Per-user budget of Elasticsearch cost instead of a request count
+
+    Every query is charged the cost the query converter estimates for it, so
+    a handful of expensive regexp or leading wildcard searches use up the
+    budget while cheap term lookups keep flowing. Batch requests are charged
+    for all their queries. The conversions are cached for the view to reuse.
+    """
+
+    scope = "search_cost"
+
+    def get_cost(self, request, view):
+        data = request.data if hasattr(request.data, "get") else {}
+        queries = data.get("queries")
+        batch = isinstance(queries, list)
+        if batch:
+            # Longer batches are rejected by validation, do not price them
+            queries = queries[: settings.SEARCH_BATCH_MAX_QUERIES]
+        else:
+            queries = [data.get("query")]
+
+        # Invalid queries are rejected before reaching Elasticsearch
+        valid = [
+            query
+            for query in queries
+            if SearchQuerySerializer(data={"query": query}).is_valid()
+        ]
+        service = getattr(view, "search_service", None)
+        if not isinstance(service, SearchService):
+            service = SearchService()
+        if batch:
+            costs = service.query_costs(valid) if valid else []
+        else:
+            costs = [service.query_cost(query) for query in valid]
+
+        # Failed conversions are answered without searching, like term lookups
+        costs += [None] * (len(queries) - len(valid))
+        return max(sum(cost or 1 for cost in costs), 1)
@@ -1,4 +1,19 @@
 from django.urls import path
-from .views import SearchView
+from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    AsyncSearchView,
+    SearchView,
+    SearchBatchView,
+    SearchCountView,
+    SearchExportView,
+    SearchStatsView,
+)
 
-urlpatterns = [path("", SearchView.as_view(), name="search")]
+urlpatterns = [
+    path("", SearchView.as_view(), name="search"),
+    path("async/", csrf_exempt(AsyncSearchView.as_view()), name="search-async"),
+    path("count/", SearchCountView.as_view(), name="search-count"),
+    path("batch/", SearchBatchView.as_view(), name="search-batch"),
+    path("export/", SearchExportView.as_view(), name="search-export"),
+    path("stats/", SearchStatsView.as_view(), name="search-stats"),
+]
@@ -1,34 +1,101 @@
+import itertools
 import logging
+import math
+import zlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.views import View
 from rest_framework.views import APIView
+from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework.parsers import JSONParser
+from rest_framework import exceptions, permissions, status
+from rest_framework.exceptions import NotFound, ParseError, ValidationError
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 
-from .serializers import SearchQuerySerializer, SearchResultSerializer
-from .services import SearchService
-from .pagination import SearchPagination
-from .throttles import SearchUserRateThrottle, SearchAnonRateThrottle
-from .messaging import log_search_query
+from .serializers import (
+    SearchBatchQuerySerializer,
+    SearchQuerySerializer,
+    SearchResultSerializer,
+)
+from .cache import (
+    cache_search_response,
+    get_query_conversion_cache,
+    get_search_response_cache,
+    get_search_result_cache,
+)
+from .coalescing import get_single_flight
+from .converter import (
+    QueryConverterMode,
+    QueryConverterUnavailable,
+    get_embedded_query_converter,
+    get_remote_query_converter,
+)
+from .services import AsyncSearchService, SearchService, get_elasticsearch_pool_stats
+from .pagination import SearchPagination, SearchCursorPagination
+from .prefetch import get_page_prefetcher
+from .renderers import ORJSONResponse, dumps
+from .throttles import (
+    SearchAnonRateThrottle,
+    SearchCostRateThrottle,
+    SearchUserRateThrottle,
+)
+from .authentication import OctoxlabsAuthentication, get_principal_cache
+from .messaging import (
+    get_audit_publisher,
+    log_search_queries,
+    log_search_query,
+    publish_search_log,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def render_search_hits(hits, fields=None):
+    """Shape-checked hits ready to render, or None once logged as invalid"""
+    results = SearchResultSerializer.render_hits(hits, fields)
+    if results is None:
+        # Only full validation can tell what is wrong with them
+        serializer = SearchResultSerializer(data=hits, many=True, fields=fields)
+        serializer.is_valid()
+        logger.error(f"Invalid search results: {serializer.errors}")
+    return results
+
+
+def converter_unavailable_response(error, response_class=Response):
+    """503 for a failing query converter, with Retry-After while its circuit is open"""
+    logger.error(f"Query converter unavailable: {str(error)}")
+    response = response_class(
+        {"error": "Query converter unavailable", "details": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    if error.retry_after:
+        response["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
 class SearchView(APIView):
     pagination_class = SearchPagination
-    throttle_classes = [SearchUserRateThrottle, SearchAnonRateThrottle]
+    cursor_pagination_class = SearchCursorPagination
+    throttle_classes = [
+        SearchUserRateThrottle,
+        SearchAnonRateThrottle,
+        SearchCostRateThrottle,
+    ]
 
     def __init__(self, search_service=None):
         super().__init__()
         self.search_service = search_service or SearchService()
         self.pagination = self.pagination_class()
+        self.cursor_pagination = self.cursor_pagination_class()
 
     @swagger_auto_schema(
         request_body=SearchQuerySerializer,
         responses={
             200: SearchResultSerializer(many=True),
+            304: "Not Modified",
             400: "Bad Request",
             429: "Too Many Requests",
             500: "Internal Server Error",
@@ -49,10 +116,28 @@ class SearchView(APIView):
                 description="Number of results per page",
                 type=openapi.TYPE_INTEGER,
             ),
+            openapi.Parameter(
+                "fields",
+                openapi.IN_QUERY,
+                description=(
+                    "Comma separated host fields to return, e.g. Hostname; "
+                    "every field by default"
+                ),
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description=(
+                    "Cursor pagination token from a previous next_cursor; "
+                    "pass an empty value to start a new cursor"
+                ),
+                type=openapi.TYPE_STRING,
+            ),
         ],
     )
-    @method_decorator(cache_page(60 * 5))  # Cache for 5 minutes
     @log_search_query
+    @cache_search_response
     def post(self, request):
         try:
             # Validate input
@@ -63,34 +148,506 @@ class SearchView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Execute search
             query = serializer.validated_data["query"]
-            results = self.search_service.search(query)
+            if self.cursor_pagination.is_cursor_request(request):
+                return self._cursor_search(request, query)
+
+            try:
+                fields = SearchResultSerializer.parse_fields(
+                    request.query_params.get("fields")
+                )
+            except ValidationError as e:
+                return Response(
+                    {"error": "Invalid input", "details": e.detail},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # Resolve the page window so Elasticsearch only returns that page
+            page_number, page_size = self.pagination.get_page_window(request)
+
+            # Execute search
+            result = self.search_service.search(
+                query,
+                offset=(page_number - 1) * page_size,
+                size=page_size,
+                fields=fields,
+            )
+            self.pagination.validate_page(page_number, page_size, result.total)
 
             # Serialize results
-            result_serializer = SearchResultSerializer(data=results, many=True)
-            if not result_serializer.is_valid():
-                logger.error(f"Invalid search results: {result_serializer.errors}")
+            results = render_search_hits(result.hits, fields)
+            if results is None:
                 return Response(
                     {"error": "Invalid search results"},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 )
 
-            # Paginate results
-            page = self.pagination.paginate_queryset(result_serializer.data, request)
-            if page is not None:
-                response_data = {"total": len(result_serializer.data), "results": page}
-                return Response(response_data)
-
             response_data = {
-                "total": len(result_serializer.data),
-                "results": result_serializer.data,
+                "total": result.total,
+                "results": results,
             }
             return Response(response_data)
 
+        except ParseError as e:
+            return Response(
+                {"error": "Invalid input", "details": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except NotFound:
+            # Pages outside the results get DRF's 404
+            raise
+        except QueryConverterUnavailable as e:
+            return converter_unavailable_response(e)
         except Exception as e:
             logger.error(f"Search failed: {str(e)}", exc_info=True)
             return Response(
                 {"error": "Search failed", "details": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+    def _cursor_search(self, request, query):
+        """Serve a page of results through point-in-time cursor pagination"""
+        page_size = self.cursor_pagination.get_page_size(request)
+        pit_id, search_after = self.cursor_pagination.decode_cursor(request, query)
+        result = self.search_service.cursor_search(
+            query, size=page_size, pit_id=pit_id, search_after=search_after
+        )
+
+        results = render_search_hits(result.hits)
+        if results is None:
+            return Response(
+                {"error": "Invalid search results"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return Response(
+            {
+                "results": results,
+                "next_cursor": self.cursor_pagination.encode_cursor(result, query),
+            }
+        )
+
+
+class AsyncSearchView(View):
+    """Non-blocking /search/ for ASGI deployments
+
+    Authenticates, throttles and validates like ``SearchView``, then awaits the
+    converter and Elasticsearch instead of holding a worker thread. Serves
+    page-number pagination; cursors and response caching stay on /search/.
+    """
+
+    http_method_names = ["post"]
+    authentication_classes = [OctoxlabsAuthentication]
+    throttle_classes = [
+        SearchUserRateThrottle,
+        SearchAnonRateThrottle,
+        SearchCostRateThrottle,
+    ]
+    pagination_class = SearchPagination
+
+    def __init__(self, search_service=None, **kwargs):
+        super().__init__(**kwargs)
+        self.search_service = search_service
+        self.pagination = self.pagination_class()
+
+    async def post(self, request):
+        request = Request(
+            request,
+            parsers=[JSONParser()],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        search_service = self.search_service or AsyncSearchService()
+        try:
+            # Authentication and throttling hit the database and cache backend
+            await sync_to_async(self.check_permissions)(request)
+            # The cost throttle prices the query from its cached conversion
+            await self.prime_conversion(request, search_service)
+            await sync_to_async(self.check_throttles)(request)
+        except exceptions.APIException as e:
+            status_code = e.status_code
+            if isinstance(
+                e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+            ):
+                # No WWW-Authenticate scheme, so DRF answers these with 403 too
+                status_code = status.HTTP_403_FORBIDDEN
+            return ORJSONResponse({"detail": e.detail}, status=status_code)
+
+        try:
+            serializer = SearchQuerySerializer(data=request.data)
+            if not serializer.is_valid():
+                return ORJSONResponse(
+                    {"error": "Invalid input", "details": serializer.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            query = serializer.validated_data["query"]
+            publish_search_log(request, query)
+
+            try:
+                fields = SearchResultSerializer.parse_fields(
+                    request.query_params.get("fields")
+                )
+            except ValidationError as e:
+                return ORJSONResponse(
+                    {"error": "Invalid input", "details": e.detail},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            page_number, page_size = self.pagination.get_page_window(request)
+            result = await search_service.search(
+                query,
+                offset=(page_number - 1) * page_size,
+                size=page_size,
+                fields=fields,
+            )
+            self.pagination.validate_page(page_number, page_size, result.total)
+
+            results = render_search_hits(result.hits, fields)
+            if results is None:
+                return ORJSONResponse(
+                    {"error": "Invalid search results"},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+
+            return ORJSONResponse({"total": result.total, "results": results})
+
+        except NotFound as e:
+            return ORJSONResponse({"detail": e.detail}, status=e.status_code)
+        except QueryConverterUnavailable as e:
+            return converter_unavailable_response(e, response_class=ORJSONResponse)
+        except Exception as e:
+            logger.error(f"Search failed: {str(e)}", exc_info=True)
+            return ORJSONResponse(
+                {"error": "Search failed", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    def check_permissions(self, request):
+        """Same authentication and permission checks as the DRF views"""
+        if not permissions.IsAuthenticated().has_permission(request, self):
+            raise exceptions.NotAuthenticated()
+
+    async def prime_conversion(self, request, search_service):
+        """Convert a valid query on the event loop instead of in the throttle"""
+        serializer = SearchQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return
+        try:
+            await search_service.convert_query(serializer.validated_data["query"])
+        except Exception:
+            # The search converts it again and answers the failure
+            pass
+
+    def check_throttles(self, request):
+        """Same throttle checks as the DRF views"""
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+
+class SearchCountView(APIView):
+    """Count matching hosts, or check that any exist, without fetching them"""
+
+    throttle_classes = [
+        SearchUserRateThrottle,
+        SearchAnonRateThrottle,
+        SearchCostRateThrottle,
+    ]
+
+    def __init__(self, search_service=None):
+        super().__init__()
+        self.search_service = search_service or SearchService()
+
+    @swagger_auto_schema(
+        request_body=SearchQuerySerializer,
+        responses={
+            200: "The number of matching hosts, or whether any exist",
+            400: "Bad Request",
+            429: "Too Many Requests",
+            500: "Internal Server Error",
+            503: "Service Unavailable",
+        },
+        operation_description=(
+            "Count the hosts matching a query string. With exists=true only "
+            "report whether any host matches, which stops at the first match."
+        ),
+        operation_summary="Count hosts",
+        manual_parameters=[
+            openapi.Parameter(
+                "exists",
+                openapi.IN_QUERY,
+                description="Only report whether any host matches",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+        ],
+    )
+    @log_search_query
+    def post(self, request):
+        try:
+            serializer = SearchQuerySerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(
+                    {"error": "Invalid input", "details": serializer.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            query = serializer.validated_data["query"]
+            if request.query_params.get("exists", "").lower() in ("true", "1"):
+                return Response({"exists": self.search_service.exists(query)})
+            return Response({"count": self.search_service.count(query)})
+
+        except QueryConverterUnavailable as e:
+            return converter_unavailable_response(e)
+        except Exception as e:
+            logger.error(f"Count failed: {str(e)}", exc_info=True)
+            return Response(
+                {"error": "Count failed", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class SearchBatchView(APIView):
+    """Run several searches with a single Elasticsearch _msearch round trip"""
+
+    pagination_class = SearchPagination
+    throttle_classes = [
+        SearchUserRateThrottle,
+        SearchAnonRateThrottle,
+        SearchCostRateThrottle,
+    ]
+
+    def __init__(self, search_service=None):
+        super().__init__()
+        self.search_service = search_service or SearchService()
+        self.pagination = self.pagination_class()
+
+    @swagger_auto_schema(
+        request_body=SearchBatchQuerySerializer,
+        responses={
+            200: "Per-query results or errors, in request order",
+            400: "Bad Request",
+            429: "Too Many Requests",
+            500: "Internal Server Error",
+            503: "Service Unavailable",
+        },
+        operation_description=(
+            "Search for hosts with several query strings at once. "
+            "The page window applies to every query."
+        ),
+        operation_summary="Batch search hosts",
+        manual_parameters=[
+            openapi.Parameter(
+                "page",
+                openapi.IN_QUERY,
+                description="Page number",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="Number of results per page",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+    )
+    @log_search_queries
+    def post(self, request):
+        try:
+            serializer = SearchBatchQuerySerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(
+                    {"error": "Invalid input", "details": serializer.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            queries = serializer.validated_data["queries"]
+            page_number, page_size = self.pagination.get_page_window(request)
+
+            # Validate every query on its own, only valid ones reach Elasticsearch
+            items = [None] * len(queries)
+            valid = []
+            for index, query in enumerate(queries):
+                query_serializer = SearchQuerySerializer(data={"query": query})
+                if query_serializer.is_valid():
+                    valid.append((index, query_serializer.validated_data["query"]))
+                else:
+                    items[index] = {
+                        "error": "Invalid input",
+                        "details": query_serializer.errors,
+                    }
+
+            results = self.search_service.multi_search(
+                [query for _, query in valid],
+                offset=(page_number - 1) * page_size,
+                size=page_size,
+            )
+            for (index, _), result in zip(valid, results):
+                items[index] = self._render_result(result, page_number, page_size)
+
+            return Response({"results": items})
+
+        except NotFound:
+            raise
+        except Exception as e:
+            logger.error(f"Batch search failed: {str(e)}", exc_info=True)
+            return Response(
+                {"error": "Batch search failed", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    def _render_result(self, result, page_number, page_size):
+        if isinstance(result, QueryConverterUnavailable):
+            return {"error": "Query converter unavailable", "details": str(result)}
+        if isinstance(result, Exception):
+            return {"error": "Search failed", "details": str(result)}
+
+        try:
+            self.pagination.validate_page(page_number, page_size, result.total)
+        except NotFound as e:
+            return {"error": "Invalid page", "details": str(e.detail)}
+
+        results = render_search_hits(result.hits)
+        if results is None:
+            return {"error": "Invalid search results"}
+
+        return {"total": result.total, "results": results}
+
+
+class SearchExportView(APIView):
+    """Stream every host matching a query as newline-delimited JSON"""
+
+    throttle_classes = [
+        SearchUserRateThrottle,
+        SearchAnonRateThrottle,
+        SearchCostRateThrottle,
+    ]
+
+    def __init__(self, search_service=None):
+        super().__init__()
+        self.search_service = search_service or SearchService()
+
+    @swagger_auto_schema(
+        request_body=SearchQuerySerializer,
+        responses={
+            200: "Newline-delimited JSON, one host per line",
+            400: "Bad Request",
+            429: "Too Many Requests",
+            500: "Internal Server Error",
+            503: "Service Unavailable",
+        },
+        operation_description=(
+            "Export all hosts matching a query as a stream of NDJSON. "
+            "The stream is gzip compressed when the client accepts gzip."
+        ),
+        operation_summary="Export hosts",
+    )
+    @log_search_query
+    def post(self, request):
+        serializer = SearchQuerySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            batches = self.search_service.iter_search_batches(
+                serializer.validated_data["query"],
+                batch_size=settings.SEARCH_EXPORT_BATCH_SIZE,
+            )
+            # Fetch the first batch eagerly so failures still get an error status
+            first_batch = next(batches, [])
+        except QueryConverterUnavailable as e:
+            return converter_unavailable_response(e)
+        except Exception as e:
+            logger.error(f"Export failed: {str(e)}", exc_info=True)
+            return Response(
+                {"error": "Export failed", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        content = self._render_ndjson(first_batch, batches)
+        gzip_stream = self._accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if gzip_stream:
+            content = self._gzip(content)
+
+        response = StreamingHttpResponse(content, content_type="application/x-ndjson")
+        if gzip_stream:
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+    @staticmethod
+    def _render_ndjson(first_batch, batches):
+        try:
+            for batch in itertools.chain([first_batch], batches):
+                yield b"".join(dumps(hit) + b"\n" for hit in batch)
+        except Exception as e:
+            # Headers are already sent, so all we can do is cut the stream short
+            logger.error(f"Export stream failed: {str(e)}", exc_info=True)
+        finally:
+            # Releases the point-in-time when the client goes away early
+            batches.close()
+
+    @staticmethod
+    def _accepts_gzip(accept_encoding):
+        """Whether an Accept-Encoding header admits gzip, honouring q-values"""
+        qualities = {}
+        for coding in accept_encoding.split(","):
+            name, *params = coding.split(";")
+            quality = 1.0
+            for param in params:
+                key, _, value = param.partition("=")
+                if key.strip().lower() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        # An unreadable weight is not an acceptance
+                        quality = 0.0
+            qualities[name.strip().lower()] = quality
+
+        # An explicit gzip entry wins over the * wildcard
+        for coding in ("gzip", "x-gzip", "*"):
+            if coding in qualities:
+                return qualities[coding] > 0
+        return False
+
+    @staticmethod
+    def _gzip(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        try:
+            for chunk in chunks:
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+        finally:
+            chunks.close()
+
+
+class SearchStatsView(APIView):
+    """Operational statistics of the search layer for the current process"""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Report search layer statistics for this process",
+        operation_summary="Search statistics",
+    )
+    def get(self, request):
+        stats = {
+            "elasticsearch_pool": get_elasticsearch_pool_stats(),
+            "result_cache": get_search_result_cache().stats(),
+            "response_cache": get_search_response_cache().stats(),
+            "conversion_cache": get_query_conversion_cache().stats(),
+            "single_flight": get_single_flight().stats(),
+            "audit_publisher": get_audit_publisher().stats(),
+            "principal_cache": get_principal_cache().stats(),
+        }
+        if settings.SEARCH_PREFETCH_ENABLED:
+            stats["prefetch"] = get_page_prefetcher().stats()
+        if settings.QUERY_CONVERTER_MODE == QueryConverterMode.EMBEDDED:
+            stats["query_converter"] = get_embedded_query_converter().stats()
+        else:
+            stats["query_converter"] = get_remote_query_converter().stats()
+        return Response(stats)
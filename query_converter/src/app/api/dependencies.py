@@ -1,7 +1,19 @@
 from functools import lru_cache
+from ..core.config import settings
 from ..services.converter_service import ConverterService
+from ..services.field_registry import FieldRegistry
+
+
+@lru_cache()
+def get_field_registry() -> FieldRegistry:
+    return FieldRegistry.from_file(settings.SEARCH_FIELDS_FILE)
 
 
 @lru_cache()
 def get_converter_service() -> ConverterService:
-    return ConverterService()
+    return ConverterService(
+        cache_size=settings.CONVERSION_CACHE_SIZE,
+        max_cost=settings.QUERY_MAX_COST,
+        max_determinized_states=settings.REGEXP_MAX_DETERMINIZED_STATES,
+        registry=get_field_registry(),
+    )
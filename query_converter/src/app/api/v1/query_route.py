@@ -1,11 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from loguru import logger
+from pydantic import ValidationError
 
-from ...schemas.query_schema import QueryRequest, QueryResponse
+from ...schemas.query_schema import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    BatchQueryResult,
+    ConversionCacheStats,
+    QueryRequest,
+    QueryResponse,
+)
 from ...services.converter_service import ConverterService
 from ...api.dependencies import get_converter_service
 
-
 router = APIRouter(tags=["Query"])
 
 
@@ -27,14 +34,69 @@ async def convert(
     - **query**: Query string to convert (e.g., "Hostname=octoxlabs*")
 
     Returns:
-    - Converted Elasticsearch query
+    - Converted Elasticsearch query and its estimated cost
     """
     try:
         logger.info(f"Received query: {request.query}")
-        es_query = converter_service.convert_query(request.query)
-        logger.debug(f"Converted query: {es_query}")
-        return QueryResponse(query=es_query)
+        result = converter_service.convert(request.query)
+        logger.debug(f"Converted query: {result.query}")
+        return QueryResponse(query=result.query, cost=result.cost)
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"Query conversion failed: {str(e)}"
         )
+
+
+@router.post(
+    "/convert/batch",
+    response_model=BatchQueryResponse,
+    response_model_exclude_none=True,
+    status_code=200,
+    summary="Convert several queries to Elasticsearch format",
+    description="Convert a list of queries, with a result or an error per query",
+)
+async def convert_batch(
+    request: BatchQueryRequest,
+    converter_service: ConverterService = Depends(get_converter_service),
+):
+    """
+    Convert several query strings to Elasticsearch format in one request
+
+    Parameters:
+    - **queries**: Query strings to convert (e.g., ["Hostname=octoxlabs*"])
+
+    Returns:
+    - The converted query or an error for every query, in order
+    """
+    logger.info(f"Received batch of {len(request.queries)} queries")
+    results = []
+    for query in request.queries:
+        try:
+            # Same validation and conversion cache as /convert
+            validated = QueryRequest(query=query)
+            result = converter_service.convert(validated.query)
+            results.append(BatchQueryResult(query=result.query, cost=result.cost))
+        except ValidationError as e:
+            reason = "; ".join(error["msg"] for error in e.errors())
+            results.append(BatchQueryResult(error=f"Invalid query: {reason}"))
+        except Exception as e:
+            results.append(BatchQueryResult(error=f"Query conversion failed: {str(e)}"))
+    return BatchQueryResponse(results=results)
+
+
+@router.get(
+    "/convert/stats",
+    response_model=ConversionCacheStats,
+    summary="Conversion cache statistics",
+    description="Report hits, misses and evictions of the conversion cache",
+)
+async def convert_stats(
+    converter_service: ConverterService = Depends(get_converter_service),
+):
+    """
+    Report conversion cache statistics of this process
+
+    Returns:
+    - Hit, miss and eviction counters with the current and maximum size
+    """
+    return ConversionCacheStats(**converter_service.cache.stats())
@@ -5,7 +5,8 @@ from starlette.config import Config
 
 current_file_dir = os.path.dirname(os.path.realpath(__file__))
 env_path = os.path.join(current_file_dir, "..", "..", ".env")
-config = Config(env_path)
+# Without a .env file, settings come from the environment and their defaults
+config = Config(env_path if os.path.isfile(env_path) else None)
 
 
 class AppSettings(BaseSettings):
@@ -28,6 +29,21 @@ class LoggingSettings(BaseSettings):
     LOG_RETENTION: str = config.get("LOG_RETENTION", default="10 days")
 
 
+class ConverterSettings(BaseSettings):
+    CONVERSION_CACHE_SIZE: int = config("CONVERSION_CACHE_SIZE", cast=int, default=1024)
+    QUERY_MAX_COST: int = config("QUERY_MAX_COST", cast=int, default=100)
+    REGEXP_MAX_DETERMINIZED_STATES: int = config(
+        "REGEXP_MAX_DETERMINIZED_STATES", cast=int, default=10000
+    )
+    # Index mapping of the searchable fields, shared with octoapi
+    SEARCH_FIELDS_FILE: str = config(
+        "SEARCH_FIELDS_FILE",
+        default=os.path.join(
+            current_file_dir, "..", "..", "..", "..", "search_fields.json"
+        ),
+    )
+
+
 class EnvironmentOption(Enum):
     LOCAL = "local"
     STAGING = "staging"
@@ -41,6 +57,7 @@ class EnvironmentSettings(BaseSettings):
 class Settings(
     AppSettings,
     LoggingSettings,
+    ConverterSettings,
     EnvironmentSettings,
 ):
     pass
@@ -1,6 +1,7 @@
 from loguru import logger
 
 from .api import router
+from .api.dependencies import get_converter_service
 from .core.config import settings
 from .core.setup import create_application
 
@@ -8,3 +9,6 @@ logger.info("Initializing query converter service...")
 logger.info(f"Environment: {settings.ENVIRONMENT}")
 
 app = create_application(router=router, settings=settings)
+
+# Load the searchable fields now, so a bad mapping file fails at startup
+get_converter_service()
@@ -1,13 +1,13 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Dict
+from typing import Dict, List, Optional
 
 
 class QueryRequest(BaseModel):
     query: str = Field(
         description="Query string to convert",
-        example="Hostname=octoxlabs*",
+        example="Hostname=octoxlabs* AND NOT Ip=10.0.0.1",
         min_length=1,
-        max_length=50,
+        max_length=200,
     )
 
     @field_validator("query")
@@ -16,14 +16,52 @@ class QueryRequest(BaseModel):
         if any(char in v for char in [";", "--", "/*", "*/"]):
             raise ValueError("Query contains invalid characters")
 
-        field = v.split("=")[0].strip().lower()
-        allowed_fields = {"hostname", "ip"}
-        if field not in allowed_fields:
-            raise ValueError(
-                f"Invalid field name: {field}. Allowed fields are: {', '.join(allowed_fields)}"
-            )
+        # Syntax and field names are checked by the converter, which answers
+        # a query it cannot parse with a 400
         return v
 
 
 class QueryResponse(BaseModel):
     query: Dict = Field(description="Converted Elasticsearch query")
+    cost: int = Field(
+        description="Estimated Elasticsearch cost of the query, a term lookup costs 1"
+    )
+
+
+# Queries accepted by a single /convert/batch request
+MAX_BATCH_QUERIES = 100
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(
+        description="Query strings to convert, each validated like /convert",
+        examples=[["Hostname=octoxlabs*", "Ip=10.0.0.1"]],
+        min_length=1,
+        max_length=MAX_BATCH_QUERIES,
+    )
+
+
+class BatchQueryResult(BaseModel):
+    query: Optional[Dict] = Field(
+        default=None, description="Converted Elasticsearch query"
+    )
+    cost: Optional[int] = Field(
+        default=None, description="Estimated Elasticsearch cost of the query"
+    )
+    error: Optional[str] = Field(
+        default=None, description="Why this query could not be converted"
+    )
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult] = Field(
+        description="One result per query, in the order they were given"
+    )
+
+
+class ConversionCacheStats(BaseModel):
+    hits: int = Field(description="Conversions answered from the cache")
+    misses: int = Field(description="Conversions that had to parse the query")
+    evictions: int = Field(description="Entries evicted to stay within max_entries")
+    entries: int = Field(description="Queries currently cached")
+    max_entries: int = Field(description="Configured cache size")
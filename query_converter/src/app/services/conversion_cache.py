@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional
+import threading
+
+if TYPE_CHECKING:
+    from .converter_service import ConversionResult
+
+
+class ConversionCache:
+    """
+    Bounded LRU cache of canonical query strings to their conversion results.
+
+    Cached results are shared between callers and must not be modified.
+    A ``max_entries`` of 0 disables caching.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ConversionResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional["ConversionResult"]:
+        """Return the cached result for ``key``, or None on a miss."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return result
+
+    def set(self, key: str, result: "ConversionResult") -> None:
+        """Cache ``result``, evicting the least recently used entries when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
@@ -1,83 +1,182 @@
-from typing import Dict, Any
-import re
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
 
+from .conversion_cache import ConversionCache
+from .field_registry import FieldRegistry, SearchField
+from .query_analyzer import QueryAnalyzer, QueryType
+from .query_parser import BoolExpression, Clause, Node, Operator, parse_query
 
-class QueryType:
-    """Constants for different query types."""
 
-    WILDCARD = "wildcard"
-    REGEXP = "regexp"
-    TERM = "term"
+@dataclass(frozen=True)
+class ConversionResult:
+    """Converted query DSL with its estimated Elasticsearch cost."""
+
+    query: Dict[str, Any]
+    cost: int
 
 
 class ConverterService:
     """Service for converting simple query strings to Elasticsearch query DSL."""
 
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        max_cost: int = 100,
+        max_determinized_states: int = 10000,
+        registry: Optional[FieldRegistry] = None,
+    ) -> None:
+        """
+        Args:
+            cache_size (int): Converted queries kept in the LRU conversion
+                            cache, 0 disables it
+            max_cost (int): Highest estimated cost a query may have, 0
+                          accepts any query
+            max_determinized_states (int): Cap on the automaton size of
+                                         regexp queries
+            registry (Optional[FieldRegistry]): Searchable fields; without
+                                              one any field is accepted as
+                                              a keyword field
+        """
+        self.cache = ConversionCache(max_entries=cache_size)
+        self.max_cost = max_cost
+        self.analyzer = QueryAnalyzer(max_determinized_states=max_determinized_states)
+        self.registry = registry
+
     def convert_query(self, query_string: str) -> Dict[str, Any]:
         """
-        Convert a simple query string to Elasticsearch query DSL.
+        Convert a query string to Elasticsearch query DSL.
 
         Args:
-            query_string (str): Query string in format "field = value"
-                              Supports wildcard (*) and regex (/) patterns.
+            query_string (str): Query string, see ``convert``
 
         Returns:
             Dict[str, Any]: Elasticsearch query DSL
 
         Raises:
-            ValueError: If query format is invalid or empty
+            ValueError: If query format is invalid, empty or too expensive
+        """
+        return self.convert(query_string).query
+
+    def convert(self, query_string: str) -> ConversionResult:
+        r"""
+        Convert a query string to Elasticsearch query DSL and estimate its cost.
+
+        Args:
+            query_string (str): One or more "field = value" clauses combined
+                              with AND, OR, NOT and parentheses.
+                              Supports wildcard (*) and regex (/) patterns.
+
+        Returns:
+            ConversionResult: Elasticsearch query DSL and its cost. A single
+                            clause converts to a single leaf query, anything
+                            else to one bool query whose clauses all run in
+                            filter context. Each clause is rewritten to the
+                            cheapest equivalent query for its field type,
+                            under the canonical field name. Repeated queries
+                            return the same cached result, which must not be
+                            modified.
+
+        Raises:
+            ValueError: If query format is invalid or empty, it uses a field
+                        missing from the registry or a pattern its type does
+                        not support, or its estimated cost is above
+                        ``max_cost``
 
         Examples:
             >>> converter = ConverterService()
+            >>> converter.convert_query("Hostname = octo*labs")
+            {"wildcard": {"Hostname": "octo*labs"}}
             >>> converter.convert_query("Hostname = octoxlabs*")
-            {"wildcard": {"Hostname": "octoxlabs*"}}
-            >>> converter.convert_query("IP = /192\.168\.1\.*/")
-            {"regexp": {"IP": "192\.168\.1\.*"}}
+            {"prefix": {"Hostname": "octoxlabs"}}
+            >>> converter.convert_query("IP = /192\.168\.1\.[0-9]+/")
+            {"regexp": {"IP": {"value": "192\.168\.1\.[0-9]+",
+                               "max_determinized_states": 10000}}}
             >>> converter.convert_query("Status = active")
             {"term": {"Status": "active"}}
+            >>> converter.convert_query("Hostname = octo* AND NOT Ip = 10.0.0.1")
+            {"bool": {"filter": [{"prefix": {"Hostname": "octo"}}],
+                      "must_not": [{"term": {"Ip": "10.0.0.1"}}]}}
         """
         if not query_string or not isinstance(query_string, str):
             raise ValueError("Query string must be a non-empty string")
 
-        logger.info(f"Converting query: {query_string}")
+        # Repeated queries are answered from the cache without parsing
+        key = query_string.strip()
+        cached: Optional[ConversionResult] = self.cache.get(key)
+        if cached is not None:
+            return cached
 
-        # Simple parser for "field = value" format
-        pattern = r"(\w+)\s*=\s*(.+)"
-        match = re.match(pattern, query_string.strip())
+        logger.info(f"Converting query: {query_string}")
 
-        if not match:
+        try:
+            node = parse_query(query_string)
+        except ValueError:
             logger.error(f"Invalid query format: {query_string}")
-            raise ValueError(f"Invalid query format: {query_string}")
-
-        field, value = match.groups()
-        value = value.strip()
-        logger.debug(f"Parsed field: {field}, value: {value}")
-
-        result = self._create_query(field, value)
-        logger.info(f"Successfully converted query to: {result}")
+            raise
+        logger.debug(f"Parsed query: {node}")
+
+        query, cost = self._compile(node)
+        if isinstance(node, BoolExpression) and node.operator == Operator.OR:
+            # Keep the alternatives in filter context too
+            query = {QueryType.BOOL: {"filter": [query]}}
+
+        if self.max_cost and cost > self.max_cost:
+            logger.error(f"Query too expensive ({cost}): {query_string}")
+            raise ValueError(
+                f"Query too expensive: estimated cost {cost} exceeds {self.max_cost}"
+            )
+
+        result = ConversionResult(query=query, cost=cost)
+        logger.info(f"Successfully converted query to: {query} (cost {cost})")
+        self.cache.set(key, result)
         return result
 
-    def _create_query(self, field: str, value: str) -> Dict[str, Any]:
+    def _compile(self, node: Node) -> Tuple[Dict[str, Any], int]:
         """
-        Create appropriate Elasticsearch query based on value pattern.
+        Compile a syntax tree into Elasticsearch query DSL.
 
         Args:
-            field (str): Field name
-            value (str): Field value
+            node (Node): Clause or boolean expression
 
         Returns:
-            Dict[str, Any]: Elasticsearch query DSL
+            Tuple[Dict[str, Any], int]: Elasticsearch query DSL and its cost,
+                                      the sum of the costs of its clauses
         """
-        if "*" in value:
-            logger.debug("Using wildcard query")
-            return {QueryType.WILDCARD: {field: value}}
-        elif value.startswith("/") and value.endswith("/"):
-            # Regex query
-            regex_pattern = value[1:-1]
-            logger.debug(f"Using regex query with pattern: {regex_pattern}")
-            return {QueryType.REGEXP: {field: regex_pattern}}
-        else:
-            # Term query for exact match
-            logger.debug("Using term query for exact match")
-            return {QueryType.TERM: {field: value}}
+        if isinstance(node, Clause):
+            analyzed = self.analyzer.analyze(self._field(node.field), node.value)
+            return analyzed.query, analyzed.cost
+        if node.operator == Operator.OR:
+            compiled = [self._compile(operand) for operand in node.operands]
+            query = {
+                QueryType.BOOL: {
+                    "should": [operand for operand, _ in compiled],
+                    "minimum_should_match": 1,
+                }
+            }
+            return query, sum(cost for _, cost in compiled)
+        clauses, cost = self._conjunction(node)
+        return {QueryType.BOOL: clauses}, cost
+
+    def _field(self, name: str) -> SearchField:
+        """Resolve a field name through the registry, if there is one."""
+        if self.registry is None:
+            return SearchField(name, "keyword")
+        return self.registry.resolve(name)
+
+    def _conjunction(
+        self, node: BoolExpression
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+        """Split the operands of an AND or NOT into filter and must_not clauses."""
+        operands = node.operands if node.operator == Operator.AND else (node,)
+        clauses: Dict[str, List[Dict[str, Any]]] = {}
+        total = 0
+        for operand in operands:
+            if isinstance(operand, BoolExpression) and operand.operator == Operator.NOT:
+                query, cost = self._compile(operand.operands[0])
+                clauses.setdefault("must_not", []).append(query)
+            else:
+                query, cost = self._compile(operand)
+                clauses.setdefault("filter", []).append(query)
+            total += cost
+        return clauses, total
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+from loguru import logger
+
+
+class FieldType:
+    """Families of Elasticsearch field types, by the queries they support."""
+
+    # Exact values, matched by term, prefix, wildcard and regexp queries
+    KEYWORD = frozenset({"keyword", "constant_keyword", "wildcard"})
+    # Analyzed values, matched token by token
+    TEXT = frozenset({"text", "match_only_text"})
+    IP = "ip"
+
+
+@dataclass(frozen=True)
+class SearchField:
+    """A searchable field of the index mapping."""
+
+    name: str
+    type: str
+    # Keyword subfield of a text field, used for exact matching
+    keyword: Optional[str] = None
+
+
+class FieldRegistry:
+    """
+    Searchable fields by case-insensitive name, built from an index mapping.
+
+    The mapping is the body used to create the index (``{"mappings":
+    {"properties": ...}}``) or just its ``properties``. Every top-level
+    property is searchable under its canonical mapping name, and text
+    fields remember their keyword subfield so exact matches can use it.
+    """
+
+    def __init__(self, fields: Iterable[SearchField]) -> None:
+        self._fields = {field.name.lower(): field for field in fields}
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, Any]) -> "FieldRegistry":
+        """
+        Build a registry from an Elasticsearch index mapping.
+
+        Args:
+            mapping (Dict[str, Any]): Index mapping, with or without the
+                                    top-level "mappings" key
+
+        Returns:
+            FieldRegistry: One field per top-level mapping property
+
+        Raises:
+            ValueError: If the mapping has no properties
+        """
+        properties = mapping.get("mappings", mapping).get("properties")
+        if not properties:
+            raise ValueError("Index mapping has no properties")
+
+        fields = []
+        for name, spec in properties.items():
+            keyword = None
+            for subname, subspec in spec.get("fields", {}).items():
+                if subspec.get("type") in FieldType.KEYWORD:
+                    keyword = f"{name}.{subname}"
+                    break
+            fields.append(SearchField(name, spec.get("type", "object"), keyword))
+        return cls(fields)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FieldRegistry":
+        """
+        Build a registry from a JSON file holding an index mapping.
+
+        Args:
+            path (str): Path of the mapping file
+
+        Returns:
+            FieldRegistry: One field per top-level mapping property
+        """
+        with open(path, encoding="utf-8") as mapping_file:
+            registry = cls.from_mapping(json.load(mapping_file))
+        logger.info(f"Loaded searchable fields {', '.join(registry.names)} from {path}")
+        return registry
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """Canonical names of the searchable fields, sorted."""
+        return tuple(sorted(field.name for field in self._fields.values()))
+
+    def resolve(self, name: str) -> SearchField:
+        """
+        Look up a field by name, ignoring case.
+
+        Args:
+            name (str): Field name as written in the query
+
+        Returns:
+            SearchField: The field under its canonical name
+
+        Raises:
+            ValueError: If no such field is searchable
+        """
+        field = self._fields.get(name.lower())
+        if field is None:
+            raise ValueError(
+                f"Invalid field name: {name.lower()}. "
+                f"Allowed fields are: {', '.join(self.names)}"
+            )
+        return field
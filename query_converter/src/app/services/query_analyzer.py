@@ -0,0 +1,206 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import re
+from loguru import logger
+
+from .field_registry import FieldType, SearchField
+
+
+class QueryType:
+    """Constants for different query types."""
+
+    WILDCARD = "wildcard"
+    REGEXP = "regexp"
+    TERM = "term"
+    MATCH_PHRASE = "match_phrase"
+    PREFIX = "prefix"
+    EXISTS = "exists"
+    BOOL = "bool"
+
+
+class QueryCost:
+    """Estimated Elasticsearch cost of each query type, in term lookups."""
+
+    TERM = 1
+    PREFIX = 2
+    MATCH_PHRASE = 2
+    WILDCARD = 5
+    LEADING_WILDCARD = 25
+    REGEXP = 20
+    UNBOUNDED_REGEXP = 50
+    # Extra cost per additional wildcard or unbounded repetition
+    PER_REPETITION = 5
+
+
+# Characters with a meaning in Lucene regexps (with the default ALL flags)
+REGEXP_METACHARACTERS = frozenset('.?+*|{}[]()"#@&<>~')
+# Escaped letters standing for a character class (\d digit, \s space, \w word)
+REGEXP_CHARACTER_CLASSES = frozenset("dDsSwW")
+UNBOUNDED_REPETITION = re.compile(r"[*+]|\{\d+,\}")
+# Runs of .* and of * outside backslash escapes: an escape pair (\\) before
+# them is kept, while an odd backslash makes the first character a literal
+REPEATED_MATCH_ANY = re.compile(r"(?<!\\)((?:\\\\)*)(?:\.\*){2,}")
+REPEATED_WILDCARD = re.compile(r"(?<!\\)((?:\\\\)*)\*{2,}")
+# Leading whole octets of an IPv4 address followed by a trailing wildcard
+IPV4_PREFIX = re.compile(r"((?:\d{1,3}\.){1,3})\*")
+
+
+@dataclass(frozen=True)
+class AnalyzedClause:
+    """The cheapest query equivalent to a clause, with its estimated cost."""
+
+    query: Dict[str, Any]
+    cost: int
+
+
+class QueryAnalyzer:
+    """
+    Cost analysis and rewriting of ``field = value`` clauses.
+
+    Every clause is rewritten into the cheapest query matching the same
+    terms: a wildcard with only a trailing ``*`` becomes a ``prefix`` query,
+    a lone ``*`` an ``exists`` query, and a regexp without metacharacters a
+    ``term`` query. Redundant ``**`` and ``.*.*`` runs are collapsed, and
+    the automaton of the regexps left is capped at ``max_determinized_states``.
+    Costs use the pattern shape, so the patterns that walk the whole term
+    dictionary (leading wildcards, regexps starting with ``.*``) cost most.
+
+    The field type decides what is correct: text fields are matched exactly
+    on their keyword subfield, or with a phrase query when they have none,
+    ``ip`` fields turn whole-octet prefixes into a CIDR term, and other
+    non-string fields only accept exact values.
+    """
+
+    def __init__(self, max_determinized_states: int = 10000) -> None:
+        self.max_determinized_states = max_determinized_states
+
+    def analyze(self, field: SearchField, value: str) -> AnalyzedClause:
+        """
+        Pick the query type of a clause from its field type and value pattern.
+
+        Args:
+            field (SearchField): Field of the clause
+            value (str): Field value, a /regexp/ or a pattern with wildcards
+
+        Returns:
+            AnalyzedClause: Elasticsearch query DSL and its estimated cost
+
+        Raises:
+            ValueError: If the field type does not support the value pattern
+        """
+        is_regexp = len(value) > 1 and value.startswith("/") and value.endswith("/")
+        # a**b matches exactly what a*b matches
+        pattern = value if is_regexp else REPEATED_WILDCARD.sub(r"\1*", value)
+        if pattern == "*":
+            logger.debug("Rewriting match-all wildcard to an exists query")
+            return AnalyzedClause(
+                {QueryType.EXISTS: {"field": field.name}}, QueryCost.TERM
+            )
+
+        if field.type in FieldType.TEXT:
+            if field.keyword is None:
+                return self._analyze_text(field.name, pattern, is_regexp)
+            field = SearchField(field.keyword, "keyword")
+        elif field.type not in FieldType.KEYWORD:
+            return self._analyze_exact(field, pattern, is_regexp)
+
+        if is_regexp:
+            return self._analyze_regexp(field.name, pattern[1:-1])
+        if "*" in pattern:
+            return self._analyze_wildcard(field.name, pattern)
+        logger.debug("Using term query for exact match")
+        return AnalyzedClause({QueryType.TERM: {field.name: pattern}}, QueryCost.TERM)
+
+    def _analyze_text(
+        self, field: str, pattern: str, is_regexp: bool
+    ) -> AnalyzedClause:
+        # Patterns match single tokens of the analyzed text
+        if is_regexp:
+            return self._analyze_regexp(field, pattern[1:-1])
+        if "*" in pattern:
+            return self._analyze_wildcard(field, pattern)
+        logger.debug("Using phrase query for text field without keyword subfield")
+        return AnalyzedClause(
+            {QueryType.MATCH_PHRASE: {field: pattern}}, QueryCost.MATCH_PHRASE
+        )
+
+    def _analyze_exact(
+        self, field: SearchField, pattern: str, is_regexp: bool
+    ) -> AnalyzedClause:
+        ipv4_prefix = IPV4_PREFIX.fullmatch(pattern)
+        if field.type == FieldType.IP and ipv4_prefix and not is_regexp:
+            octets = ipv4_prefix.group(1).rstrip(".").split(".")
+            if all(int(octet) <= 255 for octet in octets):
+                logger.debug("Rewriting IP prefix wildcard to a CIDR term query")
+                address = ".".join(octets + ["0"] * (4 - len(octets)))
+                cidr = f"{address}/{8 * len(octets)}"
+                return AnalyzedClause(
+                    {QueryType.TERM: {field.name: cidr}}, QueryCost.TERM
+                )
+        if is_regexp or "*" in pattern:
+            raise ValueError(
+                f"Field {field.name} of type {field.type} does not support "
+                "wildcard or regexp patterns"
+            )
+        logger.debug("Using term query for exact match")
+        return AnalyzedClause({QueryType.TERM: {field.name: pattern}}, QueryCost.TERM)
+
+    def _analyze_wildcard(self, field: str, pattern: str) -> AnalyzedClause:
+        wildcards = pattern.count("*") + pattern.count("?")
+        if wildcards == 1 and pattern.endswith("*"):
+            logger.debug("Rewriting trailing wildcard to a prefix query")
+            return AnalyzedClause(
+                {QueryType.PREFIX: {field: pattern[:-1]}}, QueryCost.PREFIX
+            )
+
+        logger.debug("Using wildcard query")
+        if pattern[0] in "*?":
+            cost = QueryCost.LEADING_WILDCARD
+        else:
+            cost = QueryCost.WILDCARD + (wildcards - 1) * QueryCost.PER_REPETITION
+        return AnalyzedClause({QueryType.WILDCARD: {field: pattern}}, cost)
+
+    def _analyze_regexp(self, field: str, pattern: str) -> AnalyzedClause:
+        literal = self._regexp_literal(pattern)
+        if literal is not None:
+            logger.debug("Rewriting literal regexp to a term query")
+            return AnalyzedClause({QueryType.TERM: {field: literal}}, QueryCost.TERM)
+
+        # .*.* matches exactly what .* matches, with a larger automaton
+        pattern = REPEATED_MATCH_ANY.sub(r"\1.*", pattern)
+        logger.debug(f"Using regex query with pattern: {pattern}")
+        if pattern.startswith((".*", ".+")):
+            cost = QueryCost.UNBOUNDED_REGEXP
+        else:
+            repetitions = len(UNBOUNDED_REPETITION.findall(pattern))
+            cost = QueryCost.REGEXP + repetitions * QueryCost.PER_REPETITION
+        query = {
+            QueryType.REGEXP: {
+                field: {
+                    "value": pattern,
+                    "max_determinized_states": self.max_determinized_states,
+                }
+            }
+        }
+        return AnalyzedClause(query, cost)
+
+    @staticmethod
+    def _regexp_literal(pattern: str) -> Optional[str]:
+        """The string a regexp matches if it has no metacharacters, else None."""
+        literal = []
+        escaped = False
+        for char in pattern:
+            if escaped:
+                if char in REGEXP_CHARACTER_CLASSES:
+                    return None
+                literal.append(char)
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char in REGEXP_METACHARACTERS:
+                return None
+            else:
+                literal.append(char)
+        if escaped or not literal:
+            return None
+        return "".join(literal)
@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from typing import Iterator, List, NoReturn, Tuple, Union
+import re
+
+
+class Operator:
+    """Boolean operators of the query language."""
+
+    AND = "AND"
+    OR = "OR"
+    NOT = "NOT"
+
+
+@dataclass(frozen=True)
+class Clause:
+    """A single ``field = value`` condition."""
+
+    field: str
+    value: str
+
+
+@dataclass(frozen=True)
+class BoolExpression:
+    """Operands combined with AND or OR, or a single negated operand for NOT."""
+
+    operator: str
+    operands: Tuple["Node", ...]
+
+
+Node = Union[Clause, BoolExpression]
+
+FIELD_PATTERN = re.compile(r"(\w+)\s*=\s*")
+OPERATOR_PATTERN = re.compile(r"(AND|OR|NOT)(?=[\s(]|$)")
+# A value ends at the end of the query or before " AND " / " OR "
+VALUE_END_PATTERN = re.compile(r"\s*$|\s+(?:AND|OR)(?=[\s(]|$)")
+# Inside parentheses a value also ends before the closing one
+NESTED_VALUE_END_PATTERN = re.compile(r"\s*$|\s+(?:AND|OR)(?=[\s(]|$)|\s*\)")
+
+
+class QueryParser:
+    """
+    Recursive descent parser for boolean queries over ``field = value`` clauses.
+
+    Grammar, from lowest to highest precedence::
+
+        query   := or_expr
+        or_expr := and_expr ("OR" and_expr)*
+        and_expr := not_expr ("AND" not_expr)*
+        not_expr := "NOT" not_expr | "(" query ")" | clause
+        clause  := field "=" value
+
+    Operators are upper case. Values run up to the next operator, closing
+    parenthesis or the end of the query, so a query made of a single clause
+    parses exactly like before the boolean operators existed. Values wrapped
+    in slashes are regexps, which may contain spaces and parentheses.
+    """
+
+    def __init__(self, query_string: str) -> None:
+        self.query = query_string
+        self.pos = 0
+        self.depth = 0
+
+    def parse(self) -> Node:
+        """
+        Parse the whole query string.
+
+        Returns:
+            Node: A Clause, or a BoolExpression combining several of them
+
+        Raises:
+            ValueError: If the query does not follow the grammar
+        """
+        node = self._parse_or()
+        self._skip_whitespace()
+        if self.pos < len(self.query):
+            self._error("unexpected input")
+        return node
+
+    def _parse_or(self) -> Node:
+        operands = [self._parse_and()]
+        while self._accept_operator(Operator.OR):
+            operands.append(self._parse_and())
+        return self._combine(Operator.OR, operands)
+
+    def _parse_and(self) -> Node:
+        operands = [self._parse_not()]
+        while self._accept_operator(Operator.AND):
+            operands.append(self._parse_not())
+        return self._combine(Operator.AND, operands)
+
+    def _parse_not(self) -> Node:
+        if self._accept_operator(Operator.NOT):
+            return BoolExpression(Operator.NOT, (self._parse_not(),))
+
+        self._skip_whitespace()
+        if self.query.startswith("(", self.pos):
+            self.pos += 1
+            self.depth += 1
+            node = self._parse_or()
+            self._skip_whitespace()
+            if not self.query.startswith(")", self.pos):
+                self._error("missing closing parenthesis")
+            self.pos += 1
+            self.depth -= 1
+            return node
+
+        return self._parse_clause()
+
+    def _parse_clause(self) -> Clause:
+        match = FIELD_PATTERN.match(self.query, self.pos)
+        if not match:
+            self._error("expected a field = value clause")
+        self.pos = match.end()
+
+        end_pattern = NESTED_VALUE_END_PATTERN if self.depth else VALUE_END_PATTERN
+        if self.query.startswith("/", self.pos):
+            # A regexp ends at the first slash followed by a value terminator
+            end = self.query.find("/", self.pos + 1)
+            while end != -1 and not end_pattern.match(self.query, end + 1):
+                end = self.query.find("/", end + 1)
+            if end != -1:
+                return self._end_value(match.group(1), end + 1)
+
+        end_match = end_pattern.search(self.query, self.pos)
+        end = end_match.start() if end_match else len(self.query)
+        return self._end_value(match.group(1), end)
+
+    def _end_value(self, field: str, end: int) -> Clause:
+        value = self.query[self.pos : end].strip()
+        if not value:
+            self._error(f"missing value for field {field}")
+        self.pos = end
+        return Clause(field, value)
+
+    def _accept_operator(self, operator: str) -> bool:
+        self._skip_whitespace()
+        match = OPERATOR_PATTERN.match(self.query, self.pos)
+        if not match or match.group(1) != operator:
+            return False
+        self.pos = match.end()
+        return True
+
+    def _skip_whitespace(self) -> None:
+        while self.pos < len(self.query) and self.query[self.pos].isspace():
+            self.pos += 1
+
+    @staticmethod
+    def _combine(operator: str, operands: List[Node]) -> Node:
+        if len(operands) == 1:
+            return operands[0]
+        # (a AND b) AND c is the same as a AND b AND c
+        flattened: List[Node] = []
+        for operand in operands:
+            if isinstance(operand, BoolExpression) and operand.operator == operator:
+                flattened.extend(operand.operands)
+            else:
+                flattened.append(operand)
+        return BoolExpression(operator, tuple(flattened))
+
+    def _error(self, reason: str) -> NoReturn:
+        raise ValueError(
+            f"Invalid query format: {reason} at position {self.pos}: {self.query}"
+        )
+
+
+def parse_query(query_string: str) -> Node:
+    """Parse a query string into its syntax tree."""
+    return QueryParser(query_string.strip()).parse()
+
+
+def iter_clauses(node: Node) -> Iterator[Clause]:
+    """Yield every clause of a syntax tree, left to right."""
+    if isinstance(node, Clause):
+        yield node
+    else:
+        for operand in node.operands:
+            yield from iter_clauses(operand)
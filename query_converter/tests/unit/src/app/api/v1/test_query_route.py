@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from src.app.api.dependencies import get_converter_service
+from src.app.api.v1.query_route import router
+from src.app.schemas.query_schema import MAX_BATCH_QUERIES
+from src.app.services.converter_service import ConverterService, QueryType
+
+
+class TestQueryRoute:
+    def setup_method(self):
+        self.converter = ConverterService()
+        self.app = FastAPI()
+        self.app.include_router(router)
+        self.app.dependency_overrides[get_converter_service] = lambda: self.converter
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async def send() -> httpx.Response:
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                return await client.request(method, url, **kwargs)
+
+        return asyncio.run(send())
+
+    def test_convert(self):
+        response = self.request(
+            "POST", "/convert", json={"query": "Hostname = octoxlabs*"}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "query": {QueryType.PREFIX: {"Hostname": "octoxlabs"}},
+            "cost": 2,
+        }
+
+    def test_convert_rejects_invalid_characters(self):
+        response = self.request(
+            "POST", "/convert", json={"query": "Hostname = a; DROP"}
+        )
+
+        assert response.status_code == 422
+
+    def test_convert_malformed_query_is_bad_request(self):
+        response = self.request("POST", "/convert", json={"query": "Hostname = a AND"})
+
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Query conversion failed:")
+
+    def test_convert_batch_answers_every_query(self):
+        response = self.request(
+            "POST",
+            "/convert/batch",
+            json={
+                "queries": [
+                    "Hostname = octoxlabs*",
+                    "Hostname = a; DROP TABLE",
+                    "Hostname = a AND",
+                    "Ip = 10.0.0.1",
+                ]
+            },
+        )
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0] == {
+            "query": {QueryType.PREFIX: {"Hostname": "octoxlabs"}},
+            "cost": 2,
+        }
+        assert results[1] == {
+            "error": "Invalid query: Value error, Query contains invalid characters"
+        }
+        assert results[2]["error"].startswith("Query conversion failed:")
+        assert results[3] == {"query": {QueryType.TERM: {"Ip": "10.0.0.1"}}, "cost": 1}
+
+    def test_convert_batch_query_limit(self):
+        queries = [f"Hostname = host{i}" for i in range(MAX_BATCH_QUERIES)]
+
+        response = self.request("POST", "/convert/batch", json={"queries": queries})
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == MAX_BATCH_QUERIES
+
+        response = self.request(
+            "POST",
+            "/convert/batch",
+            json={"queries": queries + ["Hostname = one_more"]},
+        )
+        assert response.status_code == 422
+
+    def test_convert_batch_rejects_empty_list(self):
+        response = self.request("POST", "/convert/batch", json={"queries": []})
+
+        assert response.status_code == 422
+
+    def test_convert_stats_track_cache_hits(self):
+        for _ in range(2):
+            self.request("POST", "/convert", json={"query": "Hostname = octoxlabs*"})
+
+        response = self.request("GET", "/convert/stats")
+
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+        assert stats["evictions"] == 0
+        assert stats["max_entries"] == self.converter.cache.stats()["max_entries"]
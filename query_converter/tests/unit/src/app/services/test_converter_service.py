@@ -1,6 +1,10 @@
+import json
+
 import pytest
 
 from src.app.services.converter_service import ConverterService, QueryType
+from src.app.services.field_registry import FieldRegistry, SearchField
+from src.app.services.query_analyzer import QueryCost
 
 
 class TestConverterService:
@@ -8,14 +12,18 @@ class TestConverterService:
         self.converter = ConverterService()
 
     def test_convert_wildcard_query(self):
-        query = "Hostname = octoxlabs*"
-        expected = {QueryType.WILDCARD: {"Hostname": "octoxlabs*"}}
+        query = "Hostname = octo*labs"
+        expected = {QueryType.WILDCARD: {"Hostname": "octo*labs"}}
         result = self.converter.convert_query(query)
         assert result == expected
 
     def test_convert_regex_query(self):
         query = "Hostname = /octoxlabs./"
-        expected = {QueryType.REGEXP: {"Hostname": "octoxlabs."}}
+        expected = {
+            QueryType.REGEXP: {
+                "Hostname": {"value": "octoxlabs.", "max_determinized_states": 10000}
+            }
+        }
         result = self.converter.convert_query(query)
         assert result == expected
 
@@ -56,13 +64,289 @@ class TestConverterService:
         assert "Query string must be a non-empty string" in str(exc_info.value)
 
     def test_query_with_special_characters(self):
-        query = "IP = /192\.168\.1\./"
-        expected = {QueryType.REGEXP: {"IP": "192\.168\.1\.*"}}
+        # Without metacharacters a regexp is rewritten to a term query
+        query = r"IP = /192\.168\.1\./"
+        expected = {QueryType.TERM: {"IP": "192.168.1."}}
         result = self.converter.convert_query(query)
         assert result == expected
 
+    def test_escaped_character_class_stays_regexp(self):
+        result = self.converter.convert_query(r"Hostname = /host\d+/")
+        assert result[QueryType.REGEXP]["Hostname"]["value"] == r"host\d+"
+
     def test_query_with_multiple_wildcards(self):
         query = "Domain = *.example.*"
         expected = {QueryType.WILDCARD: {"Domain": "*.example.*"}}
         result = self.converter.convert_query(query)
         assert result == expected
+
+    def test_single_clause_unchanged_by_boolean_grammar(self):
+        query = "Hostname = octoxlabs ANDROID"
+        expected = {QueryType.TERM: {"Hostname": "octoxlabs ANDROID"}}
+        result = self.converter.convert_query(query)
+        assert result == expected
+
+    def test_convert_and_not_query(self):
+        query = "Hostname = octoxlabs* AND NOT IP = 10.0.0.1"
+        expected = {
+            QueryType.BOOL: {
+                "filter": [{QueryType.PREFIX: {"Hostname": "octoxlabs"}}],
+                "must_not": [{QueryType.TERM: {"IP": "10.0.0.1"}}],
+            }
+        }
+        result = self.converter.convert_query(query)
+        assert result == expected
+
+    def test_convert_or_query_in_filter_context(self):
+        query = "Hostname = a OR Hostname = b OR Hostname = c"
+        expected = {
+            QueryType.BOOL: {
+                "filter": [
+                    {
+                        QueryType.BOOL: {
+                            "should": [
+                                {QueryType.TERM: {"Hostname": "a"}},
+                                {QueryType.TERM: {"Hostname": "b"}},
+                                {QueryType.TERM: {"Hostname": "c"}},
+                            ],
+                            "minimum_should_match": 1,
+                        }
+                    }
+                ]
+            }
+        }
+        result = self.converter.convert_query(query)
+        assert result == expected
+
+    def test_parentheses_and_precedence(self):
+        query = (
+            "(Hostname = /web (a|b)/ OR IP = 10.*) AND Hostname = x AND NOT (IP = 1)"
+        )
+        expected = {
+            QueryType.BOOL: {
+                "filter": [
+                    {
+                        QueryType.BOOL: {
+                            "should": [
+                                {
+                                    QueryType.REGEXP: {
+                                        "Hostname": {
+                                            "value": "web (a|b)",
+                                            "max_determinized_states": 10000,
+                                        }
+                                    }
+                                },
+                                {QueryType.PREFIX: {"IP": "10."}},
+                            ],
+                            "minimum_should_match": 1,
+                        }
+                    },
+                    {QueryType.TERM: {"Hostname": "x"}},
+                ],
+                "must_not": [{QueryType.TERM: {"IP": "1"}}],
+            }
+        }
+        result = self.converter.convert_query(query)
+        assert result == expected
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "Hostname = a AND",
+            "Hostname = a AND (IP = b",
+            "Hostname = a AND IP",
+            "NOT",
+            "Hostname = a OR OR IP = b",
+        ],
+    )
+    def test_invalid_boolean_query(self, query):
+        with pytest.raises(ValueError) as exc_info:
+            self.converter.convert_query(query)
+        assert "Invalid query format" in str(exc_info.value)
+
+    def test_repeated_query_served_from_cache(self):
+        first = self.converter.convert_query("Hostname = octoxlabs*")
+        second = self.converter.convert_query("  Hostname = octoxlabs*")
+
+        assert second is first
+        assert self.converter.cache.stats() == {
+            "hits": 1,
+            "misses": 1,
+            "evictions": 0,
+            "entries": 1,
+            "max_entries": 1024,
+        }
+
+    def test_cache_evicts_least_recently_used(self):
+        converter = ConverterService(cache_size=2)
+        converter.convert_query("Hostname = a")
+        converter.convert_query("Hostname = b")
+        converter.convert_query("Hostname = a")
+        converter.convert_query("Hostname = c")
+
+        assert converter.cache.get("Hostname = a") is not None
+        assert converter.cache.get("Hostname = b") is None
+        assert converter.cache.stats()["evictions"] == 1
+
+    def test_invalid_queries_not_cached(self):
+        with pytest.raises(ValueError):
+            self.converter.convert_query("Hostname = a AND")
+
+        assert self.converter.cache.stats()["entries"] == 0
+
+    def test_cache_disabled(self):
+        converter = ConverterService(cache_size=0)
+        converter.convert_query("Hostname = a")
+
+        assert converter.convert_query("Hostname = a") == {
+            QueryType.TERM: {"Hostname": "a"}
+        }
+        assert converter.cache.stats()["entries"] == 0
+
+    @pytest.mark.parametrize(
+        "query, expected, cost",
+        [
+            ("Hostname = octoxlabs*", {QueryType.PREFIX: {"Hostname": "octoxlabs"}}, 2),
+            ("Hostname = octox**", {QueryType.PREFIX: {"Hostname": "octox"}}, 2),
+            ("Hostname = *", {QueryType.EXISTS: {"field": "Hostname"}}, 1),
+            ("Hostname = *labs", {QueryType.WILDCARD: {"Hostname": "*labs"}}, 25),
+            ("Hostname = oct*x*", {QueryType.WILDCARD: {"Hostname": "oct*x*"}}, 10),
+            ("IP = /10\\.0\\.0\\.1/", {QueryType.TERM: {"IP": "10.0.0.1"}}, 1),
+            ("Hostname = /octoxlabs/", {QueryType.TERM: {"Hostname": "octoxlabs"}}, 1),
+        ],
+    )
+    def test_rewrites_to_cheapest_query(self, query, expected, cost):
+        result = self.converter.convert(query)
+        assert result.query == expected
+        assert result.cost == cost
+
+    def test_regexp_cost_and_collapsed_match_any(self):
+        result = self.converter.convert("Hostname = /.*.*.*labs/")
+
+        assert result.query == {
+            QueryType.REGEXP: {
+                "Hostname": {"value": ".*labs", "max_determinized_states": 10000}
+            }
+        }
+        assert result.cost == QueryCost.UNBOUNDED_REGEXP
+
+    @pytest.mark.parametrize(
+        "query, expected",
+        [
+            # An escaped dot repeated, then one match-any
+            ("Hostname = /a\\.*.*b/", "a\\.*.*b"),
+            # An escaped backslash, then repeated match-any
+            ("Hostname = /a\\\\.*.*.*b/", "a\\\\.*b"),
+            ("Hostname = /a\\\\\\.*.*b/", "a\\\\\\.*.*b"),
+        ],
+    )
+    def test_escaped_regexp_characters_not_collapsed(self, query, expected):
+        result = self.converter.convert(query)
+
+        assert result.query[QueryType.REGEXP]["Hostname"]["value"] == expected
+
+    @pytest.mark.parametrize(
+        "query, expected",
+        [
+            # A literal star, then one or more wildcards
+            ("Hostname = a\\**", "a\\**"),
+            ("Hostname = a\\***", "a\\**"),
+        ],
+    )
+    def test_escaped_wildcards_not_collapsed(self, query, expected):
+        result = self.converter.convert(query)
+
+        assert result.query == {QueryType.WILDCARD: {"Hostname": expected}}
+
+    def test_compound_cost_is_sum_of_clauses(self):
+        result = self.converter.convert("Hostname = a* OR NOT Hostname = /web[0-9]+/")
+
+        assert result.cost == (
+            QueryCost.PREFIX + QueryCost.REGEXP + QueryCost.PER_REPETITION
+        )
+
+    def test_too_expensive_query_rejected(self):
+        converter = ConverterService(max_cost=50, max_determinized_states=500)
+
+        assert converter.convert("Hostname = /web.+/").query == {
+            QueryType.REGEXP: {
+                "Hostname": {"value": "web.+", "max_determinized_states": 500}
+            }
+        }
+        with pytest.raises(ValueError) as exc_info:
+            converter.convert_query("Hostname = *a OR Hostname = *b OR Hostname = *c")
+        assert "Query too expensive" in str(exc_info.value)
+
+
+class TestFieldRegistry:
+    mapping = {
+        "mappings": {
+            "properties": {
+                "Hostname": {"type": "keyword"},
+                "Ip": {"type": "ip"},
+                "Owner": {
+                    "type": "text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Description": {"type": "text"},
+                "Port": {"type": "integer"},
+            }
+        }
+    }
+
+    def setup_method(self):
+        self.registry = FieldRegistry.from_mapping(self.mapping)
+        self.converter = ConverterService(registry=self.registry)
+
+    def test_fields_from_mapping(self, tmp_path):
+        mapping_file = tmp_path / "search_fields.json"
+        mapping_file.write_text(json.dumps(self.mapping))
+        registry = FieldRegistry.from_file(str(mapping_file))
+
+        assert registry.names == ("Description", "Hostname", "Ip", "Owner", "Port")
+        assert registry.resolve("OWNER") == SearchField("Owner", "text", "Owner.raw")
+        assert FieldRegistry.from_mapping(self.mapping["mappings"]).resolve(
+            "ip"
+        ) == SearchField("Ip", "ip")
+
+    def test_canonical_field_names(self):
+        assert self.converter.convert_query("hostname = octoxlabs*") == {
+            QueryType.PREFIX: {"Hostname": "octoxlabs"}
+        }
+
+    def test_unknown_field_rejected(self):
+        with pytest.raises(ValueError) as exc_info:
+            self.converter.convert_query("Hostname = a AND Status = active")
+        assert "Invalid field name: status" in str(exc_info.value)
+        assert "Hostname" in str(exc_info.value)
+
+    @pytest.mark.parametrize(
+        "query, expected, cost",
+        [
+            ("Owner = alice", {QueryType.TERM: {"Owner.raw": "alice"}}, 1),
+            ("Owner = ali*", {QueryType.PREFIX: {"Owner.raw": "ali"}}, 2),
+            ("Owner = *", {QueryType.EXISTS: {"field": "Owner"}}, 1),
+            (
+                "Description = web server",
+                {QueryType.MATCH_PHRASE: {"Description": "web server"}},
+                2,
+            ),
+            ("Ip = 10.0.0.1", {QueryType.TERM: {"Ip": "10.0.0.1"}}, 1),
+            ("Ip = 10.0.*", {QueryType.TERM: {"Ip": "10.0.0.0/16"}}, 1),
+            ("Ip = 192.168.1.*", {QueryType.TERM: {"Ip": "192.168.1.0/24"}}, 1),
+            ("Port = 443", {QueryType.TERM: {"Port": "443"}}, 1),
+            ("Port = *", {QueryType.EXISTS: {"field": "Port"}}, 1),
+        ],
+    )
+    def test_query_depends_on_field_type(self, query, expected, cost):
+        result = self.converter.convert(query)
+        assert result.query == expected
+        assert result.cost == cost
+
+    @pytest.mark.parametrize(
+        "query", ["Ip = 10.*.0.1", "Ip = /10\\.0\\..*/", "Ip = 300.*", "Port = 44*"]
+    )
+    def test_unsupported_pattern_rejected(self, query):
+        with pytest.raises(ValueError) as exc_info:
+            self.converter.convert_query(query)
+        assert "does not support wildcard or regexp patterns" in str(exc_info.value)